@@ -0,0 +1,99 @@
+"""API endpoint for merging expert maps into a group map."""
+
+import asyncio
+import logging
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+
+from app.dependencies.catalog_dependencies import get_project_catalog
+from app.dependencies.job_dependencies import get_job_manager
+from app.services.aggregation_service import (
+    AggregationMethod,
+    AggregationService,
+    AlignBy,
+    MissingEdges,
+)
+from app.services.catalog_service import ProjectCatalog
+from app.services.jobs import Job, JobInfo, JobManager
+
+router = APIRouter(prefix="/aggregation", tags=["aggregation"])
+
+logger = logging.getLogger("app")
+
+
+class AggregationInput(BaseModel):
+    # Absolute, or relative to the projects directory.
+    path: str
+    weight: float = Field(1.0, gt=0.0, description="Weight of this expert's map")
+
+
+class AggregationRequest(BaseModel):
+    inputs: List[AggregationInput] = Field(..., min_length=2)
+    output_path: str
+    method: AggregationMethod = "mean"
+    align_by: AlignBy = "id"
+    missing: MissingEdges = Field(
+        "zero",
+        description="zero: an expert with both nodes but no edge rates it 0",
+    )
+    min_experts: int = Field(1, ge=1, description="Experts that must draw an edge")
+    top: int = Field(50, ge=0, le=10000, description="Most disputed edges reported")
+    overwrite: bool = False
+
+
+@router.post("", response_model=JobInfo, status_code=202)
+async def start_aggregation(
+    request: AggregationRequest,
+    catalog: ProjectCatalog = Depends(get_project_catalog),
+    jobs: JobManager = Depends(get_job_manager),
+):
+    """
+    Merge the maps of several experts into a new project file in a
+    background job (follow it under /jobs). The job's result lists the
+    experts and the most disputed edges; open the file to edit the map.
+    """
+    paths = [catalog.root / item.path for item in request.inputs]
+    output_path = catalog.root / request.output_path
+    missing = [str(path) for path in paths if not path.is_file()]
+    if missing:
+        raise HTTPException(
+            status_code=404, detail=f"File not found: {', '.join(missing)}"
+        )
+    if output_path.exists() and not request.overwrite:
+        raise HTTPException(
+            status_code=409, detail=f"File already exists: {output_path}"
+        )
+    if output_path in paths:
+        raise HTTPException(
+            status_code=400, detail="The output must not be one of the inputs"
+        )
+
+    async def run(job: Job) -> dict:
+        def on_progress(done: int, total: int) -> None:
+            job.check_cancelled()
+            job.report(done / total, f"Read {done}/{total} maps")
+
+        result = await asyncio.to_thread(
+            AggregationService.aggregate,
+            [str(path) for path in paths],
+            [item.weight for item in request.inputs],
+            output_path,
+            request.method,
+            request.align_by,
+            request.missing,
+            request.min_experts,
+            request.top,
+            on_progress=on_progress,
+        )
+        return result.model_dump()
+
+    job = jobs.start("aggregation", run)
+    logger.info(
+        "Started aggregation job %s of %s maps into %s",
+        job.id,
+        len(paths),
+        output_path,
+    )
+    return job.info()
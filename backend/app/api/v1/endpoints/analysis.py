@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app.api.v1.responses import model_response
+from app.dependencies.cognitive_map_dependencies import get_cognitive_map_store
+from app.storage.cognitive_map_store import CognitiveMapStore
+from app.services.analysis_service import (
+    AnalysisService,
+    EffectsResponse,
+    PathsResponse,
+)
+
+router = APIRouter(prefix="/analysis", tags=["analysis"])
+
+logger = logging.getLogger("app")
+
+
+@router.get("/effects", response_model=EffectsResponse)
+async def get_effects(
+    source: Optional[str] = None,
+    target: Optional[str] = None,
+    use_confidence: bool = False,
+    max_order: int = Query(6, ge=1, le=50),
+    limit: int = Query(50, ge=1, le=10000),
+    store: CognitiveMapStore = Depends(get_cognitive_map_store),
+):
+    """
+    Direct, indirect and total effects between nodes, strongest first.
+
+    With source and/or target only the effects of/on those nodes are listed.
+    """
+    try:
+        cognitive_map, interned = await store.map_and_graph()
+        analysis = AnalysisService.prepare(cognitive_map, use_confidence, interned)
+        result = await asyncio.to_thread(
+            AnalysisService.effects, analysis, source, target, max_order, limit
+        )
+        return model_response(result)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to compute effects: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/paths", response_model=PathsResponse)
+async def get_paths(
+    source: str,
+    target: str,
+    k: int = Query(5, ge=1, le=100),
+    max_length: int = Query(6, ge=1, le=20),
+    use_confidence: bool = False,
+    store: CognitiveMapStore = Depends(get_cognitive_map_store),
+):
+    """Strongest influence paths from source to target."""
+    try:
+        cognitive_map, interned = await store.map_and_graph()
+        analysis = AnalysisService.prepare(cognitive_map, use_confidence, interned)
+        result = await asyncio.to_thread(
+            AnalysisService.strongest_paths, analysis, source, target, k, max_length
+        )
+        return model_response(result)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to find influence paths: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,138 @@
+"""API endpoint for fitting edge weights to observed time series."""
+
+import asyncio
+import logging
+from typing import Dict, Literal, Optional
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from pydantic import TypeAdapter
+
+from app.dependencies.cognitive_map_dependencies import get_cognitive_map_store
+from app.dependencies.job_dependencies import get_job_manager
+from app.services.calibration_service import CalibrationService
+from app.services.jobs import Job, JobInfo, JobManager
+from app.storage.cognitive_map_store import CognitiveMapStore, MapConflictError
+
+router = APIRouter(prefix="/calibration", tags=["calibration"])
+
+logger = logging.getLogger("app")
+
+_mapping_adapter = TypeAdapter(Dict[str, str])
+
+
+@router.post("", response_model=JobInfo, status_code=202)
+async def start_calibration(
+    file: UploadFile = File(..., description="One row per time step"),
+    mapping: Optional[str] = Form(
+        None, description='JSON object of CSV column -> node id, e.g. {"GDP": "n1"}'
+    ),
+    sequence_column: Optional[str] = Form(None),
+    activation_type: Optional[Literal["sigmoid", "tanh"]] = Form(
+        None, description="The map's activation if omitted"
+    ),
+    use_confidence: bool = Form(False),
+    learning_rate: float = Form(0.05, gt=0.0, le=1.0),
+    max_epochs: int = Form(5000, ge=1, le=100000),
+    patience: int = Form(200, ge=1),
+    validation_fraction: float = Form(0.2, ge=0.0, lt=1.0),
+    seed: int = Form(0),
+    apply: bool = Form(True, description="Write the fitted weights to the map"),
+    store: CognitiveMapStore = Depends(get_cognitive_map_store),
+    jobs: JobManager = Depends(get_job_manager),
+):
+    """
+    Fit the map's edge weights to an uploaded CSV time series in a
+    background job (follow it under /jobs; progress events carry the
+    losses). The fitted weights are written as one change, so a single undo
+    restores the previous ones; they are not written if the map was edited
+    or another project opened meanwhile. The job's result reports the fit
+    per edge.
+    """
+    try:
+        data = await file.read()
+        cognitive_map, interned = await store.map_and_graph()
+        # The weights are fitted to this version of the map and only written
+        # over it.
+        project, base_hash = store.path, store.current_hash
+        columns = _mapping_adapter.validate_json(mapping) if mapping else None
+        series = await asyncio.to_thread(
+            CalibrationService.parse_csv,
+            data,
+            cognitive_map,
+            columns,
+            sequence_column,
+        )
+        problem = CalibrationService.prepare(
+            cognitive_map,
+            series,
+            activation_type or cognitive_map.fcm.activation.type,
+            use_confidence,
+            interned,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to prepare calibration: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    every = max(1, max_epochs // 200)
+
+    async def run(job: Job) -> dict:
+        def on_progress(
+            epoch: int, total: int, loss: float, validation_loss: Optional[float]
+        ) -> None:
+            job.check_cancelled()
+            if epoch % every == 0:
+                data = {
+                    "epoch": epoch,
+                    "loss": loss,
+                    "validation_loss": validation_loss,
+                }
+                job.report(epoch / total, f"Epoch {epoch}/{total}", data)
+
+        result = await asyncio.to_thread(
+            CalibrationService.fit,
+            problem,
+            learning_rate,
+            max_epochs,
+            patience,
+            validation_fraction,
+            seed,
+            on_progress,
+        )
+        if apply and result.fitted_edges:
+            # The fit is still reported when it is not applied.
+            message = None
+            current = await store.get()
+            if store.path != project:
+                message = (
+                    f"Another project was opened while the calibration ran "
+                    f"({store.path}), weights not applied"
+                )
+            else:
+                try:
+                    await store.put(
+                        CalibrationService.apply(current, result), base_hash
+                    )
+                    result.applied = True
+                    result.map_hash = store.current_hash
+                except MapConflictError:
+                    message = (
+                        "The map was edited while the calibration ran, "
+                        "weights not applied"
+                    )
+            if message is not None:
+                logger.warning("Calibration job %s: %s", job.id, message)
+                job.report(1.0, message)
+        logger.info(
+            "Calibrated %s edges in %s epochs, loss %.3g -> %.3g, applied=%s",
+            result.fitted_edges,
+            result.epochs,
+            result.loss_before,
+            result.loss_after,
+            result.applied,
+        )
+        return result.model_dump()
+
+    job = jobs.start("calibration", run)
+    return job.info()
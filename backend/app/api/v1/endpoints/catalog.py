@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app.api.v1.responses import model_response
+from app.dependencies.catalog_dependencies import get_project_catalog
+from app.services.catalog_service import CatalogPage, ProjectCatalog, SortKey
+
+router = APIRouter(prefix="/catalog", tags=["catalog"])
+
+logger = logging.getLogger("app")
+
+
+@router.get("", response_model=CatalogPage)
+async def list_projects(
+    sort: SortKey = "mtime",
+    descending: bool = True,
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    catalog: ProjectCatalog = Depends(get_project_catalog),
+):
+    """Project files in the projects directory, most recently modified first."""
+    try:
+        await asyncio.to_thread(catalog.refresh)
+        page = catalog.query(
+            sort=sort, descending=descending, limit=limit, offset=offset
+        )
+        return model_response(page)
+    except Exception as e:
+        logger.error("Failed to list projects: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/search", response_model=CatalogPage)
+async def search_projects(
+    q: Optional[str] = None,
+    min_nodes: Optional[int] = Query(None, ge=0),
+    max_nodes: Optional[int] = Query(None, ge=0),
+    has_results: Optional[bool] = None,
+    sort: SortKey = "name",
+    descending: bool = False,
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    catalog: ProjectCatalog = Depends(get_project_catalog),
+):
+    """Projects whose file name or path contains q, filtered by size and runs."""
+    try:
+        await asyncio.to_thread(catalog.refresh)
+        page = catalog.query(
+            q=q,
+            min_nodes=min_nodes,
+            max_nodes=max_nodes,
+            has_results=has_results,
+            sort=sort,
+            descending=descending,
+            limit=limit,
+            offset=offset,
+        )
+        return model_response(page)
+    except Exception as e:
+        logger.error("Failed to search projects: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,46 @@
+"""WebSocket feed of map changes."""
+
+import asyncio
+import logging
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from app.dependencies.cognitive_map_dependencies import get_cognitive_map_store
+
+router = APIRouter(prefix="/changes", tags=["changes"])
+
+logger = logging.getLogger("app")
+
+
+@router.websocket("")
+async def change_feed(websocket: WebSocket):
+    """
+    Push versioned change events of the current map.
+
+    The first message is {"type": "hello", "version", "hash"}. After it the
+    client fetches the map and applies "delta" events (changed nodes, edges
+    and scenarios) in version order; on a "resync" event or a version gap it
+    fetches the whole map again.
+    """
+    store = get_cognitive_map_store()
+    await websocket.accept()
+    queue, hello = await store.subscribe_changes()
+
+    async def forward():
+        while True:
+            await websocket.send_text(await queue.get())
+
+    sender = None
+    try:
+        await websocket.send_text(hello)
+        sender = asyncio.create_task(forward())
+        while True:
+            # Clients do not send anything; this only notices disconnects.
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if sender is not None:
+            sender.cancel()
+        store.unsubscribe_changes(queue)
@@ -0,0 +1,76 @@
+import logging
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.dependencies.cognitive_map_dependencies import get_cognitive_map_store
+from app.storage.cognitive_map_store import CognitiveMapStore
+from app.services.export_service import (
+    EXTENSIONS,
+    MEDIA_TYPES,
+    ExportFormat,
+    ExportService,
+)
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+logger = logging.getLogger("app")
+
+
+async def _export(
+    store: CognitiveMapStore,
+    kind: Literal["final", "history"],
+    scenario_ids: Optional[List[str]],
+    export_format: ExportFormat,
+) -> StreamingResponse:
+    try:
+        cognitive_map = await store.get()
+        plan = ExportService.plan(cognitive_map, kind, scenario_ids)
+        chunks = ExportService.stream(plan, export_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to export scenarios: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    logger.info(
+        "Exporting %s of %s scenarios as %s",
+        kind,
+        len(plan.scenario_ids),
+        export_format,
+    )
+    filename = f"scenarios_{kind}.{EXTENSIONS[export_format]}"
+    # A sync iterator is consumed in the threadpool, so simulating and
+    # encoding chunks does not block the event loop.
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/final-states")
+async def export_final_states(
+    scenario_ids: Optional[List[str]] = Query(None),
+    format: ExportFormat = "csv",
+    store: CognitiveMapStore = Depends(get_cognitive_map_store),
+):
+    """
+    Stored final states of the scenarios (all if scenario_ids is omitted) as
+    rows of scenario_id, iteration, node_id, state. Scenarios that were never
+    run have no rows.
+    """
+    return await _export(store, "final", scenario_ids, format)
+
+
+@router.get("/history")
+async def export_history(
+    scenario_ids: Optional[List[str]] = Query(None),
+    format: ExportFormat = "csv",
+    store: CognitiveMapStore = Depends(get_cognitive_map_store),
+):
+    """
+    Full iteration history of the scenarios, simulated on the current map
+    and streamed as it is computed (iteration 0 is the initial state).
+    """
+    return await _export(store, "history", scenario_ids, format)
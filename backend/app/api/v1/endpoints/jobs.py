@@ -0,0 +1,55 @@
+"""API endpoints for background jobs."""
+
+import json
+import logging
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.dependencies.job_dependencies import get_job_manager
+from app.services.jobs import Job, JobInfo, JobManager
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+logger = logging.getLogger("app")
+
+
+def _job_or_404(jobs: JobManager, job_id: str) -> Job:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
+
+
+@router.get("", response_model=List[JobInfo])
+async def list_jobs(jobs: JobManager = Depends(get_job_manager)):
+    """Running and recently finished jobs, oldest first."""
+    return jobs.list()
+
+
+@router.get("/{job_id}", response_model=JobInfo)
+async def get_job(job_id: str, jobs: JobManager = Depends(get_job_manager)):
+    return _job_or_404(jobs, job_id).info()
+
+
+@router.get("/{job_id}/events")
+async def follow_job(job_id: str, jobs: JobManager = Depends(get_job_manager)):
+    """
+    Newline-delimited JSON: the job's status, then {"type": "progress",
+    "progress", "message"?, "data"?} events, ending with the final
+    {"type": "status", ...} when the job finishes.
+    """
+    job = _job_or_404(jobs, job_id)
+
+    async def lines():
+        async for event in job.events():
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.delete("/{job_id}", response_model=JobInfo)
+async def cancel_job(job_id: str, jobs: JobManager = Depends(get_job_manager)):
+    """Cancel a running job; finished jobs are returned unchanged."""
+    _job_or_404(jobs, job_id)
+    return jobs.cancel(job_id).info()
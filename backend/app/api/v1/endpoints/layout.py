@@ -0,0 +1,102 @@
+"""API endpoint for server-side graph layout."""
+
+import asyncio
+import logging
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+
+from app.dependencies.cognitive_map_dependencies import get_cognitive_map_store
+from app.dependencies.job_dependencies import get_job_manager
+from app.storage.cognitive_map_store import CognitiveMapStore
+from app.services.jobs import Job, JobInfo, JobManager
+from app.services.layout_service import (
+    BARYCENTER_SWEEPS,
+    LayoutAlgorithm,
+    LayoutResult,
+    LayoutService,
+)
+
+router = APIRouter(prefix="/layout", tags=["layout"])
+
+logger = logging.getLogger("app")
+
+
+class LayoutRequest(BaseModel):
+    algorithm: LayoutAlgorithm = "force"
+    iterations: int = Field(200, ge=1, le=5000, description="Force-directed iterations")
+    spacing: float = Field(
+        120.0, gt=0.0, description="Ideal distance between neighbouring nodes"
+    )
+    seed: int = 0
+    stream_every: Optional[int] = Field(
+        None,
+        ge=1,
+        description="Send intermediate positions with every n-th progress event",
+    )
+
+
+@router.post("", response_model=JobInfo, status_code=202)
+async def start_layout(
+    request: LayoutRequest,
+    store: CognitiveMapStore = Depends(get_cognitive_map_store),
+    jobs: JobManager = Depends(get_job_manager),
+):
+    """
+    Lay out the current map in a background job (follow it under /jobs).
+
+    The new positions are written as one change, so a single undo restores
+    the previous layout. Nodes added while the job ran keep their positions;
+    if another project was opened meanwhile, the job fails without applying.
+    """
+    try:
+        # prepare() copies the positions and edges out of the live map before
+        # the next await.
+        cognitive_map, interned = await store.map_and_graph()
+        project = store.path
+        graph = LayoutService.prepare(cognitive_map, interned)
+    except Exception as e:
+        logger.error("Failed to prepare layout: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    steps = request.iterations if request.algorithm == "force" else BARYCENTER_SWEEPS
+
+    async def run(job: Job) -> dict:
+        def on_step(step: int, xy) -> None:
+            job.check_cancelled()
+            data = None
+            if request.stream_every and (
+                step % request.stream_every == 0 or step == steps
+            ):
+                data = {"step": step, "positions": LayoutService.positions(graph, xy)}
+            job.report(step / steps, f"{request.algorithm} step {step}/{steps}", data)
+
+        if request.algorithm == "hierarchical":
+            compute = LayoutService.hierarchical
+            args = (graph, request.spacing, steps, on_step)
+        else:
+            compute = LayoutService.force_directed
+            args = (graph, steps, request.spacing, request.seed, on_step)
+        xy = await asyncio.to_thread(compute, *args)
+
+        positions = dict(zip(graph.node_ids, xy.round(2).tolist()))
+        current = await store.get()
+        if store.path != project:
+            raise ValueError(
+                f"Another project was opened while the layout ran ({store.path}), "
+                "positions not applied"
+            )
+        # Applied to the map as it is now, so edits made during the run stay.
+        # The put fails with a conflict if the map changes while it waits for
+        # the store lock.
+        await store.put(LayoutService.apply(current, positions), store.current_hash)
+        logger.info("Applied %s layout to %s nodes", request.algorithm, len(positions))
+        return LayoutResult(
+            algorithm=request.algorithm,
+            nodes=len(positions),
+            steps=steps,
+            map_hash=store.current_hash,
+        ).model_dump()
+
+    job = jobs.start("layout", run)
+    return job.info()
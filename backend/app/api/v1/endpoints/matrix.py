@@ -5,8 +5,9 @@ from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
 
+from app.api.v1.responses import map_response
 from app.dependencies.cognitive_map_dependencies import get_cognitive_map_store
-from app.storage.cognitive_map_store import CognitiveMapStore
+from app.storage.cognitive_map_store import CognitiveMapStore, MapConflictError
 from app.services.matrix_service import MatrixService
 
 router = APIRouter(prefix="/matrix", tags=["matrix"])
@@ -36,11 +37,11 @@ async def get_matrix(store: CognitiveMapStore = Depends(get_cognitive_map_store)
         }
     """
     try:
-        cognitive_map = await store.get()
-        matrix_data = MatrixService.build_matrix(cognitive_map)
+        cognitive_map, interned = await store.map_and_graph()
+        matrix_data = MatrixService.build_matrix(cognitive_map, interned)
         return matrix_data
     except Exception as e:
-        logger.error(f"Failed to build matrix: {e}")
+        logger.error("Failed to build matrix: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -63,12 +64,14 @@ async def update_matrix_cell(
             confidence=request.confidence,
         )
 
-        result = await store.put(updated_map)
+        await store.put(updated_map)
 
-        return result
+        return map_response(store)
+    except MapConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
-        logger.error(f"Invalid matrix cell update: {e}")
+        logger.error("Invalid matrix cell update: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Failed to update matrix cell: {e}")
+        logger.error("Failed to update matrix cell: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
@@ -15,9 +15,9 @@ async def get_metrics(
     store: CognitiveMapStore = Depends(get_cognitive_map_store),
 ) -> MetricsResponse:
     try:
-        cognitive_map = await store.get()
-        metrics_response = MetricsService.calculate_metrics(cognitive_map)
+        cognitive_map, interned = await store.map_and_graph()
+        metrics_response = MetricsService.calculate_metrics(cognitive_map, interned)
         return metrics_response
     except Exception as e:
-        logger.error(f"Failed to calculate metrics: {e}")
+        logger.error("Failed to calculate metrics: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
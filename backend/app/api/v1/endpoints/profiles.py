@@ -0,0 +1,54 @@
+"""API endpoints for request profiles recorded by ProfilingMiddleware."""
+
+import asyncio
+import math
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse
+
+from core.instrumentation import REQUEST_DURATION
+from core.profiling import list_profiles, profile_file
+
+router = APIRouter(prefix="/profiles", tags=["profiles"])
+
+
+def slowest_routes(limit: int) -> list[dict]:
+    routes = []
+    for (method, route, status), child in REQUEST_DURATION.children():
+        count = child.count
+        if not count:
+            continue
+        p95 = child.quantile(0.95)
+        routes.append(
+            {
+                "method": method,
+                "route": route,
+                "status": int(status),
+                "count": count,
+                "mean_seconds": round(child.sum / count, 6),
+                "p95_seconds_upper_bound": None if math.isinf(p95) else p95,
+            }
+        )
+    routes.sort(key=lambda r: r["mean_seconds"], reverse=True)
+    return routes[:limit]
+
+
+@router.get("")
+async def get_profiles(limit: int = Query(20, ge=1, le=200)):
+    """
+    Returns:
+        {
+            "profiles": recent profiles, newest first, with their top functions,
+            "slowest_routes": routes ordered by mean latency since startup
+        }
+    """
+    profiles = await asyncio.to_thread(list_profiles, limit)
+    return {"profiles": profiles, "slowest_routes": slowest_routes(limit)}
+
+
+@router.get("/{name}")
+async def download_profile(name: str):
+    """Download a saved profile in pstats format (open with snakeviz/pstats)."""
+    path = profile_file(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile '{name}' not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
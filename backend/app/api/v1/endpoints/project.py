@@ -1,11 +1,15 @@
 import logging
 from pathlib import Path
-from fastapi import APIRouter, Depends
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, Request
 from fastapi import HTTPException
-from pydantic import BaseModel
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from app.api.v1.responses import map_response, model_response
 from app.dependencies.cognitive_map_dependencies import get_cognitive_map_store
 from app.models.cognitive_map_models import CognitiveMapModel
-from app.storage.cognitive_map_store import CognitiveMapStore
+from app.services.viewport_service import ViewportResponse, ViewportService
+from app.storage.cognitive_map_store import CognitiveMapStore, MapConflictError
 
 router = APIRouter(prefix="/project", tags=["project"])
 
@@ -18,27 +22,94 @@ class FilePathRequest(BaseModel):
 
 @router.get("/map", response_model=CognitiveMapModel)
 async def get_map(store: CognitiveMapStore = Depends(get_cognitive_map_store)):
-    return await store.get()
+    await store.get()
+    return map_response(store)
+
+
+@router.get("/viewport", response_model=ViewportResponse)
+async def get_viewport(
+    min_x: float,
+    min_y: float,
+    max_x: float,
+    max_y: float,
+    limit: int = Query(5000, ge=1, le=100000),
+    cluster_size: Optional[float] = Query(None, gt=0),
+    store: CognitiveMapStore = Depends(get_cognitive_map_store),
+):
+    """
+    Nodes inside a bounding box in layout coordinates, the edges touching
+    them and the positions of their endpoints outside the box. With
+    cluster_size the nodes are summarized per grid cell instead.
+    """
+    try:
+        index = await store.spatial_index()
+        viewport = ViewportService.query(
+            index, min_x, min_y, max_x, max_y, limit, cluster_size
+        )
+        return model_response(viewport)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.put("/map", response_model=CognitiveMapModel)
+# The body is validated from raw bytes instead of through FastAPI's
+# json.loads + model_validate, which roughly halves the cost for large maps.
+@router.put(
+    "/map",
+    response_model=CognitiveMapModel,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"$ref": "#/components/schemas/CognitiveMapModel"}
+                }
+            },
+        }
+    },
+)
 async def put_map(
-    m: CognitiveMapModel, store: CognitiveMapStore = Depends(get_cognitive_map_store)
+    request: Request, store: CognitiveMapStore = Depends(get_cognitive_map_store)
 ):
     try:
-        return await store.put(m)
+        m = CognitiveMapModel.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(
+            [
+                {**error, "loc": ("body", *error["loc"])}
+                for error in e.errors(include_url=False)
+            ]
+        )
+
+    # If-Match carries the ETag of the map the client edited; the write is
+    # rejected with 409 if the map has changed since.
+    if_match = request.headers.get("if-match")
+    expected_hash = if_match.removeprefix("W/").strip('"') if if_match else None
+
+    try:
+        await store.put(m, expected_hash=expected_hash)
+        return map_response(store)
+    except MapConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/undo", response_model=CognitiveMapModel)
 async def undo(store: CognitiveMapStore = Depends(get_cognitive_map_store)):
-    return await store.undo()
+    try:
+        await store.undo()
+    except MapConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return map_response(store)
 
 
 @router.post("/redo", response_model=CognitiveMapModel)
 async def redo(store: CognitiveMapStore = Depends(get_cognitive_map_store)):
-    return await store.redo()
+    try:
+        await store.redo()
+    except MapConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return map_response(store)
 
 
 @router.get("/history")
@@ -60,9 +131,9 @@ async def new_project(
     try:
         file_path = Path(request.file_path)
         await store.create_new_at_path(file_path)
-        return await store.get()
+        return map_response(store)
     except Exception as e:
-        logger.error(f"Failed to create new project at {request.file_path}: {e}")
+        logger.error("Failed to create new project at %s: %s", request.file_path, e)
         raise HTTPException(status_code=400, detail=str(e))
 
 
@@ -74,17 +145,17 @@ async def open_project(
     try:
         file_path = Path(request.file_path)
         await store.load_from_path(file_path)
-        return await store.get()
+        return map_response(store)
     except FileNotFoundError as e:
-        logger.error(f"File not found: {request.file_path}")
+        logger.error("File not found: %s", request.file_path)
         raise HTTPException(
             status_code=404, detail=f"File not found: {request.file_path}"
         )
     except ValueError as e:
-        logger.error(f"Invalid cognitive map format in {request.file_path}: {e}")
+        logger.error("Invalid cognitive map format in %s: %s", request.file_path, e)
         raise HTTPException(status_code=400, detail=f"Invalid file format: {str(e)}")
     except Exception as e:
-        logger.error(f"Failed to open project from {request.file_path}: {e}")
+        logger.error("Failed to open project from %s: %s", request.file_path, e)
         raise HTTPException(status_code=400, detail=str(e))
 
 
@@ -96,7 +167,7 @@ async def save_as_project(
     try:
         file_path = Path(request.file_path)
         await store.save_as(file_path)
-        return await store.get()
+        return map_response(store)
     except Exception as e:
-        logger.error(f"Failed to save project as {request.file_path}: {e}")
+        logger.error("Failed to save project as %s: %s", request.file_path, e)
         raise HTTPException(status_code=400, detail=str(e))
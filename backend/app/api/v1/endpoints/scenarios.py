@@ -1,22 +1,61 @@
+import asyncio
 import logging
 import uuid
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
 
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel, Field
+
+from app.api.v1.disconnect import cancel_on_disconnect
+from app.api.v1.responses import model_response
 from app.dependencies.cognitive_map_dependencies import get_cognitive_map_store
+from app.dependencies.job_dependencies import get_job_manager
+from app.dependencies.simulation_cache_dependencies import get_simulation_cache
 from app.models.cognitive_map_models import (
+    CognitiveMapModel,
     ScenarioModel,
     ScenarioParams,
     ScenarioResult,
 )
-from app.storage.cognitive_map_store import CognitiveMapStore
-from app.services.scenario_service import ScenarioService
+from app.storage.cognitive_map_store import CognitiveMapStore, MapConflictError
+from app.storage.interned_graph import InternedGraph
+from app.services.analysis_service import AnalysisService, ConvergencePrediction
+from app.services.comparison_service import ComparisonService, ScenarioComparison
+from app.services.intervention_service import InterventionService
+from app.services.jobs import Job, JobInfo, JobManager
+from app.services.scenario_service import RunBudget, ScenarioService
+from app.services.sensitivity_service import SensitivityResponse, SensitivityService
+from app.services.simulation_cache import SimulationCache, SimulationRequest
 
 router = APIRouter(prefix="/scenarios", tags=["scenarios"])
 
 logger = logging.getLogger("app")
 
 
+class ScenarioCompareRequest(BaseModel):
+    # All scenarios if omitted; scenarios without a result are reported in
+    # missing_results.
+    scenario_ids: Optional[List[str]] = None
+    baseline_id: Optional[str] = None
+    top: int = Field(default=20, ge=1, le=1000)
+    include_matrices: bool = True
+
+
+class InterventionSearchRequest(BaseModel):
+    control_node_ids: List[str] = Field(..., min_length=1)
+    # All nodes with a preferred_state if omitted.
+    goal_node_ids: Optional[List[str]] = Field(None, min_length=1)
+    budget: Optional[float] = Field(
+        None, gt=0.0, description="Maximum total absolute change of the controls"
+    )
+    population: int = Field(64, ge=2, le=1024, description="Candidates per restart")
+    restarts: int = Field(4, ge=1, le=32)
+    generations: int = Field(30, ge=1, le=500)
+    top: int = Field(5, ge=1, le=50)
+    seed: int = 0
+
+
 @router.get("/", response_model=list[ScenarioModel])
 async def get_scenarios(store: CognitiveMapStore = Depends(get_cognitive_map_store)):
     """Get all scenarios."""
@@ -67,13 +106,54 @@ async def create_scenario(
         # Save
         await store.put(cognitive_map)
 
-        logger.info(f"Created scenario: {scenario_id} - {params.name}")
+        logger.info("Created scenario: %s - %s", scenario_id, params.name)
 
         return new_scenario
+    except MapConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to create scenario: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/compare", response_model=ScenarioComparison)
+async def compare_scenarios(
+    request: ScenarioCompareRequest,
+    store: CognitiveMapStore = Depends(get_cognitive_map_store),
+):
+    """
+    Compare the stored results of several scenarios against a baseline:
+    final states, deltas and rank changes per node, the most divergent nodes
+    and agreement with the nodes' preferred states.
+    """
+    try:
+        cognitive_map = await store.get()
+        # Endpoints edit the map in place; compare a snapshot of the lists.
+        snapshot = cognitive_map.model_copy(
+            update={
+                "nodes": list(cognitive_map.nodes),
+                "fcm": cognitive_map.fcm.model_copy(
+                    update={"scenarios": list(cognitive_map.fcm.scenarios)}
+                ),
+            }
+        )
+        comparison = await asyncio.to_thread(
+            ComparisonService.compare,
+            snapshot,
+            request.scenario_ids,
+            request.baseline_id,
+            request.top,
+            request.include_matrices,
+        )
+        return model_response(comparison)
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Failed to create scenario: {e}")
+        logger.error("Failed to compare scenarios: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -107,15 +187,17 @@ async def update_scenario(
         # Save
         await store.put(cognitive_map)
 
-        logger.info(f"Updated scenario: {scenario_id}")
+        logger.info("Updated scenario: %s", scenario_id)
 
         return scenario
     except HTTPException:
         raise
+    except MapConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Failed to update scenario: {e}")
+        logger.error("Failed to update scenario: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -145,66 +227,345 @@ async def delete_scenario(
         # Save
         await store.put(cognitive_map)
 
-        logger.info(f"Deleted scenario: {scenario_id}")
+        logger.info("Deleted scenario: %s", scenario_id)
 
         return {"ok": True}
     except HTTPException:
         raise
+    except MapConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to delete scenario: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _find_scenario(cognitive_map: CognitiveMapModel, scenario_id: str) -> ScenarioModel:
+    for scenario in cognitive_map.fcm.scenarios:
+        if scenario.id == scenario_id:
+            return scenario
+
+    raise HTTPException(status_code=404, detail=f"Scenario '{scenario_id}' not found")
+
+
+async def _predict_convergence(
+    cognitive_map: CognitiveMapModel,
+    interned: InternedGraph,
+    params: ScenarioParams,
+) -> ConvergencePrediction:
+    ScenarioService.validate_initial_states(
+        params.initial_states, interned.index, cognitive_map.fcm.state_range
+    )
+    analysis = AnalysisService.prepare(cognitive_map, params.use_confidence, interned)
+    return await asyncio.to_thread(
+        AnalysisService.predict_convergence,
+        analysis,
+        params.model_copy(deep=True),
+        cognitive_map.fcm.activation.lambda_,
+        cognitive_map.fcm.state_range,
+    )
+
+
+async def _capped_params(
+    cognitive_map: CognitiveMapModel,
+    interned: InternedGraph,
+    scenario: ScenarioModel,
+    auto_cap: bool,
+) -> ScenarioParams:
+    """The scenario's params, with the predicted iteration cap if auto_cap."""
+    params = scenario.params
+    if not auto_cap or params.iteration_mode != "auto":
+        return params
+    prediction = await _predict_convergence(cognitive_map, interned, params)
+    if prediction.warning:
+        logger.warning("Scenario %s: %s", scenario.id, prediction.warning)
+    return params.model_copy(
+        update={"max_iterations": prediction.suggested_max_iterations}
+    )
+
+
+async def _save_result(
+    store: CognitiveMapStore,
+    scenario_id: str,
+    params: ScenarioParams,
+    result: ScenarioResult,
+) -> None:
+    # The map may have been replaced while the simulation ran; attach the
+    # result to the scenario in the current one.
+    cognitive_map = await store.get()
+    scenario = next(
+        (s for s in cognitive_map.fcm.scenarios if s.id == scenario_id), None
+    )
+    if scenario is None:
+        return
+    # A result computed for parameters the scenario no longer has is stale.
+    ignored = {"name", "description"}
+    if scenario.params.model_dump(exclude=ignored) != params.model_dump(
+        exclude=ignored
+    ):
+        logger.info(
+            "Scenario %s was edited while it ran, result not saved", scenario_id
+        )
+        return
+
+    # Create a copy of result without history
+    scenario.result = ScenarioResult(
+        final_states=result.final_states,
+        iterations_count=result.iterations_count,
+        converged=result.converged,
+        truncated=result.truncated,
+        timestamp=result.timestamp,
+        history=None,  # Don't save history to JSON
+    )
+    scenario.updated_at = datetime.utcnow().isoformat() + "Z"
+
+    await store.put(cognitive_map)
+
+    logger.info(
+        "Simulation completed for scenario: %s, iterations=%s, converged=%s, "
+        "truncated=%s, history_length=%s",
+        scenario_id,
+        result.iterations_count,
+        result.converged,
+        bool(result.truncated),
+        len(result.history) if result.history else 0,
+    )
+
+
+@router.get("/{scenario_id}/convergence", response_model=ConvergencePrediction)
+async def predict_convergence(
+    scenario_id: str,
+    store: CognitiveMapStore = Depends(get_cognitive_map_store),
+):
+    """
+    Predict from the weight structure whether the scenario converges in auto
+    mode and about how many iterations it needs, without running it.
+    """
+    try:
+        cognitive_map, interned = await store.map_and_graph()
+        scenario = _find_scenario(cognitive_map, scenario_id)
+        prediction = await _predict_convergence(
+            cognitive_map, interned, scenario.params
+        )
+        return model_response(prediction)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Failed to delete scenario: {e}")
+        logger.error("Failed to predict scenario convergence: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/{scenario_id}/sensitivity", response_model=SensitivityResponse)
+async def get_sensitivity(
+    scenario_id: str,
+    request: Request,
+    node_ids: Optional[List[str]] = Query(None),
+    k: int = Query(5, ge=1, le=1000, description="Edges reported per node"),
+    include_matrix: bool = False,
+    time_budget: Optional[float] = Query(
+        None,
+        gt=0,
+        le=3600,
+        description="Seconds after which the derivatives so far are returned",
+    ),
+    store: CognitiveMapStore = Depends(get_cognitive_map_store),
+):
+    """
+    Derivatives of the scenario's final states with respect to the edge
+    weights, from one tangent-linear run: the k most influential edges per
+    node (all nodes unless node_ids is given), optionally with the matrix.
+
+    The run has the same time budget as a simulation (the server default if
+    not given) and stops when the client disconnects.
+    """
+    budget = RunBudget(time_budget)
+    try:
+        cognitive_map, interned = await store.map_and_graph()
+        scenario = _find_scenario(cognitive_map, scenario_id)
+        problem = SensitivityService.prepare(cognitive_map, scenario.params, interned)
+        result = await cancel_on_disconnect(
+            request,
+            asyncio.to_thread(
+                SensitivityService.sensitivity,
+                problem,
+                node_ids,
+                k,
+                include_matrix,
+                budget,
+            ),
+        )
+        return model_response(result)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to compute scenario sensitivity: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Stops the worker thread when the client went away.
+        budget.cancel()
+
+
 @router.post("/{scenario_id}/run", response_model=ScenarioResult)
 async def run_scenario(
     scenario_id: str,
+    request: Request,
+    time_budget: Optional[float] = Query(
+        None,
+        gt=0,
+        le=3600,
+        description="Seconds after which the best state so far is returned",
+    ),
+    auto_cap: bool = Query(
+        False,
+        description="In auto mode, cap the iterations at the predicted count",
+    ),
     store: CognitiveMapStore = Depends(get_cognitive_map_store),
+    cache: SimulationCache = Depends(get_simulation_cache),
 ):
-    """Run simulation for a scenario with full iteration history."""
+    """
+    Run simulation for a scenario with full iteration history.
+
+    Results are reused while the nodes, edges, FCM settings and scenario
+    parameters are unchanged. A run that exceeds its time budget (the
+    server default if not given) returns its last state with truncated set;
+    a client that disconnects stops the run.
+    """
     try:
-        cognitive_map = await store.get()
-
-        # Find scenario
-        scenario_index = None
-        for idx, scenario in enumerate(cognitive_map.fcm.scenarios):
-            if scenario.id == scenario_id:
-                scenario_index = idx
-                break
+        cognitive_map, interned = await store.map_and_graph()
+        scenario = _find_scenario(cognitive_map, scenario_id)
+        # update_scenario replaces scenario.params on this live model, so the
+        # params this run is for are taken before the first await.
+        requested = scenario.params
+        params = await _capped_params(cognitive_map, interned, scenario, auto_cap)
+
+        logger.info("Running simulation for scenario: %s", scenario_id)
+        simulation = SimulationRequest(
+            cognitive_map, params, interned, RunBudget(time_budget)
+        )
+        result = await cancel_on_disconnect(request, cache.run(simulation))
 
-        if scenario_index is None:
-            raise HTTPException(
-                status_code=404, detail=f"Scenario '{scenario_id}' not found"
-            )
+        await _save_result(store, scenario_id, requested, result)
 
-        scenario = cognitive_map.fcm.scenarios[scenario_index]
+        return model_response(result)
+    except HTTPException:
+        raise
+    except MapConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to run scenario simulation: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
 
-        logger.info(f"Running simulation for scenario: {scenario_id}")
-        result = ScenarioService.run_simulation(cognitive_map, scenario.params)
 
-        # Create a copy of result without history
-        result_to_save = ScenarioResult(
-            final_states=result.final_states,
-            iterations_count=result.iterations_count,
-            converged=result.converged,
-            timestamp=result.timestamp,
-            history=None,  # Don't save history to JSON
+@router.post("/{scenario_id}/run-job", response_model=JobInfo, status_code=202)
+async def start_scenario_run(
+    scenario_id: str,
+    time_budget: Optional[float] = Query(None, gt=0, le=3600),
+    auto_cap: bool = False,
+    store: CognitiveMapStore = Depends(get_cognitive_map_store),
+    cache: SimulationCache = Depends(get_simulation_cache),
+    jobs: JobManager = Depends(get_job_manager),
+):
+    """
+    Run a scenario in a background job (follow it under /jobs). Progress is
+    reported in iterations; cancelling the job stops the run. The job's
+    result is the scenario result without history.
+    """
+    try:
+        # The live map, edited in place by other requests: the params are
+        # taken before the first await and SimulationRequest copies the
+        # inputs before the job starts.
+        cognitive_map, interned = await store.map_and_graph()
+        scenario = _find_scenario(cognitive_map, scenario_id)
+        requested = scenario.params
+        params = await _capped_params(cognitive_map, interned, scenario, auto_cap)
+        simulation = SimulationRequest(
+            cognitive_map, params, interned, RunBudget(time_budget)
         )
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to prepare scenario run: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
 
-        scenario.result = result_to_save
-        scenario.updated_at = datetime.utcnow().isoformat() + "Z"
+    async def run(job: Job) -> dict:
+        def on_progress(done: int, total: int) -> None:
+            job.report(done / total, f"{done}/{total} iterations")
 
-        await store.put(cognitive_map)
+        simulation.budget.on_progress = on_progress
+        result = await cache.run(simulation)
+        await _save_result(store, scenario_id, requested, result)
+        return result.model_dump(exclude={"history"})
+
+    job = jobs.start("scenario", run)
+    logger.info("Started scenario run job %s for scenario %s", job.id, scenario_id)
+    return job.info()
 
-        logger.info(
-            f"Simulation completed for scenario: {scenario_id}, "
-            f"iterations={result.iterations_count}, converged={result.converged}, history_length={len(result.history) if result.history else 0}"
-        )
 
-        return result
+@router.post("/{scenario_id}/interventions", response_model=JobInfo, status_code=202)
+async def start_intervention_search(
+    scenario_id: str,
+    request: InterventionSearchRequest,
+    store: CognitiveMapStore = Depends(get_cognitive_map_store),
+    jobs: JobManager = Depends(get_job_manager),
+):
+    """
+    Search initial states of the control nodes that push the goal nodes in
+    their preferred directions, starting from this scenario, in a background
+    job (follow it under /jobs). The job's result ranks the interventions
+    found; each one's params can be saved as a new scenario.
+    """
+    try:
+        cognitive_map, interned = await store.map_and_graph()
+        scenario = _find_scenario(cognitive_map, scenario_id)
+        problem = InterventionService.prepare(
+            cognitive_map,
+            scenario.params,
+            request.control_node_ids,
+            request.goal_node_ids,
+            request.budget,
+            interned,
+        )
     except HTTPException:
         raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Failed to run scenario simulation: {e}")
+        logger.error("Failed to prepare intervention search: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
+
+    async def run(job: Job) -> dict:
+        def on_progress(done: int, total: int) -> None:
+            job.check_cancelled()
+            job.report(done / total, f"Generation {done}/{total}")
+
+        result = await asyncio.to_thread(
+            InterventionService.search,
+            problem,
+            request.population,
+            request.restarts,
+            request.generations,
+            request.top,
+            request.seed,
+            on_progress,
+        )
+        logger.info(
+            "Intervention search for scenario %s: %s evaluations, best "
+            "improvement %s",
+            scenario_id,
+            result.evaluations,
+            result.interventions[0].improvement if result.interventions else None,
+        )
+        return result.model_dump()
+
+    job = jobs.start("interventions", run)
+    logger.info(
+        "Started intervention search job %s for scenario %s", job.id, scenario_id
+    )
+    return job.info()
@@ -0,0 +1,26 @@
+"""Responses that skip FastAPI's jsonable_encoder + json.dumps round trip."""
+
+from fastapi import Response
+from pydantic import BaseModel
+
+from app.storage.cognitive_map_store import CognitiveMapStore
+
+
+class RawJSONResponse(Response):
+    media_type = "application/json"
+
+
+def model_response(model: BaseModel) -> RawJSONResponse:
+    """Serialize a pydantic model to bytes with pydantic-core."""
+    return RawJSONResponse(content=model.model_dump_json(by_alias=True))
+
+
+def map_response(store: CognitiveMapStore) -> RawJSONResponse:
+    """
+    Current map of the store, served from its per-version cache. The ETag is
+    the map hash; send it back as If-Match to make a write conditional.
+    """
+    return RawJSONResponse(
+        content=store.serialized_current(),
+        headers={"ETag": f'"{store.current_hash}"'},
+    )
@@ -1,6 +1,20 @@
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import project, matrix, metrics, scenarios
+from app.api.v1.endpoints import (
+    project,
+    matrix,
+    metrics,
+    scenarios,
+    profiles,
+    changes,
+    analysis,
+    export,
+    catalog,
+    jobs,
+    layout,
+    aggregation,
+    calibration,
+)
 
 api_router = APIRouter()
 
@@ -8,3 +22,12 @@ api_router.include_router(project.router)
 api_router.include_router(matrix.router)
 api_router.include_router(metrics.router)
 api_router.include_router(scenarios.router)
+api_router.include_router(profiles.router)
+api_router.include_router(changes.router)
+api_router.include_router(analysis.router)
+api_router.include_router(export.router)
+api_router.include_router(catalog.router)
+api_router.include_router(jobs.router)
+api_router.include_router(layout.router)
+api_router.include_router(aggregation.router)
+api_router.include_router(calibration.router)
@@ -0,0 +1,15 @@
+from typing import Optional
+from app.services.catalog_service import ProjectCatalog
+
+_project_catalog: Optional[ProjectCatalog] = None
+
+
+def get_project_catalog() -> ProjectCatalog:
+    if _project_catalog is None:
+        raise RuntimeError("ProjectCatalog not initialized")
+    return _project_catalog
+
+
+def set_project_catalog(catalog: ProjectCatalog):
+    global _project_catalog
+    _project_catalog = catalog
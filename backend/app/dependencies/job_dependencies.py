@@ -0,0 +1,15 @@
+from typing import Optional
+from app.services.jobs import JobManager
+
+_job_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    if _job_manager is None:
+        raise RuntimeError("JobManager not initialized")
+    return _job_manager
+
+
+def set_job_manager(manager: JobManager):
+    global _job_manager
+    _job_manager = manager
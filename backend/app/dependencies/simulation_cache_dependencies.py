@@ -0,0 +1,15 @@
+from typing import Optional
+from app.services.simulation_cache import SimulationCache
+
+_simulation_cache: Optional[SimulationCache] = None
+
+
+def get_simulation_cache() -> SimulationCache:
+    if _simulation_cache is None:
+        raise RuntimeError("SimulationCache not initialized")
+    return _simulation_cache
+
+
+def set_simulation_cache(cache: SimulationCache):
+    global _simulation_cache
+    _simulation_cache = cache
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 import json
@@ -6,14 +7,23 @@ import sys
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.api.v1.router import api_router
+from app.services.catalog_service import ProjectCatalog
+from app.services.jobs import JobManager
+from app.services.simulation_cache import SimulationCache
 from app.storage.cognitive_map_store import CognitiveMapStore
+from app.storage.sqlite_store import SQLiteCognitiveMapStore
+from core.instrumentation import REGISTRY, RequestMetricsMiddleware
 from core.logging_config import setup_logging
+from core.profiling import ProfilingMiddleware
 from app.dependencies.cognitive_map_dependencies import (
     set_cognitive_map_store,
     get_cognitive_map_store,
 )
+from app.dependencies.catalog_dependencies import set_project_catalog
+from app.dependencies.job_dependencies import get_job_manager, set_job_manager
+from app.dependencies.simulation_cache_dependencies import set_simulation_cache
 from app.dependencies.session_data_dependencies import (
     set_session_file_path,
     update_session_data,
@@ -22,26 +32,42 @@ from app.dependencies.session_data_dependencies import (
 setup_logging()
 logger = logging.getLogger("app")
 
+# "file" keeps the map in this process and the project JSON file; "sqlite"
+# keeps it in a database shared by all worker processes (BACKEND_WORKERS).
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "file")
+# Defaults to cognitive_maps.sqlite3 in the projects directory.
+STORAGE_SQLITE_PATH = os.getenv("STORAGE_SQLITE_PATH")
+BACKEND_WORKERS = int(os.getenv("BACKEND_WORKERS", "1"))
+
+# "loading" until the project opened at startup is in the store, then
+# "ready"; "error" if it could not be loaded (until a project is opened or
+# created through the API).
+startup_state: dict = {"status": "loading", "detail": None}
+
 
 def load_session_data(session_path: str) -> dict:
     try:
         with open(session_path, "r", encoding="utf-8") as f:
             return json.load(f)
     except FileNotFoundError:
-        logger.error(f"Session file not found at {session_path}")
+        logger.error("Session file not found at %s", session_path)
         return {}
     except json.JSONDecodeError as e:
-        logger.error(f"Error decoding JSON from {session_path}: {e}")
+        logger.error("Error decoding JSON from %s: %s", session_path, e)
         return {}
 
 
 def save_session_data(session_path: str, data: dict) -> bool:
+    # Workers of one server stop together, so each writes its own temporary
+    # file and replaces the session file in one step.
+    tmp_path = f"{session_path}.{os.getpid()}.tmp"
     try:
-        with open(session_path, "w", encoding="utf-8") as f:
+        with open(tmp_path, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, session_path)
         return True
     except Exception as e:
-        logger.error(f"Error saving session data to {session_path}: {e}")
+        logger.error("Error saving session data to %s: %s", session_path, e)
         return False
 
 
@@ -59,12 +85,12 @@ def get_default_projects_dir() -> Path:
 
     try:
         projects_dir.mkdir(parents=True, exist_ok=True)
-        logger.info(f"Projects directory: {projects_dir}")
+        logger.info("Projects directory: %s", projects_dir)
     except Exception as e:
-        logger.error(f"Failed to create projects directory {projects_dir}: {e}")
+        logger.error("Failed to create projects directory %s: %s", projects_dir, e)
         projects_dir = Path.cwd() / "projects"
         projects_dir.mkdir(parents=True, exist_ok=True)
-        logger.warning(f"Using fallback projects directory: {projects_dir}")
+        logger.warning("Using fallback projects directory: %s", projects_dir)
 
     return projects_dir
 
@@ -75,10 +101,27 @@ def get_default_project_path() -> Path:
     return default_file
 
 
+async def load_startup_project(store: CognitiveMapStore) -> None:
+    try:
+        await store.load()
+    except Exception as e:
+        startup_state.update(status="error", detail=str(e))
+        raise
+    startup_state.update(status="ready", detail=None)
+    logger.info("Project loaded, backend ready: %s", store.path)
+
+
+async def load_startup_project_in_background(store: CognitiveMapStore) -> None:
+    try:
+        await load_startup_project(store)
+    except Exception as e:
+        logger.error("Failed to load project %s: %s", store.path, e)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     session_file_path = os.getenv("SESSION_FILE_PATH")
-    logger.info(f"Using config filepath: {session_file_path}")
+    logger.info("Using config filepath: %s", session_file_path)
 
     if not session_file_path:
         logger.info("Warning: SESSION_FILE_PATH not set, using default")
@@ -89,38 +132,77 @@ async def lifespan(app: FastAPI):
 
     if last_opened:
         project_path = Path(last_opened)
-        logger.info(f"Last opened file: {project_path}")
+        logger.info("Last opened file: %s", project_path)
         if not project_path.exists():
-            logger.warning(f"Last opened file not found: {project_path}")
+            logger.warning("Last opened file not found: %s", project_path)
             project_path = get_default_project_path()
-            logger.info(f"Using default project path: {project_path}")
+            logger.info("Using default project path: %s", project_path)
     else:
         project_path = get_default_project_path()
-        logger.info(f"No last opened file, using default: {project_path}")
+        logger.info("No last opened file, using default: %s", project_path)
 
     try:
-        cognitive_map_store = CognitiveMapStore(path=project_path, history_limit=20)
-        logger.info(f"CognitiveMapStore initialized with path: {project_path}")
+        if STORAGE_BACKEND == "sqlite":
+            db_path = (
+                Path(STORAGE_SQLITE_PATH)
+                if STORAGE_SQLITE_PATH
+                else get_default_projects_dir() / "cognitive_maps.sqlite3"
+            )
+            cognitive_map_store = SQLiteCognitiveMapStore(
+                path=project_path, db_path=db_path, history_limit=20
+            )
+            logger.info("SQLite store initialized with database: %s", db_path)
+        else:
+            cognitive_map_store = CognitiveMapStore(path=project_path, history_limit=20)
+        logger.info("CognitiveMapStore initialized with path: %s", project_path)
     except Exception as e:
-        logger.error(f"Failed to initialize CognitiveMapStore: {e}")
+        logger.error("Failed to initialize CognitiveMapStore: %s", e)
         raise
 
-    await cognitive_map_store.load()
     set_cognitive_map_store(cognitive_map_store)
+    set_simulation_cache(SimulationCache.from_env())
+    set_project_catalog(ProjectCatalog(get_default_projects_dir()))
+    set_job_manager(JobManager())
     set_session_file_path(session_file_path)
     update_session_data(session_data)
 
+    # With background loading the server starts answering "/" right away and
+    # reports progress on "/ready"; API requests wait on the store lock until
+    # the project is in memory.
+    load_task = None
+    if os.getenv("BACKEND_BACKGROUND_LOAD", "1") != "0":
+        load_task = asyncio.create_task(
+            load_startup_project_in_background(cognitive_map_store)
+        )
+    else:
+        await load_startup_project(cognitive_map_store)
+
     yield
 
+    if load_task is not None:
+        await load_task
+
+    # Running jobs would otherwise write to the store after it was saved.
+    await get_job_manager().shutdown()
+
     print("Shutting down gracefully...")
 
     cognitive_map_store = get_cognitive_map_store()
 
-    try:
-        await cognitive_map_store.save_to_file()
-        logger.info("Cognitive map store saved successfully")
-    except Exception as e:
-        logger.error(f"Failed to save cognitive map store: {e}")
+    if not cognitive_map_store.loaded:
+        # Saving now would overwrite the project file with an empty map.
+        logger.warning("Project was not loaded, skipping save on shutdown")
+    else:
+        try:
+            if await cognitive_map_store.save_on_shutdown():
+                logger.info("Cognitive map store saved successfully")
+            else:
+                logger.info("Project file was already saved by another worker")
+        except Exception as e:
+            logger.error("Failed to save cognitive map store: %s", e)
+
+    if isinstance(cognitive_map_store, SQLiteCognitiveMapStore):
+        cognitive_map_store.close()
 
     if session_file_path:
         current_opened_file = cognitive_map_store.path.resolve()
@@ -136,6 +218,21 @@ async def lifespan(app: FastAPI):
     print("Shutdown complete")
 
 
+def profile_context(scope: dict) -> dict:
+    """Map identity and scenario parameters recorded with request profiles."""
+    store = get_cognitive_map_store()
+    context = {
+        "map_hash": store.current_hash,
+        "nodes": len(store.current.nodes),
+        "edges": len(store.current.edges),
+    }
+    scenario_id = scope.get("path_params", {}).get("scenario_id")
+    for scenario in store.current.fcm.scenarios:
+        if scenario.id == scenario_id:
+            context["scenario_params"] = scenario.params.model_dump()
+    return context
+
+
 app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
@@ -145,6 +242,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestMetricsMiddleware)
+app.add_middleware(ProfilingMiddleware, context=profile_context)
 
 count = 0
 
@@ -155,6 +254,22 @@ def health_check():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def readiness_check():
+    if startup_state["status"] == "error" and get_cognitive_map_store().loaded:
+        startup_state.update(status="ready", detail=None)
+    if startup_state["status"] == "ready":
+        return {"status": "ready"}
+    return JSONResponse(status_code=503, content=startup_state)
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.get("/api/count")
 def read_count():
     global count
@@ -168,6 +283,17 @@ app.include_router(
 )
 
 if __name__ == "__main__":
+    import uvicorn
+
     host = os.getenv("BACKEND_HOST", "0.0.0.0")
     port = int(os.getenv("BACKEND_PORT", "8001"))
-    uvicorn.run(app, host=host, port=port)
+    if BACKEND_WORKERS > 1 and STORAGE_BACKEND == "sqlite":
+        # Workers import the app themselves, so it is passed by name.
+        uvicorn.run("app.main:app", host=host, port=port, workers=BACKEND_WORKERS)
+    else:
+        if BACKEND_WORKERS > 1:
+            logger.warning(
+                "BACKEND_WORKERS=%s needs STORAGE_BACKEND=sqlite, using one worker",
+                BACKEND_WORKERS,
+            )
+        uvicorn.run(app, host=host, port=port)
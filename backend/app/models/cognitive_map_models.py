@@ -1,6 +1,15 @@
 from __future__ import annotations
 from typing import List, Optional, Tuple, Literal, Dict
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, SerializationInfo, field_serializer
+
+
+def _sorted_when_canonical(value: Dict[str, float], info: SerializationInfo):
+    # Map hashes are taken with context={"canonical": True}: node-keyed dicts
+    # then serialize in key order, so equal maps hash equally whatever order
+    # their states were inserted in. Responses and files keep insertion order.
+    if info.context and info.context.get("canonical"):
+        return dict(sorted(value.items()))
+    return value
 
 
 class NodeUIModel(BaseModel):
@@ -44,6 +53,10 @@ class ScenarioParams(BaseModel):
     convergence_threshold: Optional[float] = Field(default=0.001, gt=0.0)
     initial_states: Dict[str, float] = Field(default_factory=dict)
 
+    _serialize_initial_states = field_serializer("initial_states")(
+        _sorted_when_canonical
+    )
+
 
 class ScenarioResult(BaseModel):
     model_config = ConfigDict(extra="forbid")
@@ -51,11 +64,18 @@ class ScenarioResult(BaseModel):
     iterations_count: int
     converged: bool
     timestamp: str
+    truncated: Optional[bool] = Field(
+        default=None,
+        description="True if the run stopped at its time budget before "
+        "max_iterations; final_states is then the last state computed",
+    )
     history: Optional[List[Dict[str, float]]] = Field(
         default=None,
         description="State history for each iteration (not persisted to JSON)",
     )
 
+    _serialize_final_states = field_serializer("final_states")(_sorted_when_canonical)
+
 
 class ScenarioModel(BaseModel):
     model_config = ConfigDict(extra="forbid")
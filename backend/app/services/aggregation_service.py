@@ -0,0 +1,461 @@
+"""
+Group maps: one consensus cognitive map from the maps of several experts.
+
+Each input file is parsed and reduced to integer edge arrays right away, so
+at most a few parsed maps are in memory at a time; with more than one
+worker the files are parsed in parallel processes. Nodes are aligned across
+maps by id or by label (trimmed, case-insensitive; nodes sharing a label in
+one map are merged).
+
+The weights the experts gave a node pair form one column of an experts x
+pairs matrix, built in blocks of pairs. An expert whose map has both nodes
+but no edge between them rates the pair 0 (unless missing="skip"). The
+consensus weight of a pair is the weighted mean or weighted median of its
+column, with the experts' input weights, or the "credibility" mean: each
+expert's weight is divided by 1 + its mean absolute distance from the
+weighted mean over the pairs it rated, so outlying experts count less. The
+consensus confidence is the weighted mean of the confidences experts stated.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Literal, Optional, Sequence
+
+from pydantic import BaseModel, TypeAdapter
+
+from app.models.cognitive_map_models import (
+    CognitiveMapModel,
+    EdgeModel,
+    FCMModel,
+    NodeModel,
+)
+from app.storage.cognitive_map_store import read_map_file
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger("app")
+
+AlignBy = Literal["id", "label"]
+AggregationMethod = Literal["mean", "median", "credibility"]
+MissingEdges = Literal["zero", "skip"]
+
+# Processes parsing input files; 1 parses them one by one in the caller.
+AGGREGATION_WORKERS = int(
+    os.getenv("AGGREGATION_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+
+# Inputs smaller than this in total are parsed in-process: starting worker
+# processes takes longer.
+PARALLEL_MIN_BYTES = 32 * 1024 * 1024
+
+# Expert x pair cells per block of the consensus step, to bound temporary arrays.
+BLOCK_ELEMENTS = 1 << 22
+
+# Called with (files merged, total files); it may raise to stop.
+ProgressCallback = Callable[[int, int], None]
+
+_edges_adapter = TypeAdapter(List[EdgeModel])
+
+
+class ExpertSummary(BaseModel):
+    path: str
+    nodes: int
+    edges: int
+    weight: float
+    # Weight used for the consensus (the input weight unless "credibility").
+    credibility: float
+
+
+class EdgeDisagreement(BaseModel):
+    source: str
+    target: str
+    weight: float
+    # Experts that rated the pair, including implicit zeros.
+    support: int
+    std: float
+    min: float
+    max: float
+    # Share of the raters whose weight has the sign of the consensus.
+    sign_agreement: float
+
+
+class AggregationResult(BaseModel):
+    path: str
+    method: AggregationMethod
+    align_by: AlignBy
+    nodes: int
+    edges: int
+    experts: List[ExpertSummary]
+    # Kept edges with the largest spread of weights, most disputed first.
+    disagreements: List[EdgeDisagreement]
+
+
+@dataclass
+class _ExpertMap:
+    """One input map reduced to what aggregation needs."""
+
+    path: str
+    fcm: FCMModel
+    keys: List[str]
+    # First node of each key, in key order, and its position.
+    nodes: List[NodeModel]
+    xy: np.ndarray
+    # Edges between key positions, one per pair (the last edge wins).
+    source: np.ndarray
+    target: np.ndarray
+    weight: np.ndarray
+    # NaN where unset.
+    confidence: np.ndarray
+    n_edges: int
+
+
+def _node_key(node: NodeModel, align_by: AlignBy) -> str:
+    if align_by == "label" and node.label.strip():
+        return "label:" + node.label.strip().casefold()
+    return "id:" + node.id
+
+
+def _read_expert(path: str, align_by: AlignBy) -> _ExpertMap:
+    """Parse one input file; runs in a worker process."""
+    try:
+        model = read_map_file(Path(path))
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Cannot read {path}: {e}") from None
+
+    keys: List[str] = []
+    nodes: List[NodeModel] = []
+    position: Dict[str, int] = {}
+    node_position: Dict[str, int] = {}
+    for node in model.nodes:
+        key = _node_key(node, align_by)
+        if key not in position:
+            position[key] = len(keys)
+            keys.append(key)
+            nodes.append(node)
+        node_position[node.id] = position[key]
+
+    pairs: Dict[tuple, tuple] = {}
+    for edge in model.edges:
+        s = node_position.get(edge.source)
+        t = node_position.get(edge.target)
+        if s is not None and t is not None:
+            pairs[(s, t)] = (edge.weight, edge.confidence)
+
+    m = len(pairs)
+    return _ExpertMap(
+        path=path,
+        fcm=model.fcm.model_copy(update={"scenarios": []}),
+        keys=keys,
+        nodes=nodes,
+        xy=np.array(
+            [(node.ui.x, node.ui.y) for node in nodes], dtype=np.float64
+        ).reshape(-1, 2),
+        source=np.fromiter((p[0] for p in pairs), dtype=np.int64, count=m),
+        target=np.fromiter((p[1] for p in pairs), dtype=np.int64, count=m),
+        weight=np.fromiter((v[0] for v in pairs.values()), dtype=np.float64, count=m),
+        confidence=np.fromiter(
+            (np.nan if v[1] is None else v[1] for v in pairs.values()),
+            dtype=np.float64,
+            count=m,
+        ),
+        n_edges=len(model.edges),
+    )
+
+
+def _read_all(
+    paths: Sequence[str], align_by: AlignBy, workers: int
+) -> Iterator[_ExpertMap]:
+    """The inputs in order, with at most 2·workers files in flight."""
+    if (
+        workers <= 1
+        or len(paths) <= 1
+        or sum(os.path.getsize(path) for path in paths) < PARALLEL_MIN_BYTES
+    ):
+        for path in paths:
+            yield _read_expert(path, align_by)
+        return
+
+    # Not forked: the server process runs threads.
+    pool = ProcessPoolExecutor(
+        min(workers, len(paths)), mp_context=multiprocessing.get_context("spawn")
+    )
+    try:
+        queued = iter(paths)
+        pending = deque(
+            pool.submit(_read_expert, path, align_by)
+            for _, path in zip(range(2 * workers), queued)
+        )
+        while pending:
+            expert = pending.popleft().result()
+            path = next(queued, None)
+            if path is not None:
+                pending.append(pool.submit(_read_expert, path, align_by))
+            yield expert
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _weighted_median(values: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Lower weighted median of every column; NaN marks missing values."""
+    order = np.argsort(np.where(np.isnan(values), np.inf, values), axis=0)
+    ordered = np.take_along_axis(values, order, axis=0)
+    cumulative = np.cumsum(np.take_along_axis(weights, order, axis=0), axis=0)
+    half = cumulative[-1] / 2
+    first = np.argmax(cumulative >= half, axis=0)
+    return ordered[first, np.arange(values.shape[1])]
+
+
+class AggregationService:
+    """Service for merging expert maps into a consensus map."""
+
+    @staticmethod
+    def aggregate(
+        paths: Sequence[str],
+        weights: Sequence[float],
+        output_path: Path,
+        method: AggregationMethod = "mean",
+        align_by: AlignBy = "id",
+        missing: MissingEdges = "zero",
+        min_experts: int = 1,
+        top: int = 50,
+        workers: int = AGGREGATION_WORKERS,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> AggregationResult:
+        """
+        Build the consensus map of the maps in `paths` and write it to
+        `output_path`. Layout positions are averaged over the maps that have
+        the node; the FCM settings are those of the first map.
+
+        Args:
+            weights: Weight of each expert, in the order of paths
+            min_experts: Experts that must have drawn an edge for it to be
+                kept
+            top: Number of most disputed pairs reported
+
+        Raises:
+            ValueError: If an input cannot be read
+        """
+        key_index: Dict[str, int] = {}
+        nodes: List[NodeModel] = []
+        members: List[tuple] = []
+        coo: List[tuple] = []
+        experts: List[ExpertSummary] = []
+        fcm: Optional[FCMModel] = None
+
+        for number, expert in enumerate(_read_all(paths, align_by, workers)):
+            fcm = fcm or expert.fcm
+            global_ids = np.fromiter(
+                (key_index.setdefault(key, len(key_index)) for key in expert.keys),
+                dtype=np.int64,
+                count=len(expert.keys),
+            )
+            # Keys are unique per map, so new ones come in increasing order.
+            new = np.flatnonzero(global_ids >= len(nodes)).tolist()
+            nodes.extend(expert.nodes[i] for i in new)
+
+            members.append((global_ids, expert.xy))
+            coo.append(
+                (
+                    global_ids[expert.source],
+                    global_ids[expert.target],
+                    expert.weight,
+                    expert.confidence,
+                    np.full(len(expert.weight), number, dtype=np.int64),
+                )
+            )
+            experts.append(
+                ExpertSummary(
+                    path=expert.path,
+                    nodes=len(expert.keys),
+                    edges=expert.n_edges,
+                    weight=weights[number],
+                    credibility=weights[number],
+                )
+            )
+            if on_progress is not None:
+                on_progress(number + 1, len(paths))
+
+        n_experts = len(experts)
+        k = len(nodes)
+        if coo:
+            source, target, weight, confidence, expert_of = (
+                np.concatenate(column) for column in zip(*coo)
+            )
+        else:
+            source = target = expert_of = np.empty(0, dtype=np.int64)
+            weight = confidence = np.empty(0)
+        membership = np.zeros((n_experts, k), dtype=bool)
+        for number, (global_ids, _) in enumerate(members):
+            membership[number, global_ids] = True
+
+        pair_ids, inverse = np.unique(source * max(k, 1) + target, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        inverse, expert_of = inverse[order], expert_of[order]
+        weight, confidence = weight[order], confidence[order]
+        pair_source, pair_target = pair_ids // max(k, 1), pair_ids % max(k, 1)
+        n_pairs = len(pair_ids)
+        block = max(1, BLOCK_ELEMENTS // max(n_experts, 1))
+
+        def blocks() -> Iterator[tuple]:
+            """(pair slice, expert x pair weights, confidences, explicit mask)."""
+            for begin in range(0, n_pairs, block):
+                end = min(begin + block, n_pairs)
+                lo, hi = np.searchsorted(inverse, [begin, end])
+                values = np.full((n_experts, end - begin), np.nan)
+                stated = np.full((n_experts, end - begin), np.nan)
+                values[expert_of[lo:hi], inverse[lo:hi] - begin] = weight[lo:hi]
+                stated[expert_of[lo:hi], inverse[lo:hi] - begin] = confidence[lo:hi]
+                explicit = ~np.isnan(values)
+                if missing == "zero":
+                    both = (
+                        membership[:, pair_source[begin:end]]
+                        & membership[:, pair_target[begin:end]]
+                    )
+                    values[both & ~explicit] = 0.0
+                yield slice(begin, end), values, stated, explicit
+
+        expert_weight = np.asarray(weights[:n_experts], dtype=np.float64)
+        if method == "credibility" and n_pairs:
+            distance = np.zeros(n_experts)
+            rated = np.zeros(n_experts)
+            for _, values, _, _ in blocks():
+                mask = ~np.isnan(values)
+                w = expert_weight[:, None] * mask
+                mean = np.nansum(values * w, axis=0) / w.sum(axis=0)
+                distance += np.nansum(np.abs(values - mean), axis=1)
+                rated += mask.sum(axis=1)
+            expert_weight = expert_weight / (1.0 + distance / np.maximum(rated, 1))
+            for summary, credibility in zip(experts, expert_weight.tolist()):
+                summary.credibility = credibility
+
+        consensus = np.zeros(n_pairs)
+        consensus_confidence = np.full(n_pairs, np.nan)
+        support = np.zeros(n_pairs, dtype=np.int64)
+        drawn = np.zeros(n_pairs, dtype=np.int64)
+        spread = np.zeros(n_pairs)
+        low = np.zeros(n_pairs)
+        high = np.zeros(n_pairs)
+        agreement = np.zeros(n_pairs)
+        for pairs, values, stated, explicit in blocks():
+            mask = ~np.isnan(values)
+            w = expert_weight[:, None] * mask
+            total = w.sum(axis=0)
+            mean = np.nansum(values * w, axis=0) / total
+            if method == "median":
+                consensus[pairs] = _weighted_median(values, w)
+            else:
+                consensus[pairs] = mean
+            spread[pairs] = np.sqrt(np.nansum(w * (values - mean) ** 2, axis=0) / total)
+            low[pairs] = np.nanmin(values, axis=0)
+            high[pairs] = np.nanmax(values, axis=0)
+            support[pairs] = mask.sum(axis=0)
+            drawn[pairs] = explicit.sum(axis=0)
+            agreement[pairs] = (
+                mask & (np.sign(values) == np.sign(consensus[pairs]))
+            ).sum(axis=0) / support[pairs]
+
+            has_confidence = ~np.isnan(stated)
+            confidence_weight = (expert_weight[:, None] * has_confidence).sum(axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                consensus_confidence[pairs] = (
+                    np.nansum(stated * expert_weight[:, None], axis=0)
+                    / confidence_weight
+                )
+
+        # Output ids: the first node's id, made unique when labels merged
+        # nodes whose ids collide.
+        node_ids: List[str] = []
+        used = set()
+        for node in nodes:
+            node_id, suffix = node.id, 2
+            while node_id in used:
+                node_id, suffix = f"{node.id}-{suffix}", suffix + 1
+            used.add(node_id)
+            node_ids.append(node_id)
+
+        all_ids = np.concatenate([ids for ids, _ in members] or [np.empty(0, int)])
+        all_xy = np.concatenate([xy for _, xy in members] or [np.empty((0, 2))])
+        count = np.bincount(all_ids, minlength=k)
+        x = np.bincount(all_ids, weights=all_xy[:, 0], minlength=k) / count
+        y = np.bincount(all_ids, weights=all_xy[:, 1], minlength=k) / count
+        out_nodes = [
+            node.model_copy(
+                update={
+                    "id": node_id,
+                    "ui": node.ui.model_copy(update={"x": node_x, "y": node_y}),
+                }
+            )
+            for node, node_id, node_x, node_y in zip(
+                nodes, node_ids, x.tolist(), y.tolist()
+            )
+        ]
+
+        keep = np.flatnonzero((drawn >= min_experts) & (consensus != 0.0))
+        # Clipped to the field bounds against rounding; validated in one call.
+        out_edges = _edges_adapter.validate_python(
+            [
+                {
+                    "source": node_ids[s],
+                    "target": node_ids[t],
+                    "weight": min(1.0, max(-1.0, w)),
+                    "confidence": None if math.isnan(c) else min(1.0, max(0.0, c)),
+                }
+                for s, t, w, c in zip(
+                    pair_source[keep].tolist(),
+                    pair_target[keep].tolist(),
+                    consensus[keep].tolist(),
+                    consensus_confidence[keep].tolist(),
+                )
+            ]
+        )
+
+        result_map = CognitiveMapModel(
+            nodes=out_nodes, edges=out_edges, fcm=fcm or FCMModel()
+        )
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        payload = result_map.model_dump(by_alias=True, exclude_none=True)
+        tmp = output_path.with_suffix(output_path.suffix + ".tmp")
+        tmp.write_bytes(json.dumps(payload, ensure_ascii=False, indent=2).encode())
+        os.replace(tmp, output_path)
+
+        disputed = keep[np.argsort(-spread[keep], kind="stable")[:top]]
+        disagreements = [
+            EdgeDisagreement(
+                source=node_ids[int(pair_source[p])],
+                target=node_ids[int(pair_target[p])],
+                weight=float(consensus[p]),
+                support=int(support[p]),
+                std=float(spread[p]),
+                min=float(low[p]),
+                max=float(high[p]),
+                sign_agreement=float(agreement[p]),
+            )
+            for p in disputed.tolist()
+        ]
+
+        logger.info(
+            "Aggregated %s maps into %s (%s nodes, %s edges)",
+            n_experts,
+            output_path,
+            len(out_nodes),
+            len(out_edges),
+        )
+        return AggregationResult(
+            path=str(output_path),
+            method=method,
+            align_by=align_by,
+            nodes=len(out_nodes),
+            edges=len(out_edges),
+            experts=experts,
+            disagreements=disagreements,
+        )
@@ -0,0 +1,564 @@
+"""
+Total-effect and influence-path analysis.
+
+With W[s, t] the effective weight of the edge s -> t, the total effect of s
+on t sums the products of weights along every walk from s to t:
+
+    T = W + W^2 + W^3 + ... = (I - W)^-1 W     if the spectral radius of W < 1
+
+and the indirect effect is T - W. The spectral radius is bounded from above
+by that of |W| (Collatz-Wielandt bound), which is cheap but loose for signed
+maps whose weights cancel; only when it is not below 1 are the eigenvalues
+computed. The resolvent is used while the spectral radius is below 1,
+otherwise the series is truncated after `max_order` terms.
+
+Convergence of a simulation is predicted from the contraction factor of one
+step x -> f(lambda W^T x): the activation's maximum slope (lambda/4 for the
+sigmoid, lambda for tanh) times the spectral norm of W. Only feedback
+clusters keep a simulation going, acyclic parts settle after as many steps
+as the condensation has levels, so the factor uses the largest norm of a
+cluster. Below 1 the steps shrink at least geometrically and auto mode
+converges; at or above 1 it may or may not. A cluster fed by another one
+keeps moving until that one has settled, so the settling steps are counted
+once per cluster on the longest chain of them.
+
+Analyses are cached per structure (node ids, edges and their weights), so
+layout edits and repeated queries reuse them.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import heapq
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, TypeAdapter
+
+from app.models.cognitive_map_models import (
+    CognitiveMapModel,
+    EdgeModel,
+    ScenarioParams,
+)
+from app.services.scenario_service import ScenarioService
+from app.services.simulation_engine import EdgeArrays, apply_activation, condense
+from app.storage.interned_graph import InternedGraph
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+# Dense n x n effect matrices are only built up to this size.
+MAX_DENSE_NODES = 3000
+CACHE_SIZE = 4
+# Paths popped from the search queue before giving up.
+MAX_PATH_EXPANSIONS = 200_000
+# Partial paths kept in the search queue; the weakest are dropped beyond it.
+MAX_PATH_QUEUE = 50_000
+# Power iteration limit for spectral norms.
+POWER_ITERATIONS = 200
+# ScenarioParams.max_iterations limit.
+MAX_ITERATIONS = 1000
+
+_edges_adapter = TypeAdapter(List[EdgeModel])
+
+
+class NodeEffect(BaseModel):
+    source: str
+    target: str
+    direct: float
+    indirect: float
+    total: float
+
+
+class EffectsResponse(BaseModel):
+    method: Literal["resolvent", "series"]
+    # The |W| bound, or the spectral radius itself if that bound is >= 1.
+    spectral_radius_bound: float
+    max_order: Optional[int] = None
+    effects: list[NodeEffect]
+
+
+class InfluencePath(BaseModel):
+    nodes: list[str]
+    weights: list[float]
+    effect: float
+
+
+class PathsResponse(BaseModel):
+    source: str
+    target: str
+    paths: list[InfluencePath]
+    # False if the search stopped at its expansion limit or dropped partial
+    # paths that could have been stronger than the ones returned.
+    complete: bool
+
+
+class ConvergencePrediction(BaseModel):
+    activation_type: Literal["sigmoid", "tanh"]
+    # Largest singular value of the whole effective adjacency.
+    spectral_norm: float
+    # Largest over the feedback clusters; 0 if the map is acyclic.
+    cluster_spectral_norm: float
+    max_slope: float
+    contraction_factor: float
+    contracting: bool
+    # Levels of the condensation: steps until the acyclic parts settle.
+    depth: int
+    # Most feedback clusters along one path; each settles after the ones
+    # feeding it, so their settling times add up.
+    chained_clusters: int
+    # Estimated iterations until auto mode converges; None if not contracting.
+    predicted_iterations: Optional[int] = None
+    suggested_max_iterations: int
+    warning: Optional[str] = None
+
+
+class _MapAnalysis:
+    """Per-structure data shared by queries; effects are computed lazily."""
+
+    def __init__(
+        self,
+        cognitive_map: CognitiveMapModel,
+        use_confidence: bool,
+        interned: Optional[InternedGraph] = None,
+    ):
+        interned = interned or InternedGraph.build(cognitive_map)
+        self.node_ids = interned.node_ids
+        self.index = interned.index
+        self.edges = ScenarioService.build_edge_arrays(interned, use_confidence)
+        self.lock = threading.RLock()
+        self._adjacency: Optional[np.ndarray] = None
+        self._effects: Dict[int, Tuple[np.ndarray, str, float]] = {}
+        self._outgoing: Optional[List[List[Tuple[int, float]]]] = None
+        self._spectrum: Optional[Tuple[float, float, int, int]] = None
+
+    @property
+    def adjacency(self) -> Optional[np.ndarray]:
+        """Dense effective adjacency, built on first use; None for large maps."""
+        n = len(self.node_ids)
+        if n > MAX_DENSE_NODES:
+            return None
+        with self.lock:
+            if self._adjacency is None:
+                # Same matrix as ScenarioService.build_adjacency_matrix.
+                adjacency = np.zeros((n, n))
+                adjacency[self.edges.source, self.edges.target] = self.edges.weight
+                self._adjacency = adjacency
+            return self._adjacency
+
+    def outgoing(self) -> List[List[Tuple[int, float]]]:
+        if self._outgoing is None:
+            outgoing: List[List[Tuple[int, float]]] = [[] for _ in self.node_ids]
+            for s, t, w in zip(
+                self.edges.source.tolist(),
+                self.edges.target.tolist(),
+                self.edges.weight.tolist(),
+            ):
+                outgoing[s].append((t, w))
+            self._outgoing = outgoing
+        return self._outgoing
+
+    def total_effects(self, max_order: int) -> Tuple[np.ndarray, str, float]:
+        with self.lock:
+            if max_order not in self._effects:
+                self._effects[max_order] = _total_effects(self.adjacency, max_order)
+            return self._effects[max_order]
+
+    def spectrum(self) -> Tuple[float, float, int, int]:
+        """
+        Spectral norm of the effective adjacency, the largest spectral norm
+        of a feedback cluster, the number of condensation levels and the
+        largest number of feedback clusters along one path.
+        """
+        with self.lock:
+            if self._spectrum is None:
+                self._spectrum = _spectrum(len(self.node_ids), self.edges)
+            return self._spectrum
+
+
+def spectral_radius_bound(matrix: np.ndarray, iterations: int = 50) -> float:
+    """Upper bound of the spectral radius of `matrix` via |matrix|."""
+    a = np.abs(matrix)
+    x = np.ones(len(a))
+    bound = np.inf
+    for _ in range(iterations):
+        y = a @ x
+        # For any positive x: rho(|A|) <= max_i (|A| x)_i / x_i.
+        bound = min(bound, float(np.max(y / x)))
+        x = y + 1e-12 * y.mean() + 1e-300
+        x /= x.max()
+    return bound
+
+
+def spectral_norms(
+    source: np.ndarray,
+    target: np.ndarray,
+    weight: np.ndarray,
+    labels: np.ndarray,
+    n_labels: int,
+    iterations: int = POWER_ITERATIONS,
+    tolerance: float = 1e-9,
+) -> np.ndarray:
+    """
+    Spectral norm (largest singular value) of every diagonal block of the
+    sparse matrix W[source, target] = weight, where block b holds the nodes
+    labelled b and no edge leaves its block. Power iteration on W W^T for
+    all blocks at once; the estimates approach the norms from below.
+    """
+    n = len(labels)
+    # A fixed positive start keeps results reproducible.
+    v = np.random.default_rng(0).uniform(0.5, 1.0, n)
+    estimate = np.zeros(n_labels)
+    for _ in range(iterations):
+        block_norm = np.sqrt(np.bincount(labels, weights=v * v, minlength=n_labels))
+        v /= np.maximum(block_norm, 1e-300)[labels]
+        u = np.bincount(target, weights=weight * v[source], minlength=n)
+        v = np.bincount(source, weights=weight * u[target], minlength=n)
+        # |W W^T v| -> norm² for unit v.
+        previous = estimate
+        estimate = np.bincount(labels, weights=v * v, minlength=n_labels) ** 0.25
+        if np.allclose(estimate, previous, rtol=tolerance, atol=0.0):
+            break
+    return estimate
+
+
+def _spectrum(n: int, edges: EdgeArrays) -> Tuple[float, float, int, int]:
+    condensation = condense(n, edges.source, edges.target)
+    cluster = np.full(n, -1, dtype=np.int64)
+    n_clusters = 0
+    # Feedback clusters on the longest chain of them ending at each node.
+    chain = np.zeros(n, dtype=np.int64)
+    for level, clusters in condensation.levels:
+        if len(level.nodes):
+            reached = np.zeros(len(level.nodes), dtype=np.int64)
+            np.maximum.at(reached, level.targets, chain[level.sources])
+            chain[level.nodes] = reached
+        for c in clusters:
+            cluster[c.nodes] = n_clusters
+            n_clusters += 1
+            upstream = chain[c.external].max() if len(c.external) else 0
+            chain[c.nodes] = upstream + 1
+
+    total = spectral_norms(
+        edges.source, edges.target, edges.weight, np.zeros(n, dtype=np.int64), 1
+    )
+    inside = (cluster[edges.source] >= 0) & (
+        cluster[edges.source] == cluster[edges.target]
+    )
+    # Nodes outside the clusters share one extra block without edges.
+    per_cluster = spectral_norms(
+        edges.source[inside],
+        edges.target[inside],
+        edges.weight[inside],
+        np.where(cluster >= 0, cluster, n_clusters),
+        n_clusters + 1,
+    )
+    return (
+        float(total[0]),
+        float(per_cluster.max()),
+        len(condensation.levels),
+        int(chain.max()) if n else 0,
+    )
+
+
+def _total_effects(w: np.ndarray, max_order: int) -> Tuple[np.ndarray, str, float]:
+    n = len(w)
+    bound = spectral_radius_bound(w) if n else 0.0
+    if bound >= 1.0:
+        bound = float(np.abs(np.linalg.eigvals(w)).max())
+    if bound < 1.0:
+        return np.linalg.solve(np.eye(n) - w, w), "resolvent", bound
+
+    total = w.copy()
+    power = w
+    for _ in range(max_order - 1):
+        power = power @ w
+        total += power
+    return total, "series", bound
+
+
+def _structure_key(
+    cognitive_map: CognitiveMapModel,
+    use_confidence: bool,
+    interned: Optional[InternedGraph] = None,
+) -> str:
+    # The structure is hashed once per map version: later queries on the
+    # same version look it up by the map hash the store already computed.
+    map_hash = interned.map_hash if interned is not None else None
+    structure = _structure_hashes.get(map_hash) if map_hash else None
+    if structure is None:
+        digest = hashlib.sha256()
+        digest.update(
+            "\n".join(node.id for node in cognitive_map.nodes).encode("utf-8")
+        )
+        digest.update(b"\0")
+        digest.update(_edges_adapter.dump_json(cognitive_map.edges))
+        structure = digest.hexdigest()
+        if map_hash:
+            _structure_hashes[map_hash] = structure
+            while len(_structure_hashes) > CACHE_SIZE:
+                _structure_hashes.popitem(last=False)
+    return f"{structure}:{use_confidence}"
+
+
+# map hash -> structure hash
+_structure_hashes: OrderedDict[str, str] = OrderedDict()
+
+_analyses: OrderedDict[str, _MapAnalysis] = OrderedDict()
+
+
+class AnalysisService:
+    """Service for influence analysis of the weight structure."""
+
+    @staticmethod
+    def prepare(
+        cognitive_map: CognitiveMapModel,
+        use_confidence: bool,
+        interned: Optional[InternedGraph] = None,
+    ) -> _MapAnalysis:
+        """
+        Cached analysis of the current structure. Call on the event loop; the
+        result can then be queried from a worker thread.
+
+        Args:
+            interned: The map's interned graph (from the store), built if
+                not given
+        """
+        key = _structure_key(cognitive_map, use_confidence, interned)
+        analysis = _analyses.get(key)
+        if analysis is None:
+            analysis = _MapAnalysis(cognitive_map, use_confidence, interned)
+            _analyses[key] = analysis
+            while len(_analyses) > CACHE_SIZE:
+                _analyses.popitem(last=False)
+        else:
+            _analyses.move_to_end(key)
+        return analysis
+
+    @staticmethod
+    def effects(
+        analysis: _MapAnalysis,
+        source: Optional[str] = None,
+        target: Optional[str] = None,
+        max_order: int = 6,
+        limit: int = 50,
+    ) -> EffectsResponse:
+        """
+        Direct, indirect and total effects.
+
+        Args:
+            analysis: Result of prepare()
+            source: Only effects of this node
+            target: Only effects on this node
+            max_order: Longest walk counted when the series does not converge
+            limit: Number of effects returned, strongest total effect first
+
+        Raises:
+            ValueError: On unknown node ids or maps too large for dense analysis
+        """
+        if analysis.adjacency is None:
+            raise ValueError(
+                f"Effect analysis is limited to {MAX_DENSE_NODES} nodes, "
+                f"the map has {len(analysis.node_ids)}"
+            )
+        for node_id in (source, target):
+            if node_id is not None and node_id not in analysis.index:
+                raise ValueError(
+                    f"Node '{node_id}' does not exist in the cognitive map"
+                )
+
+        total, method, bound = analysis.total_effects(max_order)
+        direct = analysis.adjacency
+        n = len(analysis.node_ids)
+
+        rows = np.arange(n) if source is None else np.array([analysis.index[source]])
+        cols = np.arange(n) if target is None else np.array([analysis.index[target]])
+        strength = np.abs(total[np.ix_(rows, cols)])
+        if source is None or target is None:
+            # A node's effect on itself (through feedback) is not a pair.
+            strength[rows[:, None] == cols[None, :]] = 0.0
+        flat = strength.ravel()
+        if source is None or target is None:
+            candidates = np.flatnonzero(flat > 0.0)
+        else:
+            candidates = np.arange(flat.size)
+        if candidates.size > limit:
+            top = np.argpartition(flat[candidates], -limit)[-limit:]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-flat[candidates], kind="stable")]
+
+        effects = []
+        for position in candidates.tolist():
+            s = int(rows[position // len(cols)])
+            t = int(cols[position % len(cols)])
+            effects.append(
+                NodeEffect(
+                    source=analysis.node_ids[s],
+                    target=analysis.node_ids[t],
+                    direct=float(direct[s, t]),
+                    indirect=float(total[s, t] - direct[s, t]),
+                    total=float(total[s, t]),
+                )
+            )
+
+        return EffectsResponse(
+            method=method,
+            spectral_radius_bound=bound,
+            max_order=max_order if method == "series" else None,
+            effects=effects,
+        )
+
+    @staticmethod
+    def strongest_paths(
+        analysis: _MapAnalysis,
+        source: str,
+        target: str,
+        k: int = 5,
+        max_length: int = 6,
+    ) -> PathsResponse:
+        """
+        Top-k simple paths from source to target by |product of weights|.
+
+        Best-first search: weights are within [-1, 1], so extending a path
+        never makes it stronger and paths reach the target strongest first.
+        The queue keeps the MAX_PATH_QUEUE strongest partial paths.
+        """
+        for node_id in (source, target):
+            if node_id not in analysis.index:
+                raise ValueError(
+                    f"Node '{node_id}' does not exist in the cognitive map"
+                )
+        if source == target:
+            raise ValueError("Source and target must be different nodes")
+
+        outgoing = analysis.outgoing()
+        start = analysis.index[source]
+        goal = analysis.index[target]
+
+        paths: List[InfluencePath] = []
+        queue = [(-1.0, 1.0, (start,), ())]
+        expansions = 0
+        # At least as strong as any partial path dropped from the queue.
+        dropped = 0.0
+        while queue and len(paths) < k and expansions < MAX_PATH_EXPANSIONS:
+            negative_strength, effect, nodes, weights = heapq.heappop(queue)
+            expansions += 1
+            last = nodes[-1]
+            if last == goal:
+                paths.append(
+                    InfluencePath(
+                        nodes=[analysis.node_ids[v] for v in nodes],
+                        weights=list(weights),
+                        effect=effect,
+                    )
+                )
+                continue
+            for nxt, w in outgoing[last]:
+                if nxt in nodes or (len(nodes) == max_length and nxt != goal):
+                    continue
+                strength = -negative_strength * abs(w)
+                if strength <= dropped:
+                    # Weaker than a path the queue already dropped.
+                    continue
+                heapq.heappush(
+                    queue,
+                    (
+                        -strength,
+                        effect * w,
+                        nodes + (nxt,),
+                        weights + (w,),
+                    ),
+                )
+            if len(queue) > 2 * MAX_PATH_QUEUE:
+                # Sorted, so still a heap.
+                queue = heapq.nsmallest(MAX_PATH_QUEUE, queue)
+                dropped = max(dropped, -queue[-1][0])
+
+        if len(paths) == k:
+            complete = abs(paths[-1].effect) >= dropped
+        else:
+            complete = expansions < MAX_PATH_EXPANSIONS and dropped == 0.0
+        return PathsResponse(
+            source=source, target=target, paths=paths, complete=complete
+        )
+
+    @staticmethod
+    def predict_convergence(
+        analysis: _MapAnalysis,
+        params: ScenarioParams,
+        lambda_param: float,
+        state_range: Tuple[float, float],
+    ) -> ConvergencePrediction:
+        """
+        Predict whether a scenario converges in auto mode and about how many
+        iterations it needs, from the contraction factor and the size of the
+        first step from the scenario's initial states.
+
+        Args:
+            analysis: Result of prepare() for params.use_confidence
+            params: Scenario parameters with validated initial states
+        """
+        spectral_norm, cluster_norm, depth, chained = analysis.spectrum()
+        if params.activation_type == "sigmoid":
+            slope = lambda_param / 4
+        else:
+            slope = lambda_param
+        factor = slope * cluster_norm
+        contracting = factor < 1.0
+
+        predicted = None
+        suggested = params.max_iterations
+        warning = None
+        if contracting:
+            n = len(analysis.node_ids)
+            state = np.zeros(n)
+            for node_id, value in params.initial_states.items():
+                state[analysis.index[node_id]] = value
+            edges = analysis.edges
+            inputs = np.bincount(
+                edges.target, weights=edges.weight * state[edges.source], minlength=n
+            )
+            step = apply_activation(
+                inputs, params.activation_type, lambda_param, state_range
+            )
+            first_step = float(np.linalg.norm(step - state))
+
+            threshold = params.convergence_threshold
+            if threshold is None:
+                threshold = ScenarioParams.model_fields["convergence_threshold"].default
+            # Steps shrink by the factor once the acyclic parts have settled;
+            # auto mode stops at the first step below the threshold.
+            settle = 0
+            if factor > 0.0 and first_step > threshold:
+                settle = math.ceil(math.log(threshold / first_step) / math.log(factor))
+            # A cluster keeps moving while the clusters upstream of it do, so
+            # along a chain of them the settling times add up. An upper
+            # estimate, as the norm bounds the step size.
+            predicted = depth + settle * max(chained, 1) + 1
+            suggested = min(MAX_ITERATIONS, predicted)
+            if predicted > MAX_ITERATIONS:
+                warning = (
+                    f"Auto mode needs about {predicted} iterations to converge, "
+                    f"more than the {MAX_ITERATIONS} allowed"
+                )
+        else:
+            warning = (
+                f"Contraction factor {factor:.3g} is not below 1: auto mode may "
+                f"not converge and run all {params.max_iterations} iterations"
+            )
+
+        return ConvergencePrediction(
+            activation_type=params.activation_type,
+            spectral_norm=spectral_norm,
+            cluster_spectral_norm=cluster_norm,
+            max_slope=slope,
+            contraction_factor=factor,
+            contracting=contracting,
+            depth=depth,
+            chained_clusters=chained,
+            predicted_iterations=predicted,
+            suggested_max_iterations=suggested,
+            warning=warning,
+        )
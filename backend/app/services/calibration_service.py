@@ -0,0 +1,487 @@
+"""
+Fitting edge weights to observed time series.
+
+The CSV holds one row per time step and one column per observed node
+(matched by node id, then by unique label, or through an explicit mapping).
+An optional sequence column splits the rows into independent runs;
+consecutive rows of a run are consecutive iterations. Empty and "NA" cells
+are missing values.
+
+Every pair of consecutive rows is a transition x -> y, and the weights are
+fitted so that one FCM step from the observed x predicts the observed y:
+
+    loss = mean over (transition, node) of (f(W^T x)[node] - y[node])²
+
+counting a node only where it and all the sources of its incoming edges
+are observed. Each node's incoming weights thus form their own problem, and
+all of them are solved at once by projected Adam over the full batch of
+transitions, within [-1, 1]. A seeded share of the transitions is held out:
+the fit stops once the held-out loss has not improved for `patience`
+epochs and keeps the best weights.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import math
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from app.models.cognitive_map_models import CognitiveMapModel
+from app.services.simulation_engine import apply_activation
+from app.storage.interned_graph import InternedGraph
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+MISSING = {"", "na", "nan", "null"}
+# Transition-edge products per block, to bound temporary arrays.
+BLOCK_ELEMENTS = 1 << 22
+# Fewer transitions than this are all used for fitting, without hold-out.
+MIN_VALIDATION_TRANSITIONS = 10
+# Improvement of the monitored loss that resets the patience.
+MIN_IMPROVEMENT = 1e-9
+ADAM_BETAS = (0.9, 0.999)
+
+# Called with (epoch, max_epochs, training loss, held-out loss or None); it
+# may raise to stop.
+ProgressCallback = Callable[[int, int, float, Optional[float]], None]
+
+
+class EdgeFit(BaseModel):
+    source: str
+    target: str
+    old_weight: float
+    new_weight: float
+    # Transitions in which the target and all its sources were observed.
+    samples: int
+    # RMSE of the one-step prediction of the target; None without samples.
+    rmse_before: Optional[float] = None
+    rmse_after: Optional[float] = None
+
+
+class CalibrationResult(BaseModel):
+    sequences: int
+    transitions: int
+    validation_transitions: int
+    observed_node_ids: List[str]
+    ignored_columns: List[str]
+    epochs: int
+    stopped_early: bool
+    loss_before: float
+    loss_after: float
+    validation_loss_before: Optional[float] = None
+    validation_loss_after: Optional[float] = None
+    # Edges with samples; the others keep their weights.
+    fitted_edges: int
+    edges: List[EdgeFit]
+    applied: bool = False
+    # Hash of the map with the fitted weights, if applied.
+    map_hash: Optional[str] = None
+
+
+@dataclass
+class TimeSeries:
+    """Observed states, one row per time step and one column per node."""
+
+    # (rows, nodes of the map); NaN where not observed.
+    values: np.ndarray
+    # First row of each sequence.
+    starts: np.ndarray
+    observed_node_ids: List[str]
+    ignored_columns: List[str]
+
+
+@dataclass
+class CalibrationProblem:
+    """What the fit needs from the map, copied so it can run in a thread."""
+
+    node_ids: List[str]
+    # One edge per (source, target), the last one as in build_edge_arrays.
+    source: np.ndarray
+    target: np.ndarray
+    weight: np.ndarray
+    # d(effective weight)/d(weight): the confidence or 1.
+    scale: np.ndarray
+    activation_type: str
+    lambda_param: float
+    state_range: Tuple[float, float]
+    series: TimeSeries
+    # Edges sorted by (target, source), so inputs are summed per target in
+    # source order, and where each receiving node's edges start.
+    order: np.ndarray
+    receivers: np.ndarray
+    starts: np.ndarray
+
+
+class _Batch:
+    """Transitions with missing values zeroed and a mask of usable targets."""
+
+    def __init__(self, problem: CalibrationProblem, x: np.ndarray, y: np.ndarray):
+        n = len(problem.node_ids)
+        missing = np.isnan(x)
+        # A target is usable where it and all its sources are observed.
+        blind = np.zeros(x.shape, dtype=bool)
+        if problem.source.size:
+            np.logical_or.at(blind.T, problem.target, missing[:, problem.source].T)
+        self.valid = ~np.isnan(y) & ~blind
+        has_input = np.zeros(n, dtype=bool)
+        has_input[problem.target] = True
+        self.valid &= has_input
+        self.x = np.where(missing, 0.0, x)
+        self.y = np.where(self.valid, y, 0.0)
+        self.count = int(self.valid.sum())
+
+
+def _evaluate(
+    problem: CalibrationProblem, batch: _Batch, w: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Squared error per node and the gradient of its sum."""
+    n = len(problem.node_ids)
+    effective = w * problem.scale
+    order, receivers, starts = problem.order, problem.receivers, problem.starts
+    squared = np.zeros(n)
+    gradient = np.zeros(len(w))
+    rows = max(1, BLOCK_ELEMENTS // max(len(w), 1))
+    low, high = problem.state_range
+
+    for start in range(0, len(batch.x), rows):
+        x = batch.x[start : start + rows]
+        inputs = np.zeros((len(x), n))
+        contributions = x[:, problem.source[order]] * effective[order]
+        inputs[:, receivers] = np.add.reduceat(contributions, starts, axis=1)
+        y = apply_activation(
+            inputs, problem.activation_type, problem.lambda_param, problem.state_range
+        )
+        if problem.activation_type == "sigmoid":
+            slope = problem.lambda_param * y * (1.0 - y)
+        else:
+            slope = problem.lambda_param * (1.0 - y * y)
+        slope[(y <= low) | (y >= high)] = 0.0
+
+        valid = batch.valid[start : start + rows]
+        residual = np.where(valid, y - batch.y[start : start + rows], 0.0)
+        squared += (residual * residual).sum(axis=0)
+        delta = residual * slope
+        gradient += (delta[:, problem.target] * x[:, problem.source]).sum(axis=0)
+
+    return squared, 2.0 * gradient * problem.scale
+
+
+def _loss(squared: np.ndarray, batch: _Batch) -> float:
+    return float(squared.sum() / batch.count) if batch.count else 0.0
+
+
+class CalibrationService:
+    """Service for fitting edge weights to observed time series."""
+
+    @staticmethod
+    def parse_csv(
+        data: bytes,
+        cognitive_map: CognitiveMapModel,
+        mapping: Optional[Dict[str, str]] = None,
+        sequence_column: Optional[str] = None,
+    ) -> TimeSeries:
+        """
+        Args:
+            mapping: CSV column -> node id; without it, columns are matched
+                to node ids, then to unique node labels
+            sequence_column: Column identifying the sequences; "sequence"
+                if the CSV has one. Without it, all rows form one sequence.
+
+        Raises:
+            ValueError: On malformed CSVs, unknown mapped nodes, values
+                outside state_range or fewer than two rows
+        """
+        try:
+            text = data.decode("utf-8-sig")
+        except UnicodeDecodeError as e:
+            raise ValueError(f"The CSV is not UTF-8: {e}")
+        rows = list(csv.reader(io.StringIO(text)))
+        if not rows:
+            raise ValueError("The CSV is empty")
+        header = [column.strip() for column in rows[0]]
+        body = [row for row in rows[1:] if any(cell.strip() for cell in row)]
+
+        index = {node.id: i for i, node in enumerate(cognitive_map.nodes)}
+        if sequence_column is None and "sequence" in header:
+            sequence_column = "sequence"
+        if sequence_column is not None and sequence_column not in header:
+            raise ValueError(f"Sequence column '{sequence_column}' not in the CSV")
+
+        if mapping is not None:
+            unknown = [v for v in mapping.values() if v not in index]
+            if unknown:
+                raise ValueError(f"Unknown mapped nodes: {', '.join(unknown)}")
+            columns = {c: mapping[c] for c in header if c in mapping}
+        else:
+            labels: Dict[str, Optional[str]] = {}
+            for node in cognitive_map.nodes:
+                label = node.label.strip()
+                # Ambiguous labels map to nothing.
+                labels[label] = None if label in labels else node.id
+            columns = {}
+            for column in header:
+                if column == sequence_column:
+                    continue
+                node_id = column if column in index else labels.get(column)
+                if node_id is not None:
+                    columns[column] = node_id
+        if not columns:
+            raise ValueError("No CSV column matches a node of the map")
+        if len(set(columns.values())) != len(columns):
+            raise ValueError("Several CSV columns map to the same node")
+        if len(body) < 2:
+            raise ValueError("The CSV needs at least two rows of observations")
+
+        low, high = cognitive_map.fcm.state_range
+        values = np.full((len(body), len(index)), np.nan)
+        positions = {c: header.index(c) for c in columns}
+        for r, row in enumerate(body):
+            for column, node_id in columns.items():
+                p = positions[column]
+                cell = row[p].strip() if p < len(row) else ""
+                if cell.lower() in MISSING:
+                    continue
+                try:
+                    value = float(cell)
+                except ValueError:
+                    raise ValueError(
+                        f"Row {r + 2}, column '{column}': '{cell}' is not a number"
+                    )
+                if not low <= value <= high:
+                    raise ValueError(
+                        f"Row {r + 2}, column '{column}': {value} is outside "
+                        f"state_range [{low}, {high}]"
+                    )
+                values[r, index[node_id]] = value
+
+        starts = [0]
+        if sequence_column is not None:
+            p = header.index(sequence_column)
+            ids = [row[p].strip() if p < len(row) else "" for row in body]
+            starts += [r for r in range(1, len(ids)) if ids[r] != ids[r - 1]]
+            if len(starts) == len(body):
+                raise ValueError("Every sequence has a single row: no transitions")
+
+        return TimeSeries(
+            values=values,
+            starts=np.array(starts, dtype=np.int64),
+            observed_node_ids=list(columns.values()),
+            ignored_columns=[
+                c for c in header if c not in columns and c != sequence_column
+            ],
+        )
+
+    @staticmethod
+    def prepare(
+        cognitive_map: CognitiveMapModel,
+        series: TimeSeries,
+        activation_type: str,
+        use_confidence: bool,
+        interned: Optional[InternedGraph] = None,
+    ) -> CalibrationProblem:
+        """
+        Raises:
+            ValueError: If the map has no edges
+        """
+        interned = interned or InternedGraph.build(cognitive_map)
+        n = interned.size
+        pair = interned.source * max(n, 1) + interned.target
+        _, last_reversed = np.unique(pair[::-1], return_index=True)
+        chosen = np.sort(len(pair) - 1 - last_reversed)
+        if not chosen.size:
+            raise ValueError("The map has no edges to calibrate")
+        scale = np.ones(len(chosen))
+        if use_confidence:
+            confidence = interned.confidence[chosen]
+            scale = np.where(np.isnan(confidence), 1.0, confidence)
+
+        source = interned.source[chosen]
+        target = interned.target[chosen]
+        order = np.lexsort((source, target))
+        receivers, starts = np.unique(target[order], return_index=True)
+        return CalibrationProblem(
+            node_ids=interned.node_ids,
+            source=source,
+            target=target,
+            weight=interned.weight[chosen].copy(),
+            scale=scale,
+            activation_type=activation_type,
+            lambda_param=cognitive_map.fcm.activation.lambda_,
+            state_range=tuple(cognitive_map.fcm.state_range),
+            series=series,
+            order=order,
+            receivers=receivers,
+            starts=starts,
+        )
+
+    @staticmethod
+    def fit(
+        problem: CalibrationProblem,
+        learning_rate: float = 0.05,
+        max_epochs: int = 5000,
+        patience: int = 200,
+        validation_fraction: float = 0.2,
+        seed: int = 0,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> CalibrationResult:
+        """
+        Fit the weights; the map itself is not changed (see apply()).
+
+        Args:
+            learning_rate: Adam step size in weight units
+            patience: Epochs without improvement before stopping
+            validation_fraction: Share of transitions held out for early
+                stopping
+            seed: Seed of the hold-out split
+        """
+        series = problem.series
+        rows = len(series.values)
+        follows = np.ones(rows, dtype=bool)
+        follows[series.starts] = False
+        # Transition t goes from row t - 1 to row t.
+        later = np.flatnonzero(follows)
+        x_all, y_all = series.values[later - 1], series.values[later]
+
+        held_out = np.zeros(len(later), dtype=bool)
+        if len(later) >= MIN_VALIDATION_TRANSITIONS and validation_fraction > 0:
+            rng = np.random.default_rng(seed)
+            size = max(1, round(len(later) * validation_fraction))
+            held_out[rng.choice(len(later), size=size, replace=False)] = True
+        training = _Batch(problem, x_all[~held_out], y_all[~held_out])
+        validation = (
+            _Batch(problem, x_all[held_out], y_all[held_out])
+            if held_out.any()
+            else None
+        )
+        if validation is not None and not validation.count:
+            validation = None
+        everything = _Batch(problem, x_all, y_all)
+        if not training.count:
+            raise ValueError(
+                "No transition observes a node together with all its sources"
+            )
+
+        w = problem.weight.copy()
+        squared_before, _ = _evaluate(problem, everything, w)
+        loss_before = _loss(_evaluate(problem, training, w)[0], training)
+        validation_before = (
+            _loss(_evaluate(problem, validation, w)[0], validation)
+            if validation is not None
+            else None
+        )
+
+        def monitored_loss(w: np.ndarray) -> Tuple[float, np.ndarray, float]:
+            """Training loss, its gradient and the loss early stopping watches."""
+            squared, gradient = _evaluate(problem, training, w)
+            training_loss = _loss(squared, training)
+            if validation is None:
+                return training_loss, gradient / training.count, training_loss
+            held_out_loss = _loss(_evaluate(problem, validation, w)[0], validation)
+            return training_loss, gradient / training.count, held_out_loss
+
+        beta1, beta2 = ADAM_BETAS
+        m = np.zeros_like(w)
+        v = np.zeros_like(w)
+        best_w, best = w.copy(), math.inf
+        since_best = 0
+        epoch = 0
+        stopped_early = False
+        while epoch < max_epochs:
+            training_loss, gradient, monitored = monitored_loss(w)
+            if on_progress is not None:
+                on_progress(
+                    epoch,
+                    max_epochs,
+                    training_loss,
+                    monitored if validation is not None else None,
+                )
+            if monitored < best - MIN_IMPROVEMENT:
+                best_w, best = w.copy(), monitored
+                since_best = 0
+            else:
+                since_best += 1
+                if since_best >= patience:
+                    stopped_early = True
+                    break
+
+            epoch += 1
+            m = beta1 * m + (1 - beta1) * gradient
+            v = beta2 * v + (1 - beta2) * gradient * gradient
+            m_hat = m / (1 - beta1**epoch)
+            v_hat = v / (1 - beta2**epoch)
+            w = np.clip(w - learning_rate * m_hat / (np.sqrt(v_hat) + 1e-12), -1, 1)
+        if not stopped_early and monitored_loss(w)[2] < best - MIN_IMPROVEMENT:
+            best_w = w
+        w = best_w
+
+        squared_after, _ = _evaluate(problem, everything, w)
+        samples = everything.valid.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rmse_before = np.sqrt(squared_before / samples)
+            rmse_after = np.sqrt(squared_after / samples)
+
+        names = problem.node_ids
+        edges = []
+        for e in range(len(w)):
+            t = int(problem.target[e])
+            count = int(samples[t])
+            edges.append(
+                EdgeFit(
+                    source=names[problem.source[e]],
+                    target=names[t],
+                    old_weight=float(problem.weight[e]),
+                    new_weight=float(w[e]) if count else float(problem.weight[e]),
+                    samples=count,
+                    rmse_before=float(rmse_before[t]) if count else None,
+                    rmse_after=float(rmse_after[t]) if count else None,
+                )
+            )
+
+        return CalibrationResult(
+            sequences=len(series.starts),
+            transitions=len(later),
+            validation_transitions=int(held_out.sum()),
+            observed_node_ids=series.observed_node_ids,
+            ignored_columns=series.ignored_columns,
+            epochs=epoch,
+            stopped_early=stopped_early,
+            loss_before=loss_before,
+            loss_after=_loss(_evaluate(problem, training, w)[0], training),
+            validation_loss_before=validation_before,
+            validation_loss_after=(
+                _loss(_evaluate(problem, validation, w)[0], validation)
+                if validation is not None
+                else None
+            ),
+            fitted_edges=int((samples[problem.target] > 0).sum()),
+            edges=edges,
+        )
+
+    @staticmethod
+    def apply(
+        cognitive_map: CognitiveMapModel, result: CalibrationResult
+    ) -> CognitiveMapModel:
+        """
+        A copy of the map with the fitted weights. Edges are matched by
+        (source, target), the last one of a pair as in the fit; edges added
+        or deleted meanwhile are left as they are.
+        """
+        fitted = {
+            (edge.source, edge.target): edge.new_weight
+            for edge in result.edges
+            if edge.samples
+        }
+        last = {}
+        for position, edge in enumerate(cognitive_map.edges):
+            last[(edge.source, edge.target)] = position
+        edges = list(cognitive_map.edges)
+        for pair, position in last.items():
+            weight = fitted.get(pair)
+            if weight is not None:
+                edges[position] = edges[position].model_copy(update={"weight": weight})
+        return cognitive_map.model_copy(update={"edges": edges})
@@ -0,0 +1,202 @@
+"""
+Metadata index of the project files in the projects directory.
+
+The index (path, size, mtime, node/edge/scenario counts, content hash, last
+scenario run) is kept in a small JSON file next to the projects. A refresh
+only stats the files; a project is parsed again only when its mtime or size
+changed, so listing hundreds of projects costs a directory scan.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Literal, Optional
+
+from pydantic import BaseModel, ValidationError
+
+from app.models.cognitive_map_models import CognitiveMapModel
+from core.instrumentation import gauge, histogram
+
+logger = logging.getLogger("app")
+
+INDEX_FILE_NAME = ".catalog.json"
+
+CATALOG_ENTRIES = gauge("project_catalog_entries", "Project files in the catalog")
+CATALOG_REFRESH = histogram(
+    "project_catalog_refresh_seconds", "Duration of project catalog refreshes"
+)
+
+SortKey = Literal["name", "mtime", "size", "nodes", "edges", "scenarios", "last_run"]
+
+
+class CatalogEntry(BaseModel):
+    path: str
+    name: str
+    size: int
+    mtime: float
+    nodes: int = 0
+    edges: int = 0
+    scenarios: int = 0
+    content_hash: str
+    # Timestamp of the most recent scenario result in the project.
+    last_run: Optional[str] = None
+    # Set if the file could not be read as a cognitive map.
+    error: Optional[str] = None
+
+
+class CatalogPage(BaseModel):
+    total: int
+    entries: List[CatalogEntry]
+
+
+def _entry_for(path: Path, stat: os.stat_result) -> CatalogEntry:
+    data = path.read_bytes()
+    entry = CatalogEntry(
+        path=str(path),
+        name=path.stem,
+        size=stat.st_size,
+        mtime=stat.st_mtime,
+        content_hash=hashlib.sha256(data).hexdigest(),
+    )
+    try:
+        model = CognitiveMapModel.model_validate_json(data)
+    except ValidationError as e:
+        first = e.errors(include_url=False)[0]
+        location = ".".join(str(part) for part in first["loc"])
+        entry.error = f"{location}: {first['msg']}" if location else first["msg"]
+        return entry
+
+    entry.nodes = len(model.nodes)
+    entry.edges = len(model.edges)
+    entry.scenarios = len(model.fcm.scenarios)
+    runs = [s.result.timestamp for s in model.fcm.scenarios if s.result is not None]
+    entry.last_run = max(runs) if runs else None
+    return entry
+
+
+class ProjectCatalog:
+    def __init__(self, root: Path, index_path: Optional[Path] = None):
+        self.root = root
+        self.index_path = index_path or root / INDEX_FILE_NAME
+        self.lock = threading.Lock()
+        # path -> (mtime_ns, size, entry)
+        self._entries: Dict[str, tuple] = {}
+        self._load_index()
+
+        CATALOG_ENTRIES.callback = lambda: len(self._entries)
+
+    def _load_index(self) -> None:
+        try:
+            stored = json.loads(self.index_path.read_text(encoding="utf-8"))
+            for item in stored.get("entries", []):
+                entry = CatalogEntry.model_validate(item["entry"])
+                self._entries[entry.path] = (item["mtime_ns"], item["size"], entry)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(
+                "Ignoring unreadable catalog index %s: %s", self.index_path, e
+            )
+            self._entries = {}
+
+    def _save_index(self) -> None:
+        payload = {
+            "entries": [
+                {"mtime_ns": mtime_ns, "size": size, "entry": entry.model_dump()}
+                for mtime_ns, size, entry in self._entries.values()
+            ]
+        }
+        tmp = self.index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.index_path)
+
+    def refresh(self) -> int:
+        """
+        Bring the index up to date with the directory.
+
+        Returns:
+            Number of project files that were (re)parsed
+        """
+        start = time.perf_counter()
+        with self.lock:
+            seen = set()
+            parsed = 0
+            for path in self.root.rglob("*.json"):
+                if path == self.index_path or not path.is_file():
+                    continue
+                key = str(path)
+                seen.add(key)
+                try:
+                    stat = path.stat()
+                    cached = self._entries.get(key)
+                    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                        continue
+                    entry = _entry_for(path, stat)
+                except OSError as e:
+                    logger.warning("Cannot index project %s: %s", path, e)
+                    continue
+                self._entries[key] = (stat.st_mtime_ns, stat.st_size, entry)
+                parsed += 1
+
+            removed = [key for key in self._entries if key not in seen]
+            for key in removed:
+                del self._entries[key]
+
+            if parsed or removed:
+                try:
+                    self._save_index()
+                except OSError as e:
+                    logger.warning("Cannot save catalog index: %s", e)
+        CATALOG_REFRESH.observe(time.perf_counter() - start)
+        return parsed
+
+    def query(
+        self,
+        q: Optional[str] = None,
+        min_nodes: Optional[int] = None,
+        max_nodes: Optional[int] = None,
+        has_results: Optional[bool] = None,
+        sort: SortKey = "mtime",
+        descending: bool = True,
+        limit: int = 50,
+        offset: int = 0,
+    ) -> CatalogPage:
+        """
+        Filter and sort the indexed projects; call refresh() first.
+
+        Args:
+            q: Case-insensitive substring of the file name or path
+            min_nodes / max_nodes: Bounds on the node count
+            has_results: Only projects with (or without) a scenario result
+        """
+        with self.lock:
+            entries = [entry for _, _, entry in self._entries.values()]
+
+        if q:
+            needle = q.casefold()
+            root = str(self.root)
+            entries = [
+                e
+                for e in entries
+                if needle in e.name.casefold()
+                or needle in e.path.removeprefix(root).casefold()
+            ]
+        if min_nodes is not None:
+            entries = [e for e in entries if e.nodes >= min_nodes]
+        if max_nodes is not None:
+            entries = [e for e in entries if e.nodes <= max_nodes]
+        if has_results is not None:
+            entries = [e for e in entries if (e.last_run is not None) == has_results]
+
+        # Entries without a value (e.g. never run) sort last either way.
+        present = [e for e in entries if getattr(e, sort) is not None]
+        absent = [e for e in entries if getattr(e, sort) is None]
+        present.sort(
+            key=lambda e: (getattr(e, sort), e.name.casefold()), reverse=descending
+        )
+        entries = present + absent
+        return CatalogPage(total=len(entries), entries=entries[offset : offset + limit])
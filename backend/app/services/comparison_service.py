@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from app.models.cognitive_map_models import CognitiveMapModel
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+
+class DivergentNode(BaseModel):
+    node_id: str
+    spread: float
+    min_scenario_id: str
+    max_scenario_id: str
+
+
+class PreferredAgreement(BaseModel):
+    scenario_id: str
+    # Share of nodes with a preferred_state that moved in that direction
+    # relative to the baseline.
+    agreement: Optional[float]
+    # Mean of the deltas signed by preferred direction (+ is good).
+    score: Optional[float]
+
+
+class ScenarioComparison(BaseModel):
+    baseline_id: str
+    scenario_ids: List[str]
+    nodes_order: List[str]
+    # Rows follow scenario_ids, columns nodes_order; null where a scenario
+    # has no state for a node (e.g. added after it was run).
+    final_states: Optional[List[List[Optional[float]]]] = None
+    deltas: Optional[List[List[Optional[float]]]] = None
+    rank_changes: Optional[List[List[int]]] = None
+    divergent_nodes: List[DivergentNode]
+    preferred_agreement: List[PreferredAgreement]
+    missing_results: List[str]
+
+
+class ComparisonService:
+    """Service for comparing final states of several scenarios."""
+
+    @staticmethod
+    def compare(
+        cognitive_map: CognitiveMapModel,
+        scenario_ids: Optional[List[str]] = None,
+        baseline_id: Optional[str] = None,
+        top: int = 20,
+        include_matrices: bool = True,
+    ) -> ScenarioComparison:
+        """
+        Compare scenario results against a baseline scenario.
+
+        Args:
+            cognitive_map: The cognitive map holding the scenarios
+            scenario_ids: Scenarios to compare, all of them if None
+            baseline_id: Reference scenario, the first compared one if None
+            top: Number of most divergent nodes to return
+            include_matrices: Whether to return the per-node matrices
+
+        Returns:
+            ScenarioComparison with rows aligned to scenario_ids
+
+        Raises:
+            ValueError: If a scenario does not exist or nothing can be compared
+        """
+        results = {s.id: s.result for s in cognitive_map.fcm.scenarios}
+        if scenario_ids is None:
+            scenario_ids = list(results)
+        for scenario_id in scenario_ids + ([baseline_id] if baseline_id else []):
+            if scenario_id not in results:
+                raise ValueError(f"Scenario '{scenario_id}' not found")
+
+        if baseline_id is not None and baseline_id not in scenario_ids:
+            scenario_ids = [baseline_id] + scenario_ids
+        scenario_ids = list(dict.fromkeys(scenario_ids))
+        missing = [sid for sid in scenario_ids if results[sid] is None]
+        compared = [sid for sid in scenario_ids if results[sid] is not None]
+        if not compared:
+            raise ValueError("None of the scenarios has a result to compare")
+        if baseline_id is None:
+            baseline_id = compared[0]
+        elif baseline_id in missing:
+            raise ValueError(f"Baseline scenario '{baseline_id}' has no result")
+
+        nodes_order = [node.id for node in cognitive_map.nodes]
+        n, k = len(nodes_order), len(compared)
+
+        # One row per scenario, aligned to the map's node order.
+        states = np.full((k, n), np.nan)
+        for row, scenario_id in enumerate(compared):
+            final_states = results[scenario_id].final_states
+            states[row] = [final_states.get(node_id, np.nan) for node_id in nodes_order]
+
+        base = compared.index(baseline_id)
+        deltas = states - states[base]
+
+        # Rank 0 is the highest state within a scenario; NaN ranks last.
+        order = np.argsort(-states, axis=1, kind="stable")
+        ranks = np.empty_like(order)
+        np.put_along_axis(ranks, order, np.arange(n)[None, :], axis=1)
+        rank_changes = ranks - ranks[base]
+
+        divergent: List[DivergentNode] = []
+        if n:
+            with np.errstate(invalid="ignore"):
+                finite = np.isfinite(states)
+                high = np.where(finite, states, -np.inf)
+                low = np.where(finite, states, np.inf)
+                spread = high.max(axis=0) - low.min(axis=0)
+            spread[~finite.any(axis=0)] = np.nan
+            candidates = np.flatnonzero(np.isfinite(spread))
+            if candidates.size > top:
+                candidates = candidates[np.argpartition(-spread[candidates], top)[:top]]
+            candidates = candidates[np.argsort(-spread[candidates], kind="stable")]
+            argmax = high.argmax(axis=0)
+            argmin = low.argmin(axis=0)
+            divergent = [
+                DivergentNode(
+                    node_id=nodes_order[i],
+                    spread=float(spread[i]),
+                    min_scenario_id=compared[argmin[i]],
+                    max_scenario_id=compared[argmax[i]],
+                )
+                for i in candidates.tolist()
+            ]
+
+        direction = np.array(
+            [
+                {"increase": 1.0, "decrease": -1.0}.get(node.preferred_state, 0.0)
+                for node in cognitive_map.nodes
+            ]
+        ).reshape(n)
+        signed = deltas[:, direction != 0] * direction[direction != 0]
+        valid = np.isfinite(signed)
+        counts = valid.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            agreement = (np.where(valid, signed > 0, False)).sum(axis=1) / counts
+            score = np.where(valid, signed, 0.0).sum(axis=1) / counts
+        preferred = [
+            PreferredAgreement(
+                scenario_id=scenario_id,
+                agreement=float(agreement[row]) if counts[row] else None,
+                score=float(score[row]) if counts[row] else None,
+            )
+            for row, scenario_id in enumerate(compared)
+        ]
+
+        return ScenarioComparison(
+            baseline_id=baseline_id,
+            scenario_ids=compared,
+            nodes_order=nodes_order,
+            final_states=states.tolist() if include_matrices else None,
+            deltas=deltas.tolist() if include_matrices else None,
+            rank_changes=rank_changes.tolist() if include_matrices else None,
+            divergent_nodes=divergent,
+            preferred_agreement=preferred,
+            missing_results=missing,
+        )
@@ -0,0 +1,293 @@
+"""
+Streaming export of scenario results.
+
+Rows are in long format, one per (scenario, iteration, node):
+
+    scenario_id, iteration, node_id, state
+
+which reads straight into pandas and keeps the same schema whatever the map
+size. "final" exports the stored result of each scenario (iteration is its
+iterations_count); "history" re-simulates the scenarios chunk by chunk
+(ScenarioService.iterate_history), so memory is bounded by one chunk of
+iterations rather than by max_iterations.
+
+CSV is always available; Parquet and Arrow IPC stream need pyarrow, which is
+optional.
+"""
+
+from __future__ import annotations
+
+import csv
+import importlib.util
+import io
+from dataclasses import dataclass
+from typing import Iterator, List, Literal, Optional
+
+from app.models.cognitive_map_models import (
+    CognitiveMapModel,
+    ScenarioParams,
+    ScenarioResult,
+)
+from app.services.scenario_service import ScenarioService
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+ExportFormat = Literal["csv", "parquet", "arrow"]
+
+ARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+# Rows gathered before a chunk is written (one Parquet row group / Arrow
+# record batch / CSV chunk); larger iteration blocks are written as they are.
+ROWS_PER_CHUNK = 65_536
+
+COLUMNS = ("scenario_id", "iteration", "node_id", "state")
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+EXTENSIONS = {"csv": "csv", "parquet": "parquet", "arrow": "arrows"}
+
+
+@dataclass
+class _Rows:
+    """A chunk of rows as parallel arrays of scenario and node positions."""
+
+    scenario: np.ndarray
+    iteration: np.ndarray
+    node: np.ndarray
+    state: np.ndarray
+
+
+@dataclass
+class ExportPlan:
+    """Inputs of an export, captured from the live map on the event loop."""
+
+    kind: Literal["final", "history"]
+    cognitive_map: CognitiveMapModel
+    node_ids: List[str]
+    scenario_ids: List[str]
+    params: List[ScenarioParams]
+    results: List[Optional[ScenarioResult]]
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file collecting what pyarrow writes until drained."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+class ExportService:
+    """Service for exporting scenario results as CSV, Parquet or Arrow."""
+
+    @staticmethod
+    def plan(
+        cognitive_map: CognitiveMapModel,
+        kind: Literal["final", "history"],
+        scenario_ids: Optional[List[str]] = None,
+    ) -> ExportPlan:
+        """
+        Validate and capture what to export. Errors must surface here: once
+        the response has started streaming its status can no longer change.
+
+        Raises:
+            ValueError: If a scenario does not exist or cannot be simulated
+        """
+        scenarios = {s.id: s for s in cognitive_map.fcm.scenarios}
+        if scenario_ids is None:
+            scenario_ids = list(scenarios)
+        scenario_ids = list(dict.fromkeys(scenario_ids))
+        for scenario_id in scenario_ids:
+            if scenario_id not in scenarios:
+                raise ValueError(f"Scenario '{scenario_id}' not found")
+
+        node_ids = [node.id for node in cognitive_map.nodes]
+        if kind == "history":
+            if not node_ids:
+                raise ValueError("Cannot run simulation on empty cognitive map")
+            for scenario_id in scenario_ids:
+                ScenarioService.validate_initial_states(
+                    scenarios[scenario_id].params.initial_states,
+                    node_ids,
+                    cognitive_map.fcm.state_range,
+                )
+
+        # Endpoints edit the map in place; simulate a copy of what is read.
+        snapshot = CognitiveMapModel.model_construct(
+            nodes=list(cognitive_map.nodes),
+            edges=[edge.model_copy() for edge in cognitive_map.edges],
+            fcm=cognitive_map.fcm.model_copy(update={"scenarios": []}, deep=True),
+        )
+        return ExportPlan(
+            kind=kind,
+            cognitive_map=snapshot,
+            node_ids=node_ids,
+            scenario_ids=scenario_ids,
+            params=[
+                scenarios[sid].params.model_copy(deep=True) for sid in scenario_ids
+            ],
+            results=[scenarios[sid].result for sid in scenario_ids],
+        )
+
+    @staticmethod
+    def stream(plan: ExportPlan, export_format: ExportFormat) -> Iterator[bytes]:
+        """
+        Encoded export in chunks; iterate it from a worker thread.
+
+        Raises:
+            ValueError: If the format needs pyarrow and it is not installed
+        """
+        if export_format == "csv":
+            return _stream_csv(plan)
+        if not ARROW_AVAILABLE:
+            raise ValueError(
+                f"Export as {export_format} requires pyarrow, which is not installed"
+            )
+        return _stream_arrow(plan, export_format)
+
+
+def _final_rows(plan: ExportPlan) -> Iterator[_Rows]:
+    for position, result in enumerate(plan.results):
+        if result is None:
+            continue
+        states = result.final_states
+        present = [i for i, node_id in enumerate(plan.node_ids) if node_id in states]
+        yield _Rows(
+            scenario=np.full(len(present), position, dtype=np.int32),
+            iteration=np.full(len(present), result.iterations_count, dtype=np.int64),
+            node=np.asarray(present, dtype=np.int32),
+            state=np.fromiter(
+                (states[plan.node_ids[i]] for i in present),
+                dtype=np.float64,
+                count=len(present),
+            ),
+        )
+
+
+def _history_rows(plan: ExportPlan) -> Iterator[_Rows]:
+    for position, params in enumerate(plan.params):
+        iteration = 0
+        for _, block in ScenarioService.iterate_history(plan.cognitive_map, params):
+            n, steps = block.shape
+            yield _Rows(
+                scenario=np.full(n * steps, position, dtype=np.int32),
+                iteration=np.repeat(
+                    np.arange(iteration, iteration + steps, dtype=np.int64), n
+                ),
+                node=np.tile(np.arange(n, dtype=np.int32), steps),
+                # Iteration-major: all nodes of one iteration are adjacent.
+                state=block.T.ravel(),
+            )
+            iteration += steps
+
+
+def _chunks(plan: ExportPlan) -> Iterator[_Rows]:
+    """Rows regrouped into chunks of at least ROWS_PER_CHUNK (but the last)."""
+    rows = _history_rows(plan) if plan.kind == "history" else _final_rows(plan)
+    pending: List[_Rows] = []
+    count = 0
+    for part in rows:
+        pending.append(part)
+        count += len(part.state)
+        if count >= ROWS_PER_CHUNK:
+            yield _concat(pending)
+            pending, count = [], 0
+    if pending:
+        yield _concat(pending)
+
+
+def _concat(parts: List[_Rows]) -> _Rows:
+    if len(parts) == 1:
+        return parts[0]
+    return _Rows(
+        *(np.concatenate([getattr(p, f) for p in parts]) for f in _Rows.__annotations__)
+    )
+
+
+def _stream_csv(plan: ExportPlan) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue().encode("utf-8")
+
+    scenario_ids, node_ids = plan.scenario_ids, plan.node_ids
+    for chunk in _chunks(plan):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            zip(
+                [scenario_ids[i] for i in chunk.scenario.tolist()],
+                chunk.iteration.tolist(),
+                [node_ids[i] for i in chunk.node.tolist()],
+                # repr of a float round-trips exactly.
+                chunk.state.tolist(),
+            )
+        )
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _stream_arrow(plan: ExportPlan, export_format: ExportFormat) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    # Ids are dictionary-encoded against the full lists, which stay the same
+    # for every batch of the export.
+    scenario_dictionary = pa.array(plan.scenario_ids, type=pa.string())
+    node_dictionary = pa.array(plan.node_ids, type=pa.string())
+    schema = pa.schema(
+        [
+            ("scenario_id", pa.dictionary(pa.int32(), pa.string())),
+            ("iteration", pa.int64()),
+            ("node_id", pa.dictionary(pa.int32(), pa.string())),
+            ("state", pa.float64()),
+        ]
+    )
+
+    sink = _ChunkSink()
+    if export_format == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(sink, schema)
+        write = writer.write_batch
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+
+    with writer:
+        for chunk in _chunks(plan):
+            batch = pa.record_batch(
+                [
+                    pa.DictionaryArray.from_arrays(
+                        pa.array(chunk.scenario), scenario_dictionary
+                    ),
+                    pa.array(chunk.iteration),
+                    pa.DictionaryArray.from_arrays(
+                        pa.array(chunk.node), node_dictionary
+                    ),
+                    pa.array(chunk.state),
+                ],
+                schema=schema,
+            )
+            write(batch)
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,375 @@
+"""
+Search for interventions: initial states of chosen control nodes that push
+the goal nodes (by default those with a preferred_state) in their preferred
+directions.
+
+A candidate's score is the mean over the goals of its final state signed by
+the preferred direction (+1 increase, -1 decrease), so higher is better. The
+search is a seeded cross-entropy method with several independent restarts:
+every generation samples candidates around the current mean of each
+restart, simulates all of them together as the columns of one state matrix,
+and refits the mean and spread of each restart to its best share.
+
+Candidates stay within state_range. With a budget, the total absolute change
+of the control nodes from the base scenario is at most the budget: a
+candidate beyond it is moved back towards the base state.
+
+The batched simulation sums each target's inputs in source order, like the
+engines, so a saved intervention reproduces its reported states.
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+
+from app.models.cognitive_map_models import CognitiveMapModel, ScenarioParams
+from app.services.scenario_service import ScenarioService
+from app.services.simulation_engine import EdgeArrays, apply_activation
+from app.storage.interned_graph import InternedGraph
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+DIRECTIONS = {"increase": 1.0, "decrease": -1.0}
+
+# Edge-candidate products per simulated block, to bound temporary arrays.
+BLOCK_ELEMENTS = 1 << 22
+# Share of each restart's candidates the next generation is fitted to.
+ELITE_FRACTION = 0.2
+# Weight of the new fit against the previous mean and spread.
+SMOOTHING = 0.7
+# A restart whose spread fell below this share of the state range stopped
+# exploring; the search ends once all have.
+MIN_SPREAD = 1e-3
+# Candidates closer than this share of the state range (in every control
+# node) count as the same intervention in the ranking.
+DISTINCT = 0.01
+
+# Called with (generations done, total generations); it may raise to stop.
+ProgressCallback = Callable[[int, int], None]
+
+
+class Intervention(BaseModel):
+    rank: int
+    score: float
+    # Score minus that of the base scenario.
+    improvement: float
+    # Initial states of the control nodes.
+    controls: Dict[str, float]
+    goal_states: Dict[str, float]
+    iterations_count: int
+    converged: bool
+    # Ready to save as a scenario.
+    params: ScenarioParams
+
+
+class InterventionSearchResult(BaseModel):
+    goals: Dict[str, float]
+    control_node_ids: List[str]
+    baseline_score: float
+    baseline_goal_states: Dict[str, float]
+    generations: int
+    evaluations: int
+    interventions: List[Intervention]
+
+
+@dataclass
+class SearchProblem:
+    """What the search needs from the map, copied so it can run in a thread."""
+
+    node_ids: List[str]
+    edges: EdgeArrays
+    params: ScenarioParams
+    activation_type: str
+    lambda_param: float
+    state_range: Tuple[float, float]
+    base_state: np.ndarray
+    controls: np.ndarray
+    goals: np.ndarray
+    directions: np.ndarray
+    budget: Optional[float]
+
+
+def simulate_batch(
+    problem: SearchProblem, initial: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Simulate the columns of `initial` (n_nodes, batch) with the problem's
+    parameters.
+
+    Returns:
+        (final states, iterations per column, converged per column); fixed
+        mode counts as converged like in ScenarioService
+    """
+    params = problem.params
+    edges = problem.edges
+    batch = initial.shape[1]
+    # np.add.at adds in index order, i.e. per target in source order.
+    order = np.lexsort((edges.source, edges.target))
+    source = edges.source[order]
+    target = edges.target[order]
+    weight = edges.weight[order][:, None]
+    auto = params.iteration_mode == "auto"
+
+    state = np.array(initial, dtype=np.float64)
+    iterations = np.full(batch, params.max_iterations, dtype=np.int64)
+    converged = np.full(batch, not auto)
+    # Columns still iterating.
+    active = np.arange(batch)
+
+    for iteration in range(1, params.max_iterations + 1):
+        x = state[:, active]
+        inputs = np.zeros_like(x)
+        np.add.at(inputs, target, weight * x[source])
+        new = apply_activation(
+            inputs, problem.activation_type, problem.lambda_param, problem.state_range
+        )
+        state[:, active] = new
+
+        if auto:
+            change = np.abs(new - x).max(axis=0, initial=0.0)
+            done = change < params.convergence_threshold
+            iterations[active[done]] = iteration
+            converged[active[done]] = True
+            active = active[~done]
+        elif np.array_equal(new, x):
+            # A fixed point: the remaining iterations change nothing.
+            break
+        if not active.size:
+            break
+
+    return state, iterations, converged
+
+
+class InterventionService:
+    """Service for searching initial states that favour the goal nodes."""
+
+    @staticmethod
+    def prepare(
+        cognitive_map: CognitiveMapModel,
+        params: ScenarioParams,
+        control_node_ids: Sequence[str],
+        goal_node_ids: Optional[Sequence[str]] = None,
+        budget: Optional[float] = None,
+        interned: Optional[InternedGraph] = None,
+    ) -> SearchProblem:
+        """
+        Args:
+            params: The base scenario; its initial states are kept for the
+                other nodes and are the reference of the budget
+            control_node_ids: Nodes whose initial states are searched
+            goal_node_ids: Nodes to push in their preferred directions; all
+                nodes with a preferred_state if None
+            budget: Maximum total absolute change of the control nodes
+            interned: The map's interned graph, built if not given
+
+        Raises:
+            ValueError: If a node is unknown or lacks a preferred_state, or
+                there are no goals
+        """
+        interned = interned or InternedGraph.build(cognitive_map)
+        index = interned.index
+        ScenarioService.validate_initial_states(
+            params.initial_states, index, cognitive_map.fcm.state_range
+        )
+        base_state = np.zeros(interned.size)
+        for node_id, value in params.initial_states.items():
+            base_state[index[node_id]] = value
+
+        unknown = [i for i in control_node_ids if i not in index]
+        if unknown:
+            raise ValueError(f"Unknown control nodes: {', '.join(unknown)}")
+        if len(set(control_node_ids)) != len(control_node_ids):
+            raise ValueError("Control nodes must be distinct")
+
+        preferred = {
+            node.id: DIRECTIONS[node.preferred_state]
+            for node in cognitive_map.nodes
+            if node.preferred_state is not None
+        }
+        if goal_node_ids is None:
+            goal_node_ids = list(preferred)
+        missing = [i for i in goal_node_ids if i not in preferred]
+        if missing:
+            raise ValueError(
+                f"Goal nodes without a preferred_state: {', '.join(missing)}"
+            )
+        if not goal_node_ids:
+            raise ValueError("No goal nodes: set a preferred_state on some nodes")
+
+        return SearchProblem(
+            node_ids=interned.node_ids,
+            edges=ScenarioService.build_edge_arrays(interned, params.use_confidence),
+            params=params.model_copy(deep=True),
+            activation_type=params.activation_type,
+            lambda_param=cognitive_map.fcm.activation.lambda_,
+            state_range=tuple(cognitive_map.fcm.state_range),
+            base_state=base_state,
+            controls=np.array([index[i] for i in control_node_ids], dtype=np.int64),
+            goals=np.array([index[i] for i in goal_node_ids], dtype=np.int64),
+            directions=np.array([preferred[i] for i in goal_node_ids]),
+            budget=budget,
+        )
+
+    @staticmethod
+    def search(
+        problem: SearchProblem,
+        population: int = 64,
+        restarts: int = 4,
+        generations: int = 30,
+        top: int = 5,
+        seed: int = 0,
+        on_progress: Optional[ProgressCallback] = None,
+    ) -> InterventionSearchResult:
+        """
+        Run the cross-entropy search and rank the best distinct candidates.
+
+        Args:
+            population: Candidates per restart and generation
+            restarts: Independent searches, evaluated together
+            generations: Maximum number of generations
+            top: Interventions returned
+            seed: Seed of the random generator; the same seed gives the same
+                result
+        """
+        rng = np.random.default_rng(seed)
+        low, high = problem.state_range
+        width = high - low
+        k = len(problem.controls)
+        base = problem.base_state[problem.controls]
+        elite = max(1, math.ceil(population * ELITE_FRACTION))
+
+        # Restart 0 starts at the base scenario, the others anywhere.
+        mean = rng.uniform(low, high, size=(restarts, k))
+        mean[0] = base
+        mean = InterventionService._within_budget(problem, mean)
+        spread = np.full((restarts, k), width / 2)
+
+        kept = max(20 * top, 200)
+        archive = np.empty((0, k))
+        archive_scores = np.empty(0)
+        evaluations = 0
+        generation = 0
+
+        while generation < generations:
+            samples = mean[:, None, :] + spread[:, None, :] * rng.standard_normal(
+                (restarts, population, k)
+            )
+            candidates = InterventionService._within_budget(
+                problem, np.clip(samples, low, high).reshape(-1, k)
+            )
+            scores = InterventionService._scores(problem, candidates)
+            evaluations += len(candidates)
+            generation += 1
+
+            by_restart = scores.reshape(restarts, population)
+            best = np.argsort(-by_restart, axis=1, kind="stable")[:, :elite]
+            fitted = np.take_along_axis(
+                candidates.reshape(restarts, population, k), best[:, :, None], axis=1
+            )
+            mean = SMOOTHING * fitted.mean(axis=1) + (1 - SMOOTHING) * mean
+            spread = SMOOTHING * fitted.std(axis=1) + (1 - SMOOTHING) * spread
+
+            archive = np.concatenate([archive, candidates])
+            archive_scores = np.concatenate([archive_scores, scores])
+            order = np.argsort(-archive_scores, kind="stable")[:kept]
+            archive, archive_scores = archive[order], archive_scores[order]
+
+            if on_progress is not None:
+                on_progress(generation, generations)
+            if spread.max() < MIN_SPREAD * width:
+                break
+
+        # The means are where the restarts ended up; they may beat every sample.
+        means = InterventionService._within_budget(problem, mean)
+        archive = np.concatenate([archive, means])
+        archive_scores = np.concatenate(
+            [archive_scores, InterventionService._scores(problem, means)]
+        )
+        evaluations += len(means)
+
+        chosen: List[int] = []
+        for i in np.argsort(-archive_scores, kind="stable").tolist():
+            if all(
+                np.abs(archive[i] - archive[j]).max() > DISTINCT * width for j in chosen
+            ):
+                chosen.append(i)
+                if len(chosen) == top:
+                    break
+
+        # Final runs of the ranked candidates and the base scenario.
+        initial = np.repeat(problem.base_state[:, None], len(chosen) + 1, axis=1)
+        initial[problem.controls, 1:] = archive[chosen].T
+        final, iterations, converged = simulate_batch(problem, initial)
+        goal_ids = [problem.node_ids[i] for i in problem.goals.tolist()]
+        control_ids = [problem.node_ids[i] for i in problem.controls.tolist()]
+        goal_states = final[problem.goals]
+        scores = problem.directions @ goal_states / len(problem.goals)
+
+        base_params = problem.params
+        interventions = []
+        for rank in range(1, len(chosen) + 1):
+            controls = dict(zip(control_ids, initial[problem.controls, rank].tolist()))
+            initial_states = {**base_params.initial_states, **controls}
+            changes = ", ".join(f"{i}={v:.3g}" for i, v in controls.items())
+            interventions.append(
+                Intervention(
+                    rank=rank,
+                    score=float(scores[rank]),
+                    improvement=float(scores[rank] - scores[0]),
+                    controls=controls,
+                    goal_states=dict(zip(goal_ids, goal_states[:, rank].tolist())),
+                    iterations_count=int(iterations[rank]),
+                    converged=bool(converged[rank]),
+                    params=base_params.model_copy(
+                        update={
+                            "name": f"{base_params.name} - intervention {rank}",
+                            "description": f"Searched intervention: {changes}",
+                            "initial_states": initial_states,
+                        }
+                    ),
+                )
+            )
+
+        return InterventionSearchResult(
+            goals=dict(zip(goal_ids, problem.directions.tolist())),
+            control_node_ids=control_ids,
+            baseline_score=float(scores[0]),
+            baseline_goal_states=dict(zip(goal_ids, goal_states[:, 0].tolist())),
+            generations=generation,
+            evaluations=evaluations,
+            interventions=interventions,
+        )
+
+    @staticmethod
+    def _within_budget(problem: SearchProblem, candidates: np.ndarray) -> np.ndarray:
+        """Scale each row's change from the base state down to the budget."""
+        if problem.budget is None:
+            return candidates
+        base = problem.base_state[problem.controls]
+        change = candidates - base
+        total = np.abs(change).sum(axis=1, keepdims=True)
+        scale = np.minimum(1.0, problem.budget / np.maximum(total, 1e-300))
+        # Between the base state and an in-range candidate; the clip only
+        # absorbs rounding.
+        return np.clip(base + change * scale, *problem.state_range)
+
+    @staticmethod
+    def _scores(problem: SearchProblem, candidates: np.ndarray) -> np.ndarray:
+        """Scores of the control states in the rows of `candidates`."""
+        n = len(problem.base_state)
+        columns = max(1, BLOCK_ELEMENTS // max(len(problem.edges.source), n, 1))
+        scores = np.empty(len(candidates))
+        for start in range(0, len(candidates), columns):
+            block = candidates[start : start + columns]
+            initial = np.repeat(problem.base_state[:, None], len(block), axis=1)
+            initial[problem.controls] = block.T
+            final, _, _ = simulate_batch(problem, initial)
+            scores[start : start + len(block)] = (
+                problem.directions @ final[problem.goals] / len(problem.goals)
+            )
+        return scores
@@ -0,0 +1,216 @@
+"""
+Background jobs for work that outlives its request (layouts, long analyses).
+
+A job is a coroutine run as an asyncio task. Its heavy part goes to a worker
+thread with asyncio.to_thread and talks back through the Job: report() for
+progress and intermediate data, check_cancelled() to stop early. Clients
+poll the job or follow its events as NDJSON.
+
+Jobs live in the process that started them; with several workers a client
+has to reach the same one (the default single-process backend always does).
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Literal, Optional, Set
+
+from pydantic import BaseModel
+
+from core.instrumentation import counter, gauge, histogram
+
+logger = logging.getLogger("app")
+
+JobStatus = Literal["running", "done", "failed", "cancelled"]
+
+JOBS_RUNNING = gauge("background_jobs_running", "Background jobs still running")
+JOBS_FINISHED = counter(
+    "background_jobs_finished", "Finished background jobs", ("kind", "status")
+)
+JOB_DURATION = histogram(
+    "background_job_duration_seconds", "Wall time of background jobs", ("kind",)
+)
+
+# Events kept per subscriber; a slow reader loses the oldest progress events,
+# never the final status.
+EVENT_QUEUE_SIZE = 64
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobInfo(BaseModel):
+    id: str
+    kind: str
+    status: JobStatus
+    progress: float
+    message: Optional[str] = None
+    created: str
+    finished: Optional[str] = None
+    error: Optional[str] = None
+    result: Optional[Any] = None
+
+
+class Job:
+    def __init__(self, kind: str, loop: asyncio.AbstractEventLoop):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status: JobStatus = "running"
+        self.progress = 0.0
+        self.message: Optional[str] = None
+        self.created = datetime.now().isoformat()
+        self.finished: Optional[str] = None
+        self.error: Optional[str] = None
+        self.result: Any = None
+        self.task: Optional[asyncio.Task] = None
+
+        self._loop = loop
+        self._cancel = threading.Event()
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancelled(self) -> None:
+        """Raise JobCancelled if the job was cancelled; call it between steps."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def report(
+        self, progress: float, message: Optional[str] = None, data: Any = None
+    ) -> None:
+        """
+        Record progress (0..1) and notify followers; safe from worker threads.
+
+        Args:
+            data: Optional JSON-serializable payload (e.g. intermediate results)
+                sent with this event only
+        """
+        self.progress = min(max(progress, 0.0), 1.0)
+        if message is not None:
+            self.message = message
+        event = {"type": "progress", "progress": self.progress}
+        if self.message is not None:
+            event["message"] = self.message
+        if data is not None:
+            event["data"] = data
+        self._loop.call_soon_threadsafe(self._emit, event)
+
+    def info(self) -> JobInfo:
+        return JobInfo(
+            id=self.id,
+            kind=self.kind,
+            status=self.status,
+            progress=self.progress,
+            message=self.message,
+            created=self.created,
+            finished=self.finished,
+            error=self.error,
+            result=self.result,
+        )
+
+    def _status_event(self) -> dict:
+        return {"type": "status", **self.info().model_dump(exclude_none=True)}
+
+    def _emit(self, event: dict) -> None:
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def _finish(self, status: JobStatus) -> None:
+        self.status = status
+        self.finished = datetime.now().isoformat()
+        if status == "done":
+            self.progress = 1.0
+        self._emit(self._status_event())
+
+    async def events(self) -> AsyncIterator[dict]:
+        """The current status, then progress events up to the final status."""
+        queue: asyncio.Queue = asyncio.Queue(EVENT_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        try:
+            event = self._status_event()
+            yield event
+            # Follows the queue rather than self.status: a job finishing while
+            # the first event is consumed has its final status queued.
+            while event["type"] != "status" or event["status"] == "running":
+                event = await queue.get()
+                yield event
+        finally:
+            self._subscribers.discard(queue)
+
+
+class JobManager:
+    def __init__(self, max_finished: int = 50):
+        self.max_finished = max_finished
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+
+        JOBS_RUNNING.callback = lambda: sum(
+            1 for job in self.jobs.values() if job.status == "running"
+        )
+
+    def start(self, kind: str, work: Callable[[Job], Awaitable[Any]]) -> Job:
+        """
+        Run work(job) in the background. Its return value becomes the job's
+        result; ValueError and JobCancelled end it as failed / cancelled.
+        """
+        job = Job(kind, asyncio.get_running_loop())
+        job.task = asyncio.create_task(self._run(job, work))
+        self.jobs[job.id] = job
+        self._prune()
+        return job
+
+    async def _run(self, job: Job, work: Callable[[Job], Awaitable[Any]]) -> None:
+        start = time.perf_counter()
+        try:
+            job.result = await work(job)
+            status: JobStatus = "done"
+        except (JobCancelled, asyncio.CancelledError):
+            status = "cancelled"
+        except ValueError as e:
+            job.error = str(e)
+            status = "failed"
+        except Exception as e:
+            logger.error("Background job %s (%s) failed: %s", job.id, job.kind, e)
+            job.error = str(e)
+            status = "failed"
+        job._finish(status)
+        JOB_DURATION.labels(job.kind).observe(time.perf_counter() - start)
+        JOBS_FINISHED.labels(job.kind, status).inc()
+        logger.info("Background job %s (%s) %s", job.id, job.kind, status)
+
+    def _prune(self) -> None:
+        finished = [i for i, job in self.jobs.items() if job.status != "running"]
+        for job_id in finished[: max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def list(self) -> List[JobInfo]:
+        return [job.info() for job in self.jobs.values()]
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Ask a running job to stop. Worker threads stop at their next
+        check_cancelled(); the coroutine is cancelled at its current await.
+        """
+        job = self.jobs.get(job_id)
+        if job is not None and job.status == "running":
+            job._cancel.set()
+            job.task.cancel()
+        return job
+
+    async def shutdown(self) -> None:
+        running = [job for job in self.jobs.values() if job.status == "running"]
+        for job in running:
+            self.cancel(job.id)
+        if running:
+            await asyncio.gather(*(job.task for job in running), return_exceptions=True)
@@ -0,0 +1,307 @@
+"""
+Node layouts computed with numpy, for maps too large to lay out in the
+renderer.
+
+"force" is a Fruchterman-Reingold layout. Repulsion is exact between nodes
+in the same or neighbouring cells of a coarse grid (about 3·sqrt(n) cells)
+and goes through the cell centroids beyond that, so an iteration costs
+O(n·sqrt(n)) instead of O(n²).
+
+"hierarchical" stacks the nodes in bands by their MetricsService class:
+drivers on top, then mediators, receivers and isolated nodes. Inside a band
+the most driving nodes (out-degree minus in-degree) come first, and each row
+is ordered by the barycenter of its neighbours to reduce crossings.
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel
+
+from app.models.cognitive_map_models import CognitiveMapModel
+from app.services.metrics_service import MetricsService
+from app.storage.interned_graph import InternedGraph
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+LayoutAlgorithm = Literal["force", "hierarchical"]
+
+BANDS = {"driver": 0, "mediator": 1, "receiver": 2, "isolated": 3}
+
+# Row ordering passes of the hierarchical layout.
+BARYCENTER_SWEEPS = 8
+
+# Pull towards the centroid, which keeps disconnected parts together; with
+# this value n nodes settle in a disk of radius about spacing·sqrt(2n).
+GRAVITY = 0.5
+
+# Node pairs per block in the far-field step, to bound temporary arrays.
+BLOCK_ELEMENTS = 1 << 20
+
+# Called with the step number and the current positions (n, 2); it may raise
+# to stop the layout.
+StepCallback = Callable[[int, "np.ndarray"], None]
+
+
+@dataclass
+class LayoutGraph:
+    """What a layout needs from the map, copied so it can run in a thread."""
+
+    node_ids: List[str]
+    xy: np.ndarray
+    source: np.ndarray
+    target: np.ndarray
+    weight: np.ndarray
+    node_types: List[str]
+
+
+class LayoutResult(BaseModel):
+    algorithm: LayoutAlgorithm
+    nodes: int
+    steps: int
+    # Hash of the map with the new positions.
+    map_hash: str
+
+
+class LayoutService:
+    """Service for computing node positions."""
+
+    @staticmethod
+    def prepare(
+        cognitive_map: CognitiveMapModel, interned: Optional[InternedGraph] = None
+    ) -> LayoutGraph:
+        """
+        Args:
+            interned: The map's interned graph (from the store), built if
+                not given
+        """
+        interned = interned or InternedGraph.build(cognitive_map)
+        node_types = MetricsService.node_types(cognitive_map, interned)
+        edges = interned.source != interned.target
+        return LayoutGraph(
+            node_ids=interned.node_ids,
+            xy=np.array(
+                [(node.ui.x, node.ui.y) for node in cognitive_map.nodes],
+                dtype=np.float64,
+            ).reshape(-1, 2),
+            source=interned.source[edges],
+            target=interned.target[edges],
+            weight=np.abs(interned.weight[edges]),
+            node_types=[node_types[node_id] for node_id in interned.node_ids],
+        )
+
+    @staticmethod
+    def force_directed(
+        graph: LayoutGraph,
+        iterations: int = 200,
+        spacing: float = 120.0,
+        seed: int = 0,
+        on_step: Optional[StepCallback] = None,
+    ) -> np.ndarray:
+        """
+        Positions after `iterations` force-directed steps, starting from the
+        current ones (or random ones if the nodes are all in one spot).
+
+        Args:
+            spacing: Ideal edge length in layout units
+            on_step: Called after every iteration
+        """
+        n = len(graph.node_ids)
+        xy = graph.xy.copy()
+        if n < 2:
+            return xy
+
+        rng = np.random.default_rng(seed)
+        radius = spacing * math.sqrt(n)
+        if np.ptp(xy, axis=0).max() < spacing:
+            xy = xy.mean(axis=0) + rng.uniform(-radius, radius, size=(n, 2))
+        else:
+            # Nodes stacked on the same spot would get no repulsion direction.
+            xy += rng.normal(scale=1e-3 * spacing, size=(n, 2))
+
+        grid = max(1, round(math.sqrt(3 * math.sqrt(n))))
+        start_temperature = radius / 10
+        for step in range(iterations):
+            disp = _repulsion(xy, spacing, grid)
+
+            delta = xy[graph.source] - xy[graph.target]
+            distance = np.sqrt((delta**2).sum(axis=1))
+            # Attraction d²/k along the edge, scaled by |weight|.
+            pull = delta * (distance * graph.weight / spacing)[:, None]
+            for axis in range(2):
+                disp[:, axis] -= np.bincount(
+                    graph.source, weights=pull[:, axis], minlength=n
+                )
+                disp[:, axis] += np.bincount(
+                    graph.target, weights=pull[:, axis], minlength=n
+                )
+            disp -= GRAVITY * (xy - xy.mean(axis=0))
+
+            temperature = start_temperature * (1 - step / iterations)
+            length = np.sqrt((disp**2).sum(axis=1))
+            scale = np.minimum(length, temperature) / np.maximum(length, 1e-12)
+            xy += disp * scale[:, None]
+
+            if on_step is not None:
+                on_step(step + 1, xy)
+        return xy
+
+    @staticmethod
+    def hierarchical(
+        graph: LayoutGraph,
+        spacing: float = 120.0,
+        sweeps: int = BARYCENTER_SWEEPS,
+        on_step: Optional[StepCallback] = None,
+    ) -> np.ndarray:
+        """
+        Banded layout by node class, anchored at the top-left corner of the
+        current positions.
+
+        Args:
+            spacing: Distance between neighbouring nodes in a row
+            sweeps: Barycenter ordering passes; on_step is called after each
+        """
+        n = len(graph.node_ids)
+        if n == 0:
+            return graph.xy.copy()
+
+        band = np.array([BANDS[t] for t in graph.node_types], dtype=np.int64)
+        drive = np.bincount(graph.source, minlength=n) - np.bincount(
+            graph.target, minlength=n
+        )
+        width = max(1, math.ceil(2 * math.sqrt(n)))
+
+        # Rows: each band is filled in order of drive, `width` nodes per row.
+        order = np.lexsort((np.arange(n), -drive, band))
+        band_sizes = np.bincount(band, minlength=len(BANDS))
+        band_starts = np.cumsum(band_sizes) - band_sizes
+        band_rows = -(-band_sizes // width)
+        row_offsets = np.cumsum(band_rows) - band_rows
+        position_in_band = np.arange(n) - band_starts[band[order]]
+        row = np.empty(n, dtype=np.int64)
+        row[order] = row_offsets[band[order]] + position_in_band // width
+
+        row_sizes = np.bincount(row)
+        row_starts = np.cumsum(row_sizes) - row_sizes
+        column = np.empty(n, dtype=np.int64)
+        column[order] = np.arange(n) - row_starts[row[order]]
+
+        degree = np.bincount(graph.source, minlength=n) + np.bincount(
+            graph.target, minlength=n
+        )
+        for sweep in range(sweeps):
+            centered = column - (row_sizes[row] - 1) / 2
+            total = np.bincount(
+                graph.source, weights=centered[graph.target], minlength=n
+            ) + np.bincount(graph.target, weights=centered[graph.source], minlength=n)
+            barycenter = np.where(degree > 0, total / np.maximum(degree, 1), centered)
+            order = np.lexsort((barycenter, row))
+            column[order] = np.arange(n) - row_starts[row[order]]
+            if on_step is not None:
+                on_step(sweep + 1, _grid_positions(graph, row, band, column, spacing))
+
+        return _grid_positions(graph, row, band, column, spacing)
+
+    @staticmethod
+    def positions(graph: LayoutGraph, xy: np.ndarray) -> Dict[str, List[float]]:
+        """Positions by node id, rounded for sending to the client."""
+        return dict(zip(graph.node_ids, np.round(xy, 1).tolist()))
+
+    @staticmethod
+    def apply(
+        cognitive_map: CognitiveMapModel, positions: Dict[str, Tuple[float, float]]
+    ) -> CognitiveMapModel:
+        """
+        A copy of the map with new node positions. Nodes missing from
+        `positions` (e.g. added while the layout ran) keep theirs.
+        """
+        nodes = []
+        for node in cognitive_map.nodes:
+            position = positions.get(node.id)
+            if position is not None:
+                x, y = position
+                node = node.model_copy(
+                    update={"ui": node.ui.model_copy(update={"x": x, "y": y})}
+                )
+            nodes.append(node)
+        return cognitive_map.model_copy(update={"nodes": nodes})
+
+
+def _grid_positions(
+    graph: LayoutGraph,
+    row: np.ndarray,
+    band: np.ndarray,
+    column: np.ndarray,
+    spacing: float,
+) -> np.ndarray:
+    row_sizes = np.bincount(row)
+    # Rows are 1.5 spacings apart, with an extra spacing between bands.
+    x = (column - (row_sizes[row] - 1) / 2) * spacing
+    y = row * 1.5 * spacing + band * spacing
+    xy = np.stack([x - x.min(), y], axis=1)
+    return xy + graph.xy.min(axis=0)
+
+
+def _repulsion(xy: np.ndarray, k: float, grid: int) -> np.ndarray:
+    """Fruchterman-Reingold repulsion k²/d on every node, grid-approximated."""
+    n = len(xy)
+    # Separate coordinate arrays index and broadcast much faster than (n, 2).
+    x, y = xy[:, 0].copy(), xy[:, 1].copy()
+    low = xy.min(axis=0)
+    cell_size = np.maximum(np.ptp(xy, axis=0) / grid, 1e-9)
+    cell = np.minimum(((xy - low) / cell_size).astype(np.int64), grid - 1)
+    cell_x, cell_y = cell[:, 0], cell[:, 1]
+    cell_id = cell_x * grid + cell_y
+
+    counts = np.bincount(cell_id, minlength=grid * grid)
+    order = np.argsort(cell_id, kind="stable")
+    starts = np.cumsum(counts) - counts
+    disp_x = np.zeros(n)
+    disp_y = np.zeros(n)
+
+    # Near field: exact pairs with the nodes of the 3x3 neighbouring cells.
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            nx, ny = cell_x + dx, cell_y + dy
+            i = np.flatnonzero((nx >= 0) & (nx < grid) & (ny >= 0) & (ny < grid))
+            neighbour_id = nx[i] * grid + ny[i]
+            m = counts[neighbour_id]
+            total = int(m.sum())
+            if not total:
+                continue
+            first = np.cumsum(m) - m
+            offset = np.arange(total) - np.repeat(first, m)
+            ii = np.repeat(i, m)
+            jj = order[np.repeat(starts[neighbour_id], m) + offset]
+            distinct = ii != jj
+            ii, jj = ii[distinct], jj[distinct]
+            delta_x = x[ii] - x[jj]
+            delta_y = y[ii] - y[jj]
+            push = k * k / np.maximum(delta_x * delta_x + delta_y * delta_y, 1e-9)
+            disp_x += np.bincount(ii, weights=delta_x * push, minlength=n)
+            disp_y += np.bincount(ii, weights=delta_y * push, minlength=n)
+
+    # Far field: every other occupied cell acts as its node count at its
+    # centroid.
+    occupied = np.flatnonzero(counts)
+    mass = counts[occupied].astype(np.float64)
+    centroid_x = np.bincount(cell_id, weights=x, minlength=grid * grid)[occupied] / mass
+    centroid_y = np.bincount(cell_id, weights=y, minlength=grid * grid)[occupied] / mass
+    occupied_x, occupied_y = occupied // grid, occupied % grid
+    block = max(1, BLOCK_ELEMENTS // len(occupied))
+    for begin in range(0, n, block):
+        rows = slice(begin, begin + block)
+        far = (np.abs(cell_x[rows, None] - occupied_x) > 1) | (
+            np.abs(cell_y[rows, None] - occupied_y) > 1
+        )
+        delta_x = x[rows, None] - centroid_x
+        delta_y = y[rows, None] - centroid_y
+        push = (k * k) * mass / np.maximum(delta_x * delta_x + delta_y * delta_y, 1e-9)
+        push *= far
+        disp_x[rows] += (delta_x * push).sum(axis=1)
+        disp_y[rows] += (delta_y * push).sum(axis=1)
+    return np.stack([disp_x, disp_y], axis=1)
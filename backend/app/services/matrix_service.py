@@ -1,12 +1,20 @@
+import math
 from typing import Optional
 from app.models.cognitive_map_models import CognitiveMapModel, EdgeModel
+from app.storage.interned_graph import InternedGraph
 
 
 class MatrixService:
 
     @staticmethod
-    def build_matrix(cognitive_map: CognitiveMapModel) -> dict:
+    def build_matrix(
+        cognitive_map: CognitiveMapModel, interned: Optional[InternedGraph] = None
+    ) -> dict:
         """
+        Args:
+            interned: The map's interned graph (from the store), built if
+                not given
+
         Returns:
             {
                 "nodes_order": List[str],  # Node IDs in order
@@ -14,7 +22,8 @@ class MatrixService:
                 "confidence": List[List[Optional[float]]]  # Confidence matrix
             }
         """
-        nodes_order = [n.id for n in cognitive_map.nodes]
+        interned = interned or InternedGraph.build(cognitive_map)
+        nodes_order = interned.node_ids
         n = len(nodes_order)
 
         matrix: list[list[Optional[float]]] = [
@@ -24,14 +33,16 @@ class MatrixService:
             [None for _ in range(n)] for _ in range(n)
         ]
 
-        node_index = {node_id: i for i, node_id in enumerate(nodes_order)}
-
-        for edge in cognitive_map.edges:
-            source_idx = node_index.get(edge.source)
-            target_idx = node_index.get(edge.target)
-            if source_idx is not None and target_idx is not None:
-                matrix[source_idx][target_idx] = edge.weight
-                confidence_matrix[source_idx][target_idx] = edge.confidence
+        for source_idx, target_idx, weight, confidence in zip(
+            interned.source.tolist(),
+            interned.target.tolist(),
+            interned.weight.tolist(),
+            interned.confidence.tolist(),
+        ):
+            matrix[source_idx][target_idx] = weight
+            confidence_matrix[source_idx][target_idx] = (
+                None if math.isnan(confidence) else confidence
+            )
 
         return {
             "nodes_order": nodes_order,
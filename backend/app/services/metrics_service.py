@@ -1,6 +1,10 @@
-from typing import Literal
+from typing import Dict, Literal, Optional
 from pydantic import BaseModel
 from app.models.cognitive_map_models import CognitiveMapModel
+from app.storage.interned_graph import InternedGraph
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
 
 
 NodeType = Literal["driver", "receiver", "mediator", "isolated"]
@@ -29,7 +33,15 @@ class MetricsResponse(BaseModel):
 class MetricsService:
 
     @staticmethod
-    def calculate_metrics(cognitive_map: CognitiveMapModel) -> MetricsResponse:
+    def calculate_metrics(
+        cognitive_map: CognitiveMapModel, interned: Optional[InternedGraph] = None
+    ) -> MetricsResponse:
+        """
+        Args:
+            interned: The map's interned graph (from the store), built if
+                not given
+        """
+        interned = interned or InternedGraph.build(cognitive_map)
         node_metrics_list: list[NodeMetrics] = []
 
         drivers = 0
@@ -37,17 +49,22 @@ class MetricsService:
         mediators = 0
         isolated = 0
 
-        for node in cognitive_map.nodes:
-            incoming_edges = [e for e in cognitive_map.edges if e.target == node.id]
-            indegree = len(incoming_edges)
-
-            outgoing_edges = [e for e in cognitive_map.edges if e.source == node.id]
-            outdegree = len(outgoing_edges)
-
-            weighted_indegree = sum(abs(edge.weight) for edge in incoming_edges)
-            weighted_outdegree = sum(abs(edge.weight) for edge in outgoing_edges)
-            centrality = weighted_indegree + weighted_outdegree
-
+        # Per node, summed in edge order like the per-node sums they replace.
+        abs_weight = np.abs(interned.weight)
+        weighted_indegree = np.bincount(
+            interned.target, weights=abs_weight, minlength=interned.size
+        )
+        weighted_outdegree = np.bincount(
+            interned.source, weights=abs_weight, minlength=interned.size
+        )
+        centralities = weighted_indegree + weighted_outdegree
+
+        for node_id, indegree, outdegree, centrality in zip(
+            interned.node_ids,
+            interned.indegree().tolist(),
+            interned.outdegree().tolist(),
+            centralities.tolist(),
+        ):
             node_type = MetricsService._classify_node_type(indegree, outdegree)
 
             if node_type == "driver":
@@ -60,7 +77,7 @@ class MetricsService:
                 isolated += 1
 
             metrics = NodeMetrics(
-                node_id=node.id,
+                node_id=node_id,
                 indegree=indegree,
                 outdegree=outdegree,
                 centrality=round(centrality, 2),
@@ -74,6 +91,21 @@ class MetricsService:
 
         return MetricsResponse(metrics=node_metrics_list, statistics=statistics)
 
+    @staticmethod
+    def node_types(
+        cognitive_map: CognitiveMapModel, interned: Optional[InternedGraph] = None
+    ) -> Dict[str, NodeType]:
+        """Driver/receiver/mediator/isolated class of every node, by id."""
+        interned = interned or InternedGraph.build(cognitive_map)
+        return {
+            node_id: MetricsService._classify_node_type(indegree, outdegree)
+            for node_id, indegree, outdegree in zip(
+                interned.node_ids,
+                interned.indegree().tolist(),
+                interned.outdegree().tolist(),
+            )
+        }
+
     @staticmethod
     def _classify_node_type(indegree: int, outdegree: int) -> NodeType:
         if indegree == 0 and outdegree == 0:
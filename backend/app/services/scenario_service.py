@@ -1,7 +1,14 @@
+from __future__ import annotations
+
 import logging
+import os
+import threading
+import time
 from datetime import datetime
-from typing import Dict, List, Tuple
-import numpy as np
+from typing import Callable, Collection, Dict, Iterator, List, Optional, Tuple
+
+from core.instrumentation import counter, histogram
+from core.lazy_import import lazy_import
 
 from app.models.cognitive_map_models import (
     CognitiveMapModel,
@@ -9,9 +16,78 @@ from app.models.cognitive_map_models import (
     ScenarioResult,
     EdgeModel,
 )
+from app.services.simulation_engine import EdgeArrays, iterate_states
+from app.storage.interned_graph import InternedGraph
+
+# numpy is only imported on the first simulation, which keeps it off the
+# backend's cold-start path.
+np = lazy_import("numpy")
 
 logger = logging.getLogger("app")
 
+# "condensed" (default) simulates strongly connected components in topological
+# order; "reference" is the original whole-vector iteration.
+SIMULATION_ENGINE = os.getenv("SIMULATION_ENGINE", "condensed")
+
+# Default wall-time budget of one run in seconds; 0 disables it.
+SIMULATION_TIME_BUDGET = float(os.getenv("SIMULATION_TIME_BUDGET", "30"))
+
+SIMULATION_DURATION = histogram(
+    "simulation_duration_seconds", "Wall time of ScenarioService.run_simulation"
+)
+SIMULATION_ITERATIONS = histogram(
+    "simulation_iterations",
+    "Iterations performed per simulation",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+SIMULATIONS_STOPPED = counter(
+    "simulations_stopped",
+    "Simulations stopped before max_iterations by reason (budget, cancelled)",
+    ("reason",),
+)
+
+
+class RunBudget:
+    """
+    Time budget and cancellation of one simulation run, checked by the
+    engine between chunks of iterations (every iteration in the reference
+    engine), plus an optional progress callback.
+    """
+
+    def __init__(
+        self,
+        seconds: Optional[float] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ):
+        self.seconds = SIMULATION_TIME_BUDGET if seconds is None else seconds
+        # Called with (iterations done, max_iterations).
+        self.on_progress = on_progress
+        self.deadline: Optional[float] = None
+        self._cancelled = threading.Event()
+
+    def start(self) -> None:
+        if self.seconds > 0:
+            self.deadline = time.monotonic() + self.seconds
+
+    def cancel(self) -> None:
+        """Stop the run at its next check; safe from any thread."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def stop_reason(self) -> Optional[str]:
+        if self._cancelled.is_set():
+            return "cancelled"
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return "budget"
+        return None
+
+    def report(self, done: int, total: int) -> None:
+        if self.on_progress is not None:
+            self.on_progress(done, total)
+
 
 def sigmoid(x: float, lambda_param: float = 1.0) -> float:
     return 1.0 / (1.0 + np.exp(-lambda_param * x))
@@ -27,7 +103,7 @@ class ScenarioService:
     @staticmethod
     def validate_initial_states(
         initial_states: Dict[str, float],
-        node_ids: List[str],
+        node_ids: Collection[str],
         state_range: Tuple[float, float],
     ) -> None:
         """
@@ -35,13 +111,16 @@ class ScenarioService:
 
         Args:
             initial_states: Dictionary of node_id -> initial_value
-            node_ids: List of valid node IDs
+            node_ids: Valid node IDs (a set or an id -> index dict is used
+                as is, other collections are turned into a set)
             state_range: Tuple of (min, max) for state values
 
         Raises:
             ValueError: If validation fails
         """
         min_val, max_val = state_range
+        if not isinstance(node_ids, (set, frozenset, dict)):
+            node_ids = set(node_ids)
 
         # Check that all node_ids in initial_states are valid
         for node_id in initial_states.keys():
@@ -77,6 +156,7 @@ class ScenarioService:
     def build_adjacency_matrix(
         cognitive_map: CognitiveMapModel,
         use_confidence: bool,
+        interned: Optional[InternedGraph] = None,
     ) -> Tuple[np.ndarray, Dict[str, int], Dict[int, str]]:
         """
         Build adjacency matrix from cognitive map.
@@ -84,37 +164,109 @@ class ScenarioService:
         Args:
             cognitive_map: The cognitive map model
             use_confidence: Whether to apply confidence to weights
+            interned: The map's interned graph, built if not given
 
         Returns:
             Tuple of (adjacency_matrix, node_id_to_index, index_to_node_id)
         """
-        nodes = cognitive_map.nodes
-        edges = cognitive_map.edges
+        interned = interned or InternedGraph.build(cognitive_map)
+        edges = ScenarioService.build_edge_arrays(interned, use_confidence)
 
-        # Create node ID mappings
-        node_id_to_index = {node.id: idx for idx, node in enumerate(nodes)}
-        index_to_node_id = {idx: node.id for idx, node in enumerate(nodes)}
+        adjacency_matrix = np.zeros((interned.size, interned.size))
+        adjacency_matrix[edges.source, edges.target] = edges.weight
 
-        # Initialize adjacency matrix
-        n = len(nodes)
-        adjacency_matrix = np.zeros((n, n))
+        return adjacency_matrix, interned.index, dict(enumerate(interned.node_ids))
 
-        # Fill adjacency matrix with edge weights
-        for edge in edges:
-            if edge.source in node_id_to_index and edge.target in node_id_to_index:
-                source_idx = node_id_to_index[edge.source]
-                target_idx = node_id_to_index[edge.target]
-                effective_weight = ScenarioService.get_effective_weight(
-                    edge, use_confidence
-                )
-                adjacency_matrix[source_idx, target_idx] = effective_weight
+    @staticmethod
+    def build_edge_arrays(interned: InternedGraph, use_confidence: bool) -> EdgeArrays:
+        """
+        Sparse counterpart of build_adjacency_matrix: one entry per
+        (source, target) with a non-zero effective weight, the last edge
+        winning for duplicates as in the matrix. Pairs are in order of
+        their first edge.
+        """
+        weight = interned.effective_weights(use_confidence)
+        pair = interned.source * max(interned.size, 1) + interned.target
+        # np.unique sorts by pair: `first` and `last` are aligned.
+        _, first = np.unique(pair, return_index=True)
+        _, last_reversed = np.unique(pair[::-1], return_index=True)
+        last = len(pair) - 1 - last_reversed
+
+        order = np.argsort(first)
+        first, last = first[order], last[order]
+        weight = weight[last]
+        nonzero = weight != 0.0
+        return EdgeArrays(
+            interned.source[first][nonzero],
+            interned.target[first][nonzero],
+            weight[nonzero],
+        )
 
-        return adjacency_matrix, node_id_to_index, index_to_node_id
+    @staticmethod
+    def _initial_state(
+        cognitive_map: CognitiveMapModel,
+        params: ScenarioParams,
+        interned: Optional[InternedGraph] = None,
+    ) -> Tuple[InternedGraph, np.ndarray]:
+        """
+        Validate the inputs and build the initial state vector.
+
+        Returns:
+            Tuple of (interned graph, initial state)
+        """
+        interned = interned or InternedGraph.build(cognitive_map)
+        index = interned.index
+
+        # Validate inputs
+        if not interned.size:
+            raise ValueError("Cannot run simulation on empty cognitive map")
+
+        ScenarioService.validate_initial_states(
+            params.initial_states,
+            index,
+            cognitive_map.fcm.state_range,
+        )
+
+        # Initialize state vector; nodes without an initial state start at 0
+        state = np.zeros(interned.size)
+        state[[index[node_id] for node_id in params.initial_states]] = list(
+            params.initial_states.values()
+        )
+
+        return interned, state
+
+    @staticmethod
+    def iterate_history(
+        cognitive_map: CognitiveMapModel,
+        params: ScenarioParams,
+        interned: Optional[InternedGraph] = None,
+    ) -> Iterator[Tuple[List[str], np.ndarray]]:
+        """
+        Simulate without collecting the history: yield (node_ids, block),
+        block being the states of consecutive iterations as columns, starting
+        with the initial state. Memory stays bounded by one chunk of
+        iterations, whatever max_iterations is.
+
+        Raises:
+            ValueError: If parameters are invalid
+        """
+        interned, state = ScenarioService._initial_state(
+            cognitive_map, params, interned
+        )
+        node_ids = interned.node_ids
+        yield node_ids, state[:, None]
+        for block, _ in ScenarioService._condensed_blocks(
+            cognitive_map, params, state, interned
+        ):
+            yield node_ids, block
 
     @staticmethod
     def run_simulation(
         cognitive_map: CognitiveMapModel,
         params: ScenarioParams,
+        engine: Optional[str] = None,
+        interned: Optional[InternedGraph] = None,
+        budget: Optional[RunBudget] = None,
     ) -> ScenarioResult:
         """
         Run FCM simulation with given parameters.
@@ -122,6 +274,11 @@ class ScenarioService:
         Args:
             cognitive_map: The cognitive map to simulate
             params: Simulation parameters
+            engine: "condensed" or "reference"; defaults to SIMULATION_ENGINE
+            interned: The map's interned graph, built if not given
+            budget: Time budget and cancellation; the server default
+                (SIMULATION_TIME_BUDGET) if not given. A run that runs out of
+                it returns the last state computed, flagged as truncated.
 
         Returns:
             ScenarioResult with final states and metadata
@@ -129,35 +286,94 @@ class ScenarioService:
         Raises:
             ValueError: If parameters are invalid
         """
-        # Validate inputs
-        node_ids = [node.id for node in cognitive_map.nodes]
+        started = time.perf_counter()
+        budget = budget or RunBudget()
+        budget.start()
 
-        if not node_ids:
-            raise ValueError("Cannot run simulation on empty cognitive map")
+        interned, state = ScenarioService._initial_state(
+            cognitive_map, params, interned
+        )
+        node_ids = interned.node_ids
 
-        ScenarioService.validate_initial_states(
-            params.initial_states,
-            node_ids,
-            cognitive_map.fcm.state_range,
+        if (engine or SIMULATION_ENGINE) == "reference":
+            history, state, iterations_count, converged, stopped = (
+                ScenarioService._simulate_reference(
+                    cognitive_map, params, state, interned, budget
+                )
+            )
+        else:
+            history, state, iterations_count, converged, stopped = (
+                ScenarioService._simulate_condensed(
+                    cognitive_map, params, state, interned, budget
+                )
+            )
+
+        if stopped is not None:
+            converged = False
+            SIMULATIONS_STOPPED.labels(stopped).inc()
+            logger.warning(
+                "Simulation stopped (%s) after %s of %s iterations",
+                stopped,
+                iterations_count,
+                params.max_iterations,
+            )
+        # Auto mode convergence status
+        elif params.iteration_mode == "auto":
+            if not converged:
+                logger.warning(
+                    "Simulation did not converge after %s iterations",
+                    params.max_iterations,
+                )
+        else:
+            # Fixed mode is always considered "converged" after completing iterations
+            converged = True
+
+        # Build final states dictionary
+        final_states = dict(zip(node_ids, state.tolist()))
+
+        # Create result with history
+        result = ScenarioResult(
+            final_states=final_states,
+            iterations_count=iterations_count,
+            converged=converged,
+            timestamp=datetime.utcnow().isoformat() + "Z",
+            truncated=True if stopped is not None else None,
+            history=history,  # Include iteration history
+        )
+
+        SIMULATION_DURATION.observe(time.perf_counter() - started)
+        SIMULATION_ITERATIONS.observe(iterations_count)
+
+        logger.info(
+            "Simulation completed: %s iterations, converged=%s, history_length=%s",
+            iterations_count,
+            converged,
+            len(history),
         )
 
-        # Check that initial_states contains all nodes
-        if len(params.initial_states) != len(node_ids):
-            for node in params.initial_states:
-                if node not in node_ids:
-                    params.initial_states[node] = 0.0  # Default to 0 for missing nodes
+        return result
+
+    @staticmethod
+    def _simulate_reference(
+        cognitive_map: CognitiveMapModel,
+        params: ScenarioParams,
+        state: np.ndarray,
+        interned: Optional[InternedGraph] = None,
+        budget: Optional[RunBudget] = None,
+    ) -> Tuple[List[Dict[str, float]], np.ndarray, int, bool, Optional[str]]:
+        """
+        Iterate the whole state vector against the dense adjacency matrix.
 
+        Returns:
+            Tuple of (history, final state, iterations_count, converged,
+            reason the budget stopped the run or None)
+        """
         # Build adjacency matrix
-        adjacency_matrix, node_id_to_index, index_to_node_id = (
-            ScenarioService.build_adjacency_matrix(cognitive_map, params.use_confidence)
+        adjacency_matrix, _, index_to_node_id = ScenarioService.build_adjacency_matrix(
+            cognitive_map, params.use_confidence, interned
         )
 
-        # Initialize state vector
-        n = len(node_ids)
-        state = np.zeros(n)
-        for node_id, value in params.initial_states.items():
-            idx = node_id_to_index[node_id]
-            state[idx] = value
+        n = len(state)
 
         # Select activation function
         lambda_param = cognitive_map.fcm.activation.lambda_
@@ -168,6 +384,7 @@ class ScenarioService:
 
         # Run simulation
         converged = False
+        stopped = None
         iterations_count = 0
         state_range = cognitive_map.fcm.state_range
 
@@ -215,31 +432,86 @@ class ScenarioService:
 
             state = new_state
 
-        # Auto mode convergence status
-        if params.iteration_mode == "auto":
-            if not converged:
-                logger.warning(
-                    f"Simulation did not converge after {params.max_iterations} iterations"
-                )
-        else:
-            # Fixed mode is always considered "converged" after completing iterations
-            converged = True
+            if budget is not None and iterations_count < params.max_iterations:
+                budget.report(iterations_count, params.max_iterations)
+                stopped = budget.stop_reason()
+                if stopped is not None:
+                    break
 
-        # Build final states dictionary
-        final_states = {index_to_node_id[idx]: float(state[idx]) for idx in range(n)}
+        return history, state, iterations_count, converged, stopped
 
-        # Create result with history
-        result = ScenarioResult(
-            final_states=final_states,
-            iterations_count=iterations_count,
-            converged=converged,
-            timestamp=datetime.utcnow().isoformat() + "Z",
-            history=history,  # Include iteration history
-        )
+    @staticmethod
+    def _simulate_condensed(
+        cognitive_map: CognitiveMapModel,
+        params: ScenarioParams,
+        state: np.ndarray,
+        interned: InternedGraph,
+        budget: Optional[RunBudget] = None,
+    ) -> Tuple[List[Dict[str, float]], np.ndarray, int, bool, Optional[str]]:
+        """
+        Simulate component by component (see simulation_engine); same
+        results as _simulate_reference. The budget is checked after every
+        chunk of iterations.
 
-        logger.info(
-            f"Simulation completed: {iterations_count} iterations, "
-            f"converged={converged}, history_length={len(history)}"
-        )
+        Returns:
+            Tuple of (history, final state, iterations_count, converged,
+            reason the budget stopped the run or None)
+        """
+        node_ids = interned.node_ids
+        history: List[Dict[str, float]] = [dict(zip(node_ids, state.tolist()))]
+        converged = False
+        stopped = None
+        iterations_count = 0
 
-        return result
+        for block, converged in ScenarioService._condensed_blocks(
+            cognitive_map, params, state, interned
+        ):
+            for column in block.T:
+                history.append(dict(zip(node_ids, column.tolist())))
+            iterations_count += block.shape[1]
+            state = block[:, -1].copy()
+
+            if (
+                budget is not None
+                and not converged
+                and iterations_count < params.max_iterations
+            ):
+                budget.report(iterations_count, params.max_iterations)
+                stopped = budget.stop_reason()
+                if stopped is not None:
+                    break
+
+        return history, state, iterations_count, converged, stopped
+
+    @staticmethod
+    def _condensed_blocks(
+        cognitive_map: CognitiveMapModel,
+        params: ScenarioParams,
+        state: np.ndarray,
+        interned: InternedGraph,
+    ) -> Iterator[Tuple[np.ndarray, bool]]:
+        """
+        Yield (block, converged) per chunk of iterations; in auto mode the
+        block that converges is cut after the converging iteration and ends
+        the simulation.
+        """
+        edges = ScenarioService.build_edge_arrays(interned, params.use_confidence)
+
+        chunks = iterate_states(
+            edges,
+            state,
+            params.activation_type,
+            cognitive_map.fcm.activation.lambda_,
+            cognitive_map.fcm.state_range,
+            params.max_iterations,
+        )
+        for block in chunks:
+            if params.iteration_mode == "auto":
+                previous = np.concatenate([state[:, None], block[:, :-1]], axis=1)
+                max_change = np.max(np.abs(block - previous), axis=0)
+                below = np.flatnonzero(max_change < params.convergence_threshold)
+                if below.size:
+                    yield block[:, : int(below[0]) + 1], True
+                    return
+            yield block, False
+            state = block[:, -1]
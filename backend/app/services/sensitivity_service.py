@@ -0,0 +1,320 @@
+"""
+Sensitivity of a scenario's final states to the edge weights.
+
+The tangent-linear model is propagated alongside the simulation. With
+z = W^T x the weighted inputs and x' = f(z), the derivatives of the states
+J = dx/dw (one column per edge) follow
+
+    dz/dw_e = W^T J + x[source_e] at row target_e
+    J'      = f'(z) dz/dw
+
+with J = 0 for the initial state and f' = 0 where the state is clipped to
+state_range. One run gives the whole d(final state)/d(weight) matrix, where
+finite differences would need a rerun per edge. The iteration count is
+that of the scenario (auto mode stops where the simulation converges).
+
+Every (source, target) pair is differentiated, zero weights included: an
+edge without influence today may matter most once it is given a weight.
+Derivatives are with respect to the edge's weight field, so with
+use_confidence they include the confidence factor.
+
+Results are cached under the simulation cache's key (node ids, edges, FCM
+settings and scenario parameters), so queries for other nodes or another
+k reuse them. A run is bounded by a RunBudget like a simulation: one that
+runs out of time reports the derivatives of the last state computed and is
+not cached.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, Field
+
+from app.models.cognitive_map_models import CognitiveMapModel, ScenarioParams
+from app.services.scenario_service import RunBudget, ScenarioService
+from app.services.simulation_cache import SimulationRequest
+from app.services.simulation_engine import apply_activation
+from app.storage.interned_graph import InternedGraph
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+# Nodes x edges limit of the sensitivity matrix (8 bytes per element).
+MAX_SENSITIVITY_ELEMENTS = 1 << 22
+# Edge-column products per block of the tangent update.
+BLOCK_ELEMENTS = 1 << 22
+CACHE_SIZE = 4
+
+
+class EdgeSensitivity(BaseModel):
+    source: str
+    target: str
+    weight: float
+    # Derivative of the node's final state with respect to the weight.
+    sensitivity: float
+
+
+class NodeSensitivity(BaseModel):
+    node_id: str
+    final_state: float
+    # Largest |sensitivity| first; edges without influence are left out.
+    edges: List[EdgeSensitivity]
+
+
+class SensitivityResponse(BaseModel):
+    iterations_count: int
+    converged: bool
+    # Differentiated edges, one per (source, target).
+    edge_count: int
+    nodes: List[NodeSensitivity]
+    truncated: Optional[bool] = Field(
+        default=None,
+        description="True if the run stopped at its time budget before "
+        "max_iterations; the derivatives are then those of the last state",
+    )
+    # With include_matrix: rows follow nodes, columns edge_order.
+    edge_order: Optional[List[Tuple[str, str]]] = None
+    matrix: Optional[List[List[float]]] = None
+
+
+@dataclass
+class SensitivityProblem:
+    """Inputs captured from the live map, so the run can go to a thread."""
+
+    key: str
+    interned: InternedGraph
+    params: ScenarioParams
+    lambda_param: float
+    state_range: Tuple[float, float]
+
+
+@dataclass
+class _Sensitivity:
+    # Edges in map order of the edge defining each pair.
+    source: np.ndarray
+    target: np.ndarray
+    weight: np.ndarray
+    final_state: np.ndarray
+    # (nodes, edges)
+    jacobian: np.ndarray
+    iterations_count: int
+    converged: bool
+    truncated: bool
+
+
+_results: OrderedDict[str, _Sensitivity] = OrderedDict()
+_results_lock = threading.Lock()
+
+
+def _differentiate(problem: SensitivityProblem, budget: RunBudget) -> _Sensitivity:
+    interned = problem.interned
+    params = problem.params
+    n = interned.size
+    low, high = problem.state_range
+
+    # One edge per pair, the last one winning as in build_edge_arrays.
+    pair = interned.source * max(n, 1) + interned.target
+    _, last_reversed = np.unique(pair[::-1], return_index=True)
+    chosen = np.sort(len(pair) - 1 - last_reversed)
+    source = interned.source[chosen]
+    target = interned.target[chosen]
+    weight = interned.weight[chosen]
+    effective = interned.effective_weights(params.use_confidence)[chosen]
+    m = len(chosen)
+    if n * m > MAX_SENSITIVITY_ELEMENTS:
+        raise ValueError(
+            f"Sensitivity analysis is limited to {MAX_SENSITIVITY_ELEMENTS} "
+            f"nodes x edges, the map has {n} x {m}"
+        )
+
+    # Inputs summed per target in source order, like the engines.
+    order = np.lexsort((source, target))
+    by_source = source[order]
+    by_target = target[order]
+    by_weight = effective[order][:, None]
+    receivers, starts = np.unique(by_target, return_index=True)
+    columns = np.arange(m)
+    block = max(1, BLOCK_ELEMENTS // max(m, 1))
+
+    state = np.zeros(n)
+    for node_id, value in params.initial_states.items():
+        state[interned.index[node_id]] = value
+    jacobian = np.zeros((n, m))
+    auto = params.iteration_mode == "auto"
+    iterations_count = params.max_iterations
+    converged = not auto
+    truncated = False
+
+    budget.start()
+    for iteration in range(1, params.max_iterations + 1):
+        inputs = np.zeros(n)
+        np.add.at(inputs, by_target, by_weight[:, 0] * state[by_source])
+        new_state = apply_activation(
+            inputs, params.activation_type, problem.lambda_param, problem.state_range
+        )
+        if params.activation_type == "sigmoid":
+            slope = problem.lambda_param * new_state * (1.0 - new_state)
+        else:
+            slope = problem.lambda_param * (1.0 - new_state * new_state)
+        slope[(new_state <= low) | (new_state >= high)] = 0.0
+
+        tangent = np.zeros((n, m))
+        if m:
+            for start in range(0, m, block):
+                part = slice(start, start + block)
+                tangent[receivers, part] = np.add.reduceat(
+                    by_weight * jacobian[by_source, part], starts, axis=0
+                )
+            tangent[target, columns] += state[source]
+        tangent *= slope[:, None]
+
+        settled = np.array_equal(new_state, state) and np.array_equal(tangent, jacobian)
+        change = np.max(np.abs(new_state - state))
+        state, jacobian = new_state, tangent
+        if auto and change < params.convergence_threshold:
+            iterations_count = iteration
+            converged = True
+            break
+        if not auto and settled:
+            # A fixed point of both: the remaining iterations change nothing.
+            break
+        if iteration < params.max_iterations and budget.stop_reason() is not None:
+            iterations_count = iteration
+            converged = False
+            truncated = True
+            break
+
+    if params.use_confidence:
+        # d(effective weight)/d(weight) is the confidence where it is set.
+        confidence = interned.confidence[chosen]
+        jacobian *= np.where(np.isnan(confidence), 1.0, confidence)
+    return _Sensitivity(
+        source=source,
+        target=target,
+        weight=weight,
+        final_state=state,
+        jacobian=jacobian,
+        iterations_count=iterations_count,
+        converged=converged,
+        truncated=truncated,
+    )
+
+
+class SensitivityService:
+    """Service for derivatives of scenario results with respect to weights."""
+
+    @staticmethod
+    def prepare(
+        cognitive_map: CognitiveMapModel,
+        params: ScenarioParams,
+        interned: Optional[InternedGraph] = None,
+    ) -> SensitivityProblem:
+        """
+        Capture the inputs on the event loop; the result can then be
+        passed to sensitivity() in a worker thread.
+
+        Raises:
+            ValueError: If the map is empty or the initial states are invalid
+        """
+        interned = interned or InternedGraph.build(cognitive_map)
+        if not interned.size:
+            raise ValueError("Cannot analyse sensitivity of an empty cognitive map")
+        ScenarioService.validate_initial_states(
+            params.initial_states, interned.index, cognitive_map.fcm.state_range
+        )
+        return SensitivityProblem(
+            key=SimulationRequest(cognitive_map, params, interned).key,
+            interned=interned,
+            params=params.model_copy(deep=True),
+            lambda_param=cognitive_map.fcm.activation.lambda_,
+            state_range=tuple(cognitive_map.fcm.state_range),
+        )
+
+    @staticmethod
+    def sensitivity(
+        problem: SensitivityProblem,
+        node_ids: Optional[Sequence[str]] = None,
+        k: int = 5,
+        include_matrix: bool = False,
+        budget: Optional[RunBudget] = None,
+    ) -> SensitivityResponse:
+        """
+        Top-k most influential edges per node.
+
+        Args:
+            problem: Result of prepare()
+            node_ids: Nodes reported, all of them if None
+            k: Edges reported per node
+            include_matrix: Also return the sensitivity rows of the nodes
+            budget: Time budget and cancellation of the run; the server
+                default (SIMULATION_TIME_BUDGET) if not given
+
+        Raises:
+            ValueError: On unknown node ids or maps too large for the analysis
+        """
+        interned = problem.interned
+        if node_ids is None:
+            node_ids = interned.node_ids
+        unknown = [i for i in node_ids if i not in interned.index]
+        if unknown:
+            raise ValueError(f"Unknown nodes: {', '.join(unknown)}")
+
+        with _results_lock:
+            result = _results.get(problem.key)
+            if result is not None:
+                _results.move_to_end(problem.key)
+        if result is None:
+            result = _differentiate(problem, budget or RunBudget())
+            if not result.truncated:
+                with _results_lock:
+                    _results[problem.key] = result
+                    while len(_results) > CACHE_SIZE:
+                        _results.popitem(last=False)
+
+        rows = np.array([interned.index[i] for i in node_ids], dtype=np.int64)
+        names = interned.node_ids
+        nodes = []
+        for node_id, row in zip(node_ids, rows.tolist()):
+            values = result.jacobian[row]
+            strength = np.abs(values)
+            candidates = np.flatnonzero(strength > 0.0)
+            if candidates.size > k:
+                top = np.argpartition(strength[candidates], -k)[-k:]
+                candidates = candidates[top]
+            candidates = candidates[np.argsort(-strength[candidates], kind="stable")]
+            nodes.append(
+                NodeSensitivity(
+                    node_id=node_id,
+                    final_state=float(result.final_state[row]),
+                    edges=[
+                        EdgeSensitivity(
+                            source=names[result.source[e]],
+                            target=names[result.target[e]],
+                            weight=float(result.weight[e]),
+                            sensitivity=float(values[e]),
+                        )
+                        for e in candidates.tolist()
+                    ],
+                )
+            )
+
+        edge_order = matrix = None
+        if include_matrix:
+            edge_order = [
+                (names[s], names[t])
+                for s, t in zip(result.source.tolist(), result.target.tolist())
+            ]
+            matrix = result.jacobian[rows].tolist()
+        return SensitivityResponse(
+            iterations_count=result.iterations_count,
+            converged=result.converged,
+            edge_count=len(result.source),
+            nodes=nodes,
+            truncated=True if result.truncated else None,
+            edge_order=edge_order,
+            matrix=matrix,
+        )
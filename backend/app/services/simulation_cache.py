@@ -0,0 +1,265 @@
+"""
+Memoized scenario simulation results.
+
+Results are keyed by a hash of the inputs the simulation actually reads: node
+ids, edges (endpoints, weight, confidence), the FCM settings and the scenario
+parameters except name and description. Layout and labels are not part of
+the key, so dragging nodes around keeps cached results valid. Results cut
+short by their time budget are not cached. Every result returned carries
+the time it was returned at, also when it came from the cache.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import TypeAdapter
+
+from app.models.cognitive_map_models import (
+    CognitiveMapModel,
+    EdgeModel,
+    FCMModel,
+    ScenarioParams,
+    ScenarioResult,
+)
+from app.services.scenario_service import RunBudget, ScenarioService
+from app.storage.interned_graph import InternedGraph
+from core.instrumentation import counter, gauge
+
+logger = logging.getLogger("app")
+
+SIMULATION_CACHE_MB = float(os.getenv("SIMULATION_CACHE_MB", "64"))
+# Unset: results are cached in memory only.
+SIMULATION_CACHE_DIR = os.getenv("SIMULATION_CACHE_DIR")
+SIMULATION_CACHE_DISK_MB = float(os.getenv("SIMULATION_CACHE_DISK_MB", "256"))
+
+CACHE_LOOKUPS = counter(
+    "simulation_cache_lookups",
+    "Simulation result lookups by outcome (memory, disk, merged, miss)",
+    ("outcome",),
+)
+CACHE_BYTES = gauge(
+    "simulation_cache_memory_bytes", "Estimated size of cached simulation results"
+)
+
+_edges_adapter = TypeAdapter(List[EdgeModel])
+
+
+class SimulationRequest:
+    """
+    Simulation inputs captured from the live map.
+
+    Endpoints edit the current map in place, so the inputs are copied on the
+    event loop and the simulation runs on the copy in a worker thread.
+    """
+
+    def __init__(
+        self,
+        cognitive_map: CognitiveMapModel,
+        params: ScenarioParams,
+        interned: Optional[InternedGraph] = None,
+        budget: Optional[RunBudget] = None,
+    ):
+        # Immutable, so it is shared rather than copied.
+        self.interned = interned
+        self.budget = budget or RunBudget()
+        self.node_ids = [node.id for node in cognitive_map.nodes]
+        self.nodes = list(cognitive_map.nodes)
+        self.edges_json = _edges_adapter.dump_json(cognitive_map.edges)
+        self.fcm_json = cognitive_map.fcm.model_dump_json(
+            by_alias=True, exclude={"scenarios"}
+        )
+        self.params = params.model_copy(deep=True)
+
+        digest = hashlib.sha256()
+        digest.update("\n".join(self.node_ids).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(self.edges_json)
+        digest.update(b"\0")
+        digest.update(self.fcm_json.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(
+            self.params.model_dump_json(exclude={"name", "description"}).encode("utf-8")
+        )
+        self.key = digest.hexdigest()
+
+    def run(self) -> ScenarioResult:
+        cognitive_map = CognitiveMapModel.model_construct(
+            nodes=self.nodes,
+            edges=_edges_adapter.validate_json(self.edges_json),
+            fcm=FCMModel.model_validate_json(self.fcm_json),
+        )
+        return ScenarioService.run_simulation(
+            cognitive_map, self.params, interned=self.interned, budget=self.budget
+        )
+
+
+def estimate_size(result: ScenarioResult) -> int:
+    """Approximate memory held by a result: one state dict per iteration."""
+    states = 1 + len(result.history or ())
+    per_state = sys.getsizeof(result.final_states) + 24 * len(result.final_states)
+    return states * per_state
+
+
+def _stamped(result: ScenarioResult) -> ScenarioResult:
+    """A copy of a shared result, timestamped as a run finishing now."""
+    return result.model_copy(update={"timestamp": datetime.utcnow().isoformat() + "Z"})
+
+
+class _InFlight:
+    def __init__(self, task: asyncio.Task, request: SimulationRequest):
+        self.task = task
+        # Its budget governs the shared computation.
+        self.request = request
+        self.waiters = 0
+
+    def covers(self, budget: RunBudget) -> bool:
+        """Whether the computation runs at least as long as `budget` allows."""
+        running = self.request.budget
+        if running.cancelled:
+            return False
+        if running.seconds <= 0:
+            return True
+        if budget.seconds <= 0:
+            return False
+        now = time.monotonic()
+        end = running.deadline or now + running.seconds
+        return end >= now + budget.seconds
+
+
+class SimulationCache:
+    """
+    LRU cache of simulation results bounded by estimated memory size, with an
+    optional on-disk tier. Concurrent requests for the same key share one
+    computation, which is cancelled once none of them waits for it any more.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = int(SIMULATION_CACHE_MB * 1024 * 1024),
+        disk_dir: Optional[Path] = None,
+        disk_max_bytes: int = int(SIMULATION_CACHE_DISK_MB * 1024 * 1024),
+    ):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: OrderedDict[str, Tuple[ScenarioResult, int]] = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, _InFlight] = {}
+
+        CACHE_BYTES.callback = lambda: self._bytes
+
+    @classmethod
+    def from_env(cls) -> "SimulationCache":
+        disk_dir = Path(SIMULATION_CACHE_DIR) if SIMULATION_CACHE_DIR else None
+        return cls(disk_dir=disk_dir)
+
+    async def run(self, request: SimulationRequest) -> ScenarioResult:
+        """Return the cached result for `request`, computing it if needed."""
+        entry = self._entries.get(request.key)
+        if entry is not None:
+            self._entries.move_to_end(request.key)
+            CACHE_LOOKUPS.labels("memory").inc()
+            return _stamped(entry[0])
+
+        # A computation that was cancelled or stops at an earlier deadline
+        # would truncate this request's result: it gets its own, which
+        # later requests then join.
+        inflight = self._inflight.get(request.key)
+        if inflight is not None and inflight.covers(request.budget):
+            CACHE_LOOKUPS.labels("merged").inc()
+        else:
+            task = asyncio.ensure_future(self._resolve(request))
+            inflight = self._inflight[request.key] = _InFlight(task, request)
+            task.add_done_callback(lambda _: self._forget(request.key, inflight))
+
+        # One cancelled waiter must not cancel the shared computation; the
+        # last one stops it (at the engine's next budget check).
+        inflight.waiters += 1
+        try:
+            return _stamped(await asyncio.shield(inflight.task))
+        finally:
+            inflight.waiters -= 1
+            if not inflight.waiters and not inflight.task.done():
+                inflight.request.budget.cancel()
+
+    def _forget(self, key: str, inflight: _InFlight) -> None:
+        if self._inflight.get(key) is inflight:
+            del self._inflight[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    async def _resolve(self, request: SimulationRequest) -> ScenarioResult:
+        result = None
+        if self.disk_dir is not None:
+            result = await asyncio.to_thread(self._read_disk, request.key)
+        if result is not None:
+            CACHE_LOOKUPS.labels("disk").inc()
+        else:
+            CACHE_LOOKUPS.labels("miss").inc()
+            result = await asyncio.to_thread(request.run)
+            if result.truncated:
+                return result
+            if self.disk_dir is not None:
+                try:
+                    await asyncio.to_thread(self._write_disk, request.key, result)
+                except OSError as e:
+                    logger.warning("Failed to write simulation cache entry: %s", e)
+        self._remember(request.key, result)
+        return result
+
+    def _remember(self, key: str, result: ScenarioResult) -> None:
+        size = estimate_size(result)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (result, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+
+    def _read_disk(self, key: str) -> Optional[ScenarioResult]:
+        path = self.disk_dir / f"{key}.json"
+        try:
+            result = ScenarioResult.model_validate_json(path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(
+                "Discarding unreadable simulation cache entry %s: %s", path, e
+            )
+            path.unlink(missing_ok=True)
+            return None
+        now = time.time()
+        os.utime(path, (now, now))  # mtime orders disk eviction
+        return result
+
+    def _write_disk(self, key: str, result: ScenarioResult) -> None:
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        path = self.disk_dir / f"{key}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(result.model_dump_json(), encoding="utf-8")
+        os.replace(tmp, path)
+
+        files = []
+        for entry in self.disk_dir.glob("*.json"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry))
+        total = sum(size for _, size, _ in files)
+        for _, size, entry in sorted(files, key=lambda f: f[0]):
+            if total <= self.disk_max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
@@ -0,0 +1,343 @@
+"""
+FCM simulation over the condensation of the map.
+
+The strongly connected components of the map form a DAG. Components are
+simulated in topological order, one chunk of iterations at a time: all
+acyclic nodes of a level are computed for every step of the chunk at once
+(their inputs for the whole chunk are already known), and each feedback
+cluster iterates only over its own incoming edges.
+
+A node whose inputs no longer change keeps its value, so such components
+are copied forward instead of recomputed. An acyclic node settles one step
+after its slowest predecessor; a cluster settles once its inputs are settled
+and one of its steps reproduces the previous state exactly.
+
+Per target, inputs are summed in source order starting from 0.0, like the
+reference engine in ScenarioService, so both produce the same states.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple
+
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+# Iterations computed per chunk; auto mode stops at the end of the chunk in
+# which it converged.
+CHUNK_STEPS = 16
+TOPOLOGY_CACHE_SIZE = 8
+
+# "Never settles" marker for step numbers.
+NEVER = 2**62
+
+
+@dataclass
+class EdgeArrays:
+    """Edges with non-zero effective weight, one per (source, target)."""
+
+    source: np.ndarray
+    target: np.ndarray
+    weight: np.ndarray
+
+
+@dataclass
+class _Level:
+    """Acyclic nodes of one condensation level and their incoming edges."""
+
+    nodes: np.ndarray
+    # Incoming edges sorted by (target, source): positions into EdgeArrays,
+    # source node and local index of the target within `nodes`.
+    edges: np.ndarray
+    sources: np.ndarray
+    targets: np.ndarray
+
+
+@dataclass
+class _Cluster:
+    """A feedback cluster (cyclic component) and its incoming edges."""
+
+    nodes: np.ndarray
+    edges: np.ndarray
+    sources: np.ndarray
+    targets: np.ndarray
+    # Sources outside the cluster, whose settling it waits for.
+    external: np.ndarray
+
+
+@dataclass
+class Condensation:
+    n_nodes: int
+    n_components: int
+    # Per level: its acyclic nodes and its clusters, in topological order.
+    levels: List[Tuple[_Level, List[_Cluster]]]
+
+    @property
+    def n_clusters(self) -> int:
+        return sum(len(clusters) for _, clusters in self.levels)
+
+
+def strongly_connected_components(
+    n: int, source: np.ndarray, target: np.ndarray
+) -> Tuple[np.ndarray, int]:
+    """
+    Iterative Tarjan's algorithm.
+
+    Returns:
+        (component label per node, number of components); labels are numbered
+        in topological order of the condensation.
+    """
+    order = np.argsort(source, kind="stable")
+    adjacency = target[order].tolist()
+    indptr = np.searchsorted(source[order], np.arange(n + 1)).tolist()
+
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    component = [-1] * n
+    stack: List[int] = []
+    counter = 0
+    n_components = 0
+
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, indptr[root])]
+
+        while work:
+            v, i = work[-1]
+            end = indptr[v + 1]
+            while i < end:
+                w = adjacency[i]
+                i += 1
+                if index[w] == -1:
+                    work[-1] = (v, i)
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, indptr[w]))
+                    break
+                if on_stack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+            else:
+                work.pop()
+                if low[v] == index[v]:
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        component[w] = n_components
+                        if w == v:
+                            break
+                    n_components += 1
+                if work:
+                    u = work[-1][0]
+                    if low[v] < low[u]:
+                        low[u] = low[v]
+
+    # Tarjan emits components sinks first.
+    labels = n_components - 1 - np.asarray(component, dtype=np.int64)
+    return labels, n_components
+
+
+def _condense(n: int, source: np.ndarray, target: np.ndarray) -> Condensation:
+    component, n_components = strongly_connected_components(n, source, target)
+
+    sizes = np.bincount(component, minlength=n_components)
+    cyclic = sizes > 1
+    cyclic[component[source[source == target]]] = True
+
+    # Level of a component: longest path to it in the condensation.
+    cs, ct = component[source], component[target]
+    between = cs != ct
+    cs, ct = cs[between], ct[between]
+    by_target = np.argsort(ct, kind="stable")
+    cs, ct = cs[by_target].tolist(), ct[by_target]
+    starts = np.searchsorted(ct, np.arange(n_components + 1)).tolist()
+    level = [0] * n_components
+    for c in range(n_components):
+        for i in range(starts[c], starts[c + 1]):
+            if level[cs[i]] + 1 > level[c]:
+                level[c] = level[cs[i]] + 1
+    level = np.asarray(level, dtype=np.int64)
+    n_levels = int(level.max()) + 1 if n_components else 0
+
+    node_level = level[component]
+    node_cyclic = cyclic[component]
+
+    # Incoming edges in (target, source) order, grouped by target node.
+    edge_order = np.lexsort((source, target))
+    edge_target = target[edge_order]
+    edge_starts = np.searchsorted(edge_target, np.arange(n + 1))
+
+    def incoming(nodes):
+        parts = [edge_order[edge_starts[v] : edge_starts[v + 1]] for v in nodes]
+        edges = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        local = np.repeat(np.arange(len(nodes)), [len(p) for p in parts])
+        return edges, source[edges], local
+
+    acyclic_nodes = np.flatnonzero(~node_cyclic)
+    acyclic_nodes = acyclic_nodes[np.argsort(node_level[acyclic_nodes], kind="stable")]
+    acyclic_bounds = np.searchsorted(node_level[acyclic_nodes], np.arange(n_levels + 1))
+
+    cluster_ids = np.flatnonzero(cyclic)
+    cluster_nodes = {int(c): [] for c in cluster_ids}
+    for v in np.flatnonzero(node_cyclic).tolist():
+        cluster_nodes[int(component[v])].append(v)
+    clusters_by_level: List[List[_Cluster]] = [[] for _ in range(n_levels)]
+    for c in cluster_ids.tolist():
+        nodes = np.asarray(cluster_nodes[c], dtype=np.int64)
+        edges, sources, local = incoming(nodes)
+        external = np.unique(sources[component[sources] != c])
+        clusters_by_level[int(level[c])].append(
+            _Cluster(nodes, edges, sources, local, external)
+        )
+
+    levels = []
+    for lvl in range(n_levels):
+        nodes = acyclic_nodes[acyclic_bounds[lvl] : acyclic_bounds[lvl + 1]]
+        edges, sources, local = incoming(nodes)
+        levels.append((_Level(nodes, edges, sources, local), clusters_by_level[lvl]))
+
+    return Condensation(n, n_components, levels)
+
+
+_topologies: OrderedDict[str, Condensation] = OrderedDict()
+_topologies_lock = threading.Lock()
+
+
+def condense(n: int, source: np.ndarray, target: np.ndarray) -> Condensation:
+    """Condensation of the graph, cached by topology (not by weights)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(n.to_bytes(8, "little"))
+    digest.update(np.ascontiguousarray(source, dtype=np.int64).tobytes())
+    digest.update(b"|")
+    digest.update(np.ascontiguousarray(target, dtype=np.int64).tobytes())
+    key = digest.hexdigest()
+
+    with _topologies_lock:
+        cached = _topologies.get(key)
+        if cached is not None:
+            _topologies.move_to_end(key)
+            return cached
+
+    condensation = _condense(n, source, target)
+    with _topologies_lock:
+        _topologies[key] = condensation
+        while len(_topologies) > TOPOLOGY_CACHE_SIZE:
+            _topologies.popitem(last=False)
+    return condensation
+
+
+def apply_activation(x, activation_type: str, lambda_param: float, state_range):
+    """FCM activation of the weighted inputs `x`, clipped to the state range."""
+    if activation_type == "sigmoid":
+        y = 1.0 / (1.0 + np.exp(-lambda_param * x))
+    else:
+        y = np.tanh(lambda_param * x)
+    return np.clip(y, state_range[0], state_range[1])
+
+
+def iterate_states(
+    edges: EdgeArrays,
+    initial_state: np.ndarray,
+    activation_type: str,
+    lambda_param: float,
+    state_range: Tuple[float, float],
+    max_iterations: int,
+    chunk_steps: int = CHUNK_STEPS,
+) -> Iterator[np.ndarray]:
+    """
+    Yield the states after iterations 1..max_iterations in chunks of shape
+    (n_nodes, steps); stop consuming to end the simulation early.
+    """
+    n = len(initial_state)
+    condensation = condense(n, edges.source, edges.target)
+
+    def activate(x):
+        return apply_activation(x, activation_type, lambda_param, state_range)
+
+    # stable[v] = k: node v keeps the value it had after iteration k.
+    stable = np.full(n, NEVER, dtype=np.int64)
+    carry = np.asarray(initial_state, dtype=np.float64)
+    done = 0
+
+    while done < max_iterations:
+        steps = min(chunk_steps, max_iterations - done)
+        # Column j holds the state after iteration done + j.
+        block = np.empty((n, steps + 1))
+        block[:, 0] = carry
+
+        for level, clusters in condensation.levels:
+            if level.nodes.size:
+                _step_level(level, edges, block, stable, done, activate)
+            for cluster in clusters:
+                _step_cluster(cluster, edges, block, stable, done, activate)
+
+        done += steps
+        carry = block[:, -1]
+        yield block[:, 1:]
+
+
+def _step_level(level, edges, block, stable, done, activate):
+    nodes = level.nodes
+    steps = block.shape[1] - 1
+    # An acyclic node settles one iteration after its last input settles.
+    settled = np.ones(len(nodes), dtype=np.int64)
+    if level.sources.size:
+        latest = np.zeros(len(nodes), dtype=np.int64)
+        np.maximum.at(latest, level.targets, stable[level.sources])
+        settled = np.minimum(latest + 1, NEVER)
+    stable[nodes] = settled
+
+    if settled.max() <= done:
+        block[nodes, 1:] = block[nodes, :1]
+        return
+
+    m = len(nodes)
+    inputs = np.zeros(m * steps)
+    if level.edges.size:
+        # Sums per (target, step) in edge order, i.e. in source order.
+        bins = (level.targets[:, None] * steps + np.arange(steps)).ravel()
+        contributions = (
+            edges.weight[level.edges][:, None] * block[level.sources, :steps]
+        )
+        inputs = np.bincount(bins, weights=contributions.ravel(), minlength=m * steps)
+    block[nodes, 1:] = activate(inputs.reshape(m, steps))
+
+
+def _step_cluster(cluster, edges, block, stable, done, activate):
+    nodes = cluster.nodes
+    steps = block.shape[1] - 1
+    if stable[nodes[0]] <= done:
+        block[nodes, 1:] = block[nodes, :1]
+        return
+
+    external_settled = (
+        int(stable[cluster.external].max()) if cluster.external.size else 0
+    )
+    weights = edges.weight[cluster.edges]
+    m = len(nodes)
+    for j in range(steps):
+        inputs = np.bincount(
+            cluster.targets, weights=weights * block[cluster.sources, j], minlength=m
+        )
+        block[nodes, j + 1] = activate(inputs)
+
+        iteration = done + j + 1
+        if external_settled <= iteration - 1 and np.array_equal(
+            block[nodes, j + 1], block[nodes, j]
+        ):
+            # Same state and same inputs from here on: a fixed point.
+            stable[nodes] = iteration - 1
+            block[nodes, j + 2 :] = block[nodes, j + 1 : j + 2]
+            return
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import math
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from app.models.cognitive_map_models import EdgeModel, NodeModel
+from app.storage.spatial_index import SpatialIndex
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+
+class NodePosition(BaseModel):
+    id: str
+    x: float
+    y: float
+
+
+class NodeCluster(BaseModel):
+    # Centroid of the member nodes and their bounding box.
+    x: float
+    y: float
+    count: int
+    min_x: float
+    min_y: float
+    max_x: float
+    max_y: float
+
+
+class ClusterEdge(BaseModel):
+    # Positions in ViewportResponse.clusters.
+    source: int
+    target: int
+    count: int
+    mean_weight: float
+
+
+class ViewportResponse(BaseModel):
+    map_hash: str
+    # Nodes inside the box; empty when clustered.
+    nodes: List[NodeModel]
+    # Edges with at least one endpoint among `nodes`.
+    edges: List[EdgeModel]
+    # Positions of the other endpoints of those edges, outside the box.
+    external_nodes: List[NodePosition]
+    # Number of nodes inside the box, also when truncated or clustered.
+    total_nodes: int
+    truncated: bool
+    clusters: Optional[List[NodeCluster]] = None
+    cluster_edges: Optional[List[ClusterEdge]] = None
+
+
+class ViewportService:
+    """Service for serving the part of the map inside a viewport."""
+
+    @staticmethod
+    def query(
+        index: SpatialIndex,
+        min_x: float,
+        min_y: float,
+        max_x: float,
+        max_y: float,
+        limit: int = 5000,
+        cluster_size: Optional[float] = None,
+    ) -> ViewportResponse:
+        """
+        Nodes and edges inside a bounding box.
+
+        Args:
+            index: The store's spatial index, synced with the current map
+            limit: Maximum number of nodes returned (first in map order)
+            cluster_size: If set, summarize the nodes per grid cell of this
+                size instead of returning them (for zoomed-out views)
+
+        Raises:
+            ValueError: If a bound is not finite or the box is empty
+        """
+        if not all(math.isfinite(v) for v in (min_x, min_y, max_x, max_y)):
+            raise ValueError("Viewport bounds must be finite")
+        if min_x > max_x or min_y > max_y:
+            raise ValueError("Viewport minimum must not exceed its maximum")
+
+        node_ids = index.query(min_x, min_y, max_x, max_y)
+        total = len(node_ids)
+
+        if cluster_size is not None:
+            clusters, cluster_edges = ViewportService._clusters(
+                index, node_ids, cluster_size
+            )
+            return ViewportResponse(
+                map_hash=index.map_hash,
+                nodes=[],
+                edges=[],
+                external_nodes=[],
+                total_nodes=total,
+                truncated=False,
+                clusters=clusters,
+                cluster_edges=cluster_edges,
+            )
+
+        truncated = total > limit
+        node_ids = node_ids[:limit]
+        inside = set(node_ids)
+        edges = [index.edges[i] for i in index.edges_touching(node_ids)]
+        external = {
+            endpoint
+            for edge in edges
+            for endpoint in (edge.source, edge.target)
+            if endpoint not in inside
+        }
+        return ViewportResponse(
+            map_hash=index.map_hash,
+            nodes=[index.nodes[node_id] for node_id in node_ids],
+            edges=edges,
+            external_nodes=[
+                NodePosition(id=node_id, x=x, y=y)
+                for node_id in sorted(external, key=index.order.__getitem__)
+                for x, y in (index.positions[node_id],)
+            ],
+            total_nodes=total,
+            truncated=truncated,
+        )
+
+    @staticmethod
+    def _clusters(
+        index: SpatialIndex, node_ids: List[str], cluster_size: float
+    ) -> tuple[List[NodeCluster], List[ClusterEdge]]:
+        if cluster_size <= 0:
+            raise ValueError("cluster_size must be positive")
+        if not node_ids:
+            return [], []
+
+        xy = np.array([index.positions[node_id] for node_id in node_ids])
+        cells = np.floor(xy / cluster_size).astype(np.int64)
+        # One integer per cell, so np.unique works on a flat array.
+        cells -= cells.min(axis=0)
+        keys = cells[:, 0] * (int(cells[:, 1].max()) + 1) + cells[:, 1]
+        _, label, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        k = len(counts)
+        cx = np.bincount(label, weights=xy[:, 0], minlength=k) / counts
+        cy = np.bincount(label, weights=xy[:, 1], minlength=k) / counts
+        low = np.full((k, 2), np.inf)
+        high = np.full((k, 2), -np.inf)
+        np.minimum.at(low, label, xy)
+        np.maximum.at(high, label, xy)
+        clusters = [
+            NodeCluster(x=x, y=y, count=c, min_x=x0, min_y=y0, max_x=x1, max_y=y1)
+            for x, y, c, (x0, y0), (x1, y1) in zip(
+                cx.tolist(), cy.tolist(), counts.tolist(), low.tolist(), high.tolist()
+            )
+        ]
+
+        # Edges between different clusters, both endpoints inside the box.
+        cluster_of = np.full(len(index.order), -1, dtype=np.int64)
+        cluster_of[[index.order[node_id] for node_id in node_ids]] = label
+        a = cluster_of[index.edge_source]
+        b = cluster_of[index.edge_target]
+        between = (a >= 0) & (b >= 0) & (a != b)
+        if not between.any():
+            return clusters, []
+
+        unique, inverse, pair_counts = np.unique(
+            a[between] * k + b[between], return_inverse=True, return_counts=True
+        )
+        sums = np.bincount(inverse, weights=index.edge_weight[between])
+        cluster_edges = [
+            ClusterEdge(source=pair // k, target=pair % k, count=c, mean_weight=w / c)
+            for pair, c, w in zip(unique.tolist(), pair_counts.tolist(), sums.tolist())
+        ]
+        return clusters, cluster_edges
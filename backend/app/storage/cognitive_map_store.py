@@ -3,22 +3,54 @@ import hashlib
 import json
 import logging
 import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 
 from app.models.cognitive_map_models import CognitiveMapModel
+from app.storage.interned_graph import InternedGraph
+from app.storage.map_changes import ChangeFeed
+from app.storage.spatial_index import SpatialIndex
+from core.instrumentation import BYTES_BUCKETS, gauge, histogram
 
 logger = logging.getLogger("app")
 
+LOCK_WAIT = histogram(
+    "cognitive_map_store_lock_wait_seconds",
+    "Time spent waiting for the store lock",
+    ("operation",),
+)
+LOCK_HOLD = histogram(
+    "cognitive_map_store_lock_hold_seconds",
+    "Time the store lock was held",
+    ("operation",),
+)
+IO_DURATION = histogram(
+    "cognitive_map_store_io_seconds",
+    "Duration of project file reads and writes",
+    ("operation",),
+)
+IO_BYTES = histogram(
+    "cognitive_map_store_io_bytes",
+    "Size of project files read and written",
+    ("operation",),
+    buckets=BYTES_BUCKETS,
+)
+UNDO_STACK_SIZE = gauge("cognitive_map_undo_stack_size", "Entries in the undo stack")
+REDO_STACK_SIZE = gauge("cognitive_map_redo_stack_size", "Entries in the redo stack")
+MAP_NODES = gauge("cognitive_map_nodes", "Nodes in the current map")
+MAP_EDGES = gauge("cognitive_map_edges", "Edges in the current map")
+
 
 def canonical_bytes(model: CognitiveMapModel) -> bytes:
-    payload = model.model_dump(by_alias=True, exclude_none=True)
-    return json.dumps(
-        payload,
-        ensure_ascii=False,
-        sort_keys=True,
-        separators=(",", ":"),
+    # Serialized by pydantic-core in field-declaration order, which is stable
+    # and several times faster than json.dumps(..., sort_keys=True). The
+    # canonical context sorts the dict fields (initial and final states).
+    return model.model_dump_json(
+        by_alias=True, exclude_none=True, context={"canonical": True}
     ).encode("utf-8")
 
 
@@ -26,73 +58,154 @@ def sha256_of(model: CognitiveMapModel) -> str:
     return hashlib.sha256(canonical_bytes(model)).hexdigest()
 
 
+def read_map_file(path: Path) -> CognitiveMapModel:
+    """
+    Parse and validate a project file straight from its bytes.
+
+    pydantic-core parses and validates in one pass without building the
+    intermediate dict that json.loads + model_validate needs.
+    """
+    return CognitiveMapModel.model_validate_json(path.read_bytes())
+
+
+class MapConflictError(Exception):
+    """The map changed since the version a write was based on."""
+
+
 @dataclass
 class Snapshot:
     map: CognitiveMapModel
     hash: str
 
 
+def read_snapshot(path: Path) -> Snapshot:
+    model = read_map_file(path)
+    return Snapshot(model, sha256_of(model))
+
+
 class CognitiveMapStore:
-    def __init__(self, path: Path, history_limit: int = 20):
+    def __init__(
+        self, path: Path, history_limit: int = 20, serialized_cache_size: int = 4
+    ):
         self.path = path
         self.history_limit = history_limit
         self.lock = asyncio.Lock()
 
+        # hash -> response JSON, so undo/redo and repeated GETs of a version
+        # that was already sent reuse the same bytes.
+        self.serialized_cache_size = serialized_cache_size
+        self._serialized: OrderedDict[str, bytes] = OrderedDict()
+
         self.current: CognitiveMapModel = CognitiveMapModel()
         self.current_hash: str = sha256_of(self.current)
+        # Set once a project was loaded, opened or created; until then the
+        # empty map above must not be saved over the project file.
+        self.loaded = False
 
         self.undo_stack: List[Snapshot] = []  # oldest -> newest
         self.redo_stack: List[Snapshot] = []  # oldest -> newest
 
+        self.changes = ChangeFeed()
+        self.spatial = SpatialIndex()
+        self.interned: Optional[InternedGraph] = None
+
+        # Read on scrape, so keeping them current costs nothing.
+        UNDO_STACK_SIZE.callback = lambda: len(self.undo_stack)
+        REDO_STACK_SIZE.callback = lambda: len(self.redo_stack)
+        MAP_NODES.callback = lambda: len(self.current.nodes)
+        MAP_EDGES.callback = lambda: len(self.current.edges)
+
+    @asynccontextmanager
+    async def _locked(self, operation: str):
+        requested = time.perf_counter()
+        async with self.lock:
+            acquired = time.perf_counter()
+            LOCK_WAIT.labels(operation).observe(acquired - requested)
+            try:
+                yield
+            finally:
+                LOCK_HOLD.labels(operation).observe(time.perf_counter() - acquired)
+
+    async def _read(self, path: Path, operation: str) -> Snapshot:
+        start = time.perf_counter()
+        snapshot = await asyncio.to_thread(read_snapshot, path)
+        IO_DURATION.labels(operation).observe(time.perf_counter() - start)
+        IO_BYTES.labels(operation).observe(path.stat().st_size)
+        return snapshot
+
+    def _write(self, path: Path, operation: str) -> None:
+        start = time.perf_counter()
+        payload = self.current.model_dump(by_alias=True, exclude_none=True)
+        data = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        IO_DURATION.labels(operation).observe(time.perf_counter() - start)
+        IO_BYTES.labels(operation).observe(len(data))
+
     # ---------- persistence (ONLY current) ----------
     async def load(self) -> None:
-        async with self.lock:
+        async with self._locked("load"):
+            previous_hash = self.current_hash
             if not self.path.exists():
                 self.current = CognitiveMapModel()
                 self.current_hash = sha256_of(self.current)
                 self.undo_stack.clear()
                 self.redo_stack.clear()
+                self.loaded = True
+                self._publish("load", previous_hash, resync=True)
                 return
 
-            data = json.loads(self.path.read_text(encoding="utf-8"))
-            logger.info(f"Cognitive map: {data}")
-            self.current = CognitiveMapModel.model_validate(data)
-            self.current_hash = sha256_of(self.current)
+            # Parsing and hashing a large project happens off the event loop so
+            # health checks are still answered while it runs.
+            snapshot = await self._read(self.path, "load")
+            self.current = snapshot.map
+            self.current_hash = snapshot.hash
+            logger.info(
+                "Cognitive map: %s nodes, %s edges",
+                len(self.current.nodes),
+                len(self.current.edges),
+            )
             self.undo_stack.clear()
             self.redo_stack.clear()
+            self.loaded = True
+            self._publish("load", previous_hash, resync=True)
 
     async def save_to_file(self) -> None:
-        async with self.lock:
-            payload = self.current.model_dump(by_alias=True, exclude_none=True)
-            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
-            tmp.write_text(
-                json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8"
-            )
-            os.replace(tmp, self.path)
-            logger.info(f"Saved cognitive map to: {self.path}")
+        async with self._locked("save_to_file"):
+            self._write(self.path, "save")
+            logger.info("Saved cognitive map to: %s", self.path)
+
+    async def save_on_shutdown(self) -> bool:
+        """Save the project file on shutdown; returns whether it was written."""
+        await self.save_to_file()
+        return True
 
     async def load_from_path(self, new_path: Path) -> None:
-        async with self.lock:
+        async with self._locked("load_from_path"):
             if not new_path.exists():
                 raise FileNotFoundError(f"File not found: {new_path}")
 
-            data = json.loads(new_path.read_text(encoding="utf-8"))
-            new_map = CognitiveMapModel.model_validate(data)
+            snapshot = await self._read(new_path, "load")
 
             # Validate integrity before switching
-            self._validate_integrity(new_map)
+            self._validate_integrity(snapshot.map)
 
             # Switch to new file
+            previous_hash = self.current_hash
             self.path = new_path
-            self.current = new_map
-            self.current_hash = sha256_of(self.current)
+            self.current = snapshot.map
+            self.current_hash = snapshot.hash
             self.undo_stack.clear()
             self.redo_stack.clear()
-            logger.info(f"Loaded cognitive map from: {new_path}")
+            self.loaded = True
+            self._publish("open", previous_hash, resync=True)
+            logger.info("Loaded cognitive map from: %s", new_path)
 
     async def create_new_at_path(self, new_path: Path) -> None:
-        async with self.lock:
+        async with self._locked("create_new_at_path"):
             # Create empty map
+            previous_hash = self.current_hash
             self.current = CognitiveMapModel()
             self.current_hash = sha256_of(self.current)
             self.undo_stack.clear()
@@ -101,35 +214,26 @@ class CognitiveMapStore:
             # Switch to new path
             self.path = new_path
 
-            # Save the new empty project
-            payload = self.current.model_dump(by_alias=True, exclude_none=True)
-
             # Ensure parent directory exists
             self.path.parent.mkdir(parents=True, exist_ok=True)
 
-            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
-            tmp.write_text(
-                json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8"
-            )
-            os.replace(tmp, self.path)
-            logger.info(f"Created new cognitive map at: {new_path}")
+            # Save the new empty project
+            self._write(self.path, "save")
+            self.loaded = True
+            self._publish("new", previous_hash, resync=True)
+            logger.info("Created new cognitive map at: %s", new_path)
 
     async def save_as(self, new_path: Path) -> None:
-        async with self.lock:
+        async with self._locked("save_as"):
             # Ensure parent directory exists
             new_path.parent.mkdir(parents=True, exist_ok=True)
 
             # Save to new path
-            payload = self.current.model_dump(by_alias=True, exclude_none=True)
-            tmp = new_path.with_suffix(new_path.suffix + ".tmp")
-            tmp.write_text(
-                json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8"
-            )
-            os.replace(tmp, new_path)
+            self._write(new_path, "save")
 
             # Switch to new path
             self.path = new_path
-            logger.info(f"Saved cognitive map as: {new_path}")
+            logger.info("Saved cognitive map as: %s", new_path)
 
     # ---------- integrity ----------
     def _validate_integrity(self, m: CognitiveMapModel) -> None:
@@ -143,13 +247,41 @@ class CognitiveMapStore:
                     f"Edge references unknown node id: {e.source} -> {e.target}"
                 )
 
+    # ---------- serialization ----------
+    def serialized_current(self) -> bytes:
+        """
+        Return the current map as response JSON (by alias, None included, as
+        FastAPI would render it with response_model=CognitiveMapModel).
+        """
+        cached = self._serialized.get(self.current_hash)
+        if cached is not None:
+            self._serialized.move_to_end(self.current_hash)
+            return cached
+
+        body = self.current.model_dump_json(by_alias=True).encode("utf-8")
+        self._serialized[self.current_hash] = body
+        while len(self._serialized) > self.serialized_cache_size:
+            self._serialized.popitem(last=False)
+        return body
+
     # ---------- API ops ----------
     async def get(self) -> CognitiveMapModel:
-        async with self.lock:
+        async with self._locked("get"):
             return self.current
 
-    async def put(self, new_map: CognitiveMapModel) -> CognitiveMapModel:
-        async with self.lock:
+    async def put(
+        self, new_map: CognitiveMapModel, expected_hash: Optional[str] = None
+    ) -> CognitiveMapModel:
+        """
+        Replace the current map. With expected_hash (the client's If-Match),
+        raise MapConflictError unless the current map still has that hash.
+        """
+        async with self._locked("put"):
+            if expected_hash is not None and expected_hash != self.current_hash:
+                raise MapConflictError(
+                    f"Map has changed: expected {expected_hash}, "
+                    f"current is {self.current_hash}"
+                )
             self._validate_integrity(new_map)
             new_hash = sha256_of(new_map)
 
@@ -158,15 +290,17 @@ class CognitiveMapStore:
                     self.undo_stack.append(Snapshot(self.current, self.current_hash))
                     self.undo_stack = self.undo_stack[-self.history_limit :]
 
+                previous_hash = self.current_hash
                 self.current = new_map
                 self.current_hash = new_hash
 
                 self.redo_stack.clear()
+                self._publish("put", previous_hash)
 
             return self.current
 
     async def undo(self) -> CognitiveMapModel:
-        async with self.lock:
+        async with self._locked("undo"):
             if not self.undo_stack:
                 return self.current
 
@@ -175,13 +309,15 @@ class CognitiveMapStore:
             self.redo_stack = self.redo_stack[-self.history_limit :]
 
             # last from undo -> current
+            previous_hash = self.current_hash
             prev = self.undo_stack.pop()
             self.current = prev.map
             self.current_hash = prev.hash
+            self._publish("undo", previous_hash)
             return self.current
 
     async def redo(self) -> CognitiveMapModel:
-        async with self.lock:
+        async with self._locked("redo"):
             if not self.redo_stack:
                 return self.current
 
@@ -189,16 +325,74 @@ class CognitiveMapStore:
             self.undo_stack.append(Snapshot(self.current, self.current_hash))
             self.undo_stack = self.undo_stack[-self.history_limit :]
 
+            previous_hash = self.current_hash
             nxt = self.redo_stack.pop()
             self.current = nxt.map
             self.current_hash = nxt.hash
+            self._publish("redo", previous_hash)
             return self.current
 
     async def history_info(self):
-        async with self.lock:
+        async with self._locked("history_info"):
             return {
                 "limit": self.history_limit,
                 "undo_count": len(self.undo_stack),
                 "redo_count": len(self.redo_stack),
                 "current_hash": self.current_hash,
+                "version": self.changes.version,
             }
+
+    async def spatial_index(self) -> SpatialIndex:
+        """
+        The spatial index of the current map, synced on first use after a
+        change. Query it before the next await; it is not a snapshot.
+        """
+        async with self._locked("spatial_index"):
+            self._sync()
+            self.spatial.sync(self.current, self.current_hash)
+            return self.spatial
+
+    async def interned_graph(self) -> InternedGraph:
+        """
+        The current map with interned node ids and edge arrays, rebuilt on
+        first use after a change. Unlike the map it is never modified, so it
+        stays valid after later edits.
+        """
+        async with self._locked("interned_graph"):
+            self._sync()
+            return self._current_interned()
+
+    async def map_and_graph(self) -> Tuple[CognitiveMapModel, InternedGraph]:
+        """
+        The current map and its interned graph, read under one lock acquisition
+        so that a write in between cannot pair a map with another's graph.
+        """
+        async with self._locked("map_and_graph"):
+            self._sync()
+            return self.current, self._current_interned()
+
+    def _current_interned(self) -> InternedGraph:
+        if self.interned is None or self.interned.map_hash != self.current_hash:
+            self.interned = InternedGraph.build(
+                self.current, self.current_hash, self.interned
+            )
+        return self.interned
+
+    def _sync(self) -> None:
+        """Bring the in-memory map up to date; this store always is."""
+
+    # ---------- change feed ----------
+    def _publish(self, reason: str, previous_hash: str, resync: bool = False) -> None:
+        self.changes.publish(
+            reason, self.current, self.current_hash, previous_hash, resync=resync
+        )
+
+    async def subscribe_changes(self) -> Tuple[asyncio.Queue, str]:
+        """Subscribe to change events; returns the queue and a hello message."""
+        async with self._locked("subscribe_changes"):
+            queue = self.changes.subscribe()
+            self.changes.ensure_index(self.current)
+            return queue, self.changes.hello(self.current_hash)
+
+    def unsubscribe_changes(self, queue: asyncio.Queue) -> None:
+        self.changes.unsubscribe(queue)
@@ -0,0 +1,103 @@
+"""
+Integer view of a map version, shared by the services.
+
+Node ids are interned once per map version to dense integers (their
+position in map order) and edges are held as integer arrays, so services
+index numpy arrays instead of rebuilding {node_id: index} dicts per request
+and only turn integers back into ids for their responses.
+
+The store keeps the graph of the current version and rebuilds it on first use
+after a change, reusing the interning table while the node list is unchanged
+(e.g. across edge edits). A graph is not modified after it is built, so it
+can be handed to worker threads.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Optional
+
+from app.models.cognitive_map_models import CognitiveMapModel
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+
+class InternedGraph:
+    def __init__(
+        self,
+        node_ids: List[str],
+        index: Dict[str, int],
+        source: np.ndarray,
+        target: np.ndarray,
+        weight: np.ndarray,
+        confidence: np.ndarray,
+        map_hash: Optional[str] = None,
+    ):
+        self.node_ids = node_ids
+        # node id -> its integer (position in node_ids)
+        self.index = index
+        # One entry per edge, in map order; confidence is NaN where unset.
+        self.source = source
+        self.target = target
+        self.weight = weight
+        self.confidence = confidence
+        self.map_hash = map_hash
+
+    @classmethod
+    def build(
+        cls,
+        model: CognitiveMapModel,
+        map_hash: Optional[str] = None,
+        previous: Optional[InternedGraph] = None,
+    ) -> InternedGraph:
+        """
+        Intern the nodes and edges of `model`. Edges with an endpoint that is
+        not a node (rejected by the store) are left out.
+
+        Args:
+            previous: Graph of an earlier version whose interning table is
+                reused if the node ids are the same
+        """
+        node_ids = [node.id for node in model.nodes]
+        if previous is not None and previous.node_ids == node_ids:
+            node_ids, index = previous.node_ids, previous.index
+        else:
+            index = {node_id: i for i, node_id in enumerate(node_ids)}
+
+        edges = [
+            (index[e.source], index[e.target], e.weight, e.confidence)
+            for e in model.edges
+            if e.source in index and e.target in index
+        ]
+        m = len(edges)
+        return cls(
+            node_ids=node_ids,
+            index=index,
+            source=np.fromiter((e[0] for e in edges), dtype=np.int64, count=m),
+            target=np.fromiter((e[1] for e in edges), dtype=np.int64, count=m),
+            weight=np.fromiter((e[2] for e in edges), dtype=np.float64, count=m),
+            confidence=np.fromiter(
+                (np.nan if e[3] is None else e[3] for e in edges),
+                dtype=np.float64,
+                count=m,
+            ),
+            map_hash=map_hash,
+        )
+
+    @property
+    def size(self) -> int:
+        return len(self.node_ids)
+
+    def effective_weights(self, use_confidence: bool) -> np.ndarray:
+        """Edge weights, times the confidence where set if use_confidence."""
+        if not use_confidence:
+            return self.weight
+        return np.where(
+            np.isnan(self.confidence), self.weight, self.weight * self.confidence
+        )
+
+    def indegree(self) -> np.ndarray:
+        return np.bincount(self.target, minlength=self.size)
+
+    def outdegree(self) -> np.ndarray:
+        return np.bincount(self.source, minlength=self.size)
@@ -0,0 +1,182 @@
+"""
+Versioned change events of the cognitive map store.
+
+Each change produces one event carrying the new version and hash and either
+the changed nodes, edges and scenarios ("delta") or only a request to fetch
+the whole map again ("resync", e.g. after loading another project).
+
+Endpoints edit the current map in place before calling put, so the previous
+state cannot be read from the old model. Instead the feed keeps a plain-dict
+index of the last published version and diffs the new map against it. The
+index is only maintained while someone is subscribed.
+"""
+
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from pydantic import TypeAdapter
+
+from app.models.cognitive_map_models import (
+    CognitiveMapModel,
+    EdgeModel,
+    NodeModel,
+    ScenarioModel,
+)
+from core.instrumentation import counter, gauge
+
+logger = logging.getLogger("app")
+
+# Deltas touching more elements than this are sent as a resync instead.
+MAX_DELTA_ITEMS = 2000
+SUBSCRIBER_QUEUE_SIZE = 256
+
+EVENTS_PUBLISHED = counter(
+    "map_change_events", "Change events published by type", ("type",)
+)
+SUBSCRIBERS = gauge("map_change_subscribers", "Connected change feed subscribers")
+
+_nodes_adapter = TypeAdapter(List[NodeModel])
+_edges_adapter = TypeAdapter(List[EdgeModel])
+_scenarios_adapter = TypeAdapter(List[ScenarioModel])
+
+
+@dataclass
+class MapIndex:
+    nodes: Dict[str, dict]
+    edges: Dict[Tuple[str, str], dict]
+    scenarios: Dict[str, dict]
+    fcm: dict
+
+
+def build_index(model: CognitiveMapModel) -> MapIndex:
+    nodes = _nodes_adapter.dump_python(model.nodes, mode="json")
+    edges = _edges_adapter.dump_python(model.edges, mode="json")
+    scenarios = _scenarios_adapter.dump_python(model.fcm.scenarios, mode="json")
+    return MapIndex(
+        nodes={n["id"]: n for n in nodes},
+        edges={(e["source"], e["target"]): e for e in edges},
+        scenarios={s["id"]: s for s in scenarios},
+        fcm=model.fcm.model_dump(mode="json", by_alias=True, exclude={"scenarios"}),
+    )
+
+
+def _diff(old: Dict[Any, dict], new: Dict[Any, dict]) -> Tuple[List[dict], list]:
+    upserted = [item for key, item in new.items() if old.get(key) != item]
+    removed = [key for key in old if key not in new]
+    return upserted, removed
+
+
+def diff_index(old: MapIndex, new: MapIndex) -> Dict[str, Any]:
+    """Changed and removed nodes (by id), edges (by source/target) and scenarios."""
+    nodes, removed_nodes = _diff(old.nodes, new.nodes)
+    edges, removed_edges = _diff(old.edges, new.edges)
+    scenarios, removed_scenarios = _diff(old.scenarios, new.scenarios)
+    return {
+        "nodes": {"upserted": nodes, "removed": removed_nodes},
+        "edges": {
+            "upserted": edges,
+            "removed": [{"source": s, "target": t} for s, t in removed_edges],
+        },
+        "scenarios": {"upserted": scenarios, "removed": removed_scenarios},
+        "fcm": new.fcm if new.fcm != old.fcm else None,
+    }
+
+
+def _delta_size(delta: Dict[str, Any]) -> int:
+    return sum(
+        len(delta[kind]["upserted"]) + len(delta[kind]["removed"])
+        for kind in ("nodes", "edges", "scenarios")
+    )
+
+
+class ChangeFeed:
+    """Version counter and fan-out of change events to subscriber queues."""
+
+    def __init__(self):
+        self.version = 0
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._index: Optional[MapIndex] = None
+
+        SUBSCRIBERS.callback = lambda: len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        Register a subscriber. Events arrive as JSON text; the caller should
+        fetch the map once after subscribing and then apply events whose
+        version follows the one it has.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+        if not self._subscribers:
+            self._index = None
+
+    def publish(
+        self,
+        reason: str,
+        model: CognitiveMapModel,
+        map_hash: str,
+        previous_hash: str,
+        resync: bool = False,
+        version: Optional[int] = None,
+    ) -> None:
+        """
+        Advance the version (or set it, for stores that keep their own
+        counter) and notify subscribers about the new map.
+        """
+        self.version = self.version + 1 if version is None else version
+        if not self._subscribers:
+            return
+
+        event: Dict[str, Any] = {
+            "type": "resync",
+            "version": self.version,
+            "reason": reason,
+            "hash": map_hash,
+            "previous_hash": previous_hash,
+        }
+        new_index = build_index(model)
+        if not resync and self._index is not None:
+            delta = diff_index(self._index, new_index)
+            if _delta_size(delta) <= MAX_DELTA_ITEMS:
+                event["type"] = "delta"
+                event.update(delta)
+        self._index = new_index
+
+        EVENTS_PUBLISHED.labels(event["type"]).inc()
+        self._broadcast(json.dumps(event, ensure_ascii=False), map_hash)
+
+    def hello(self, map_hash: str) -> str:
+        """First message of a subscription: the version it starts from."""
+        return json.dumps({"type": "hello", "version": self.version, "hash": map_hash})
+
+    def ensure_index(self, model: CognitiveMapModel) -> None:
+        if self._index is None:
+            self._index = build_index(model)
+
+    def _broadcast(self, message: str, map_hash: str) -> None:
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # A slow client has missed events; drop its backlog and make
+                # it fetch the whole map again.
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(
+                    json.dumps(
+                        {
+                            "type": "resync",
+                            "version": self.version,
+                            "reason": "overflow",
+                            "hash": map_hash,
+                        }
+                    )
+                )
+                logger.warning("Change feed subscriber fell behind, sent resync")
@@ -0,0 +1,155 @@
+"""
+Uniform grid over node positions (NodeUIModel x/y) for viewport queries.
+
+The store keeps one index and syncs it with the current map when a query
+comes in after a change. Syncing compares each node's position with the
+indexed one and only moves the nodes that changed cell; the per-node edge
+lists are rebuilt when the edges changed.
+"""
+
+from __future__ import annotations
+
+import math
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from app.models.cognitive_map_models import CognitiveMapModel, EdgeModel, NodeModel
+from core.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+# Side of a grid cell in layout units (pixels at zoom 1).
+CELL_SIZE = 256.0
+
+Cell = Tuple[int, int]
+
+
+class SpatialIndex:
+    def __init__(self, cell_size: float = CELL_SIZE):
+        self.cell_size = cell_size
+        self.map_hash: Optional[str] = None
+        self.positions: Dict[str, Tuple[float, float]] = {}
+        self.cells: Dict[Cell, Set[str]] = defaultdict(set)
+        self.nodes: Dict[str, NodeModel] = {}
+        self.order: Dict[str, int] = {}
+        self.edges: List[EdgeModel] = []
+        self.incident: Dict[str, List[int]] = {}
+        # Endpoints as positions in map order and weights, one per edge.
+        # Built by the first sync: the store creates its index at startup,
+        # before numpy needs to be imported.
+        self.edge_source: Optional[np.ndarray] = None
+        self.edge_target: Optional[np.ndarray] = None
+        self.edge_weight: Optional[np.ndarray] = None
+        self._edge_keys: List[Tuple[str, str, float, Optional[float]]] = []
+
+    def cell_of(self, x: float, y: float) -> Cell:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def sync(self, model: CognitiveMapModel, map_hash: str) -> int:
+        """
+        Bring the index up to date with `model`.
+
+        Returns:
+            Number of nodes added, moved to another cell or removed
+        """
+        if map_hash == self.map_hash:
+            return 0
+
+        changed = 0
+        nodes: Dict[str, NodeModel] = {}
+        for node in model.nodes:
+            nodes[node.id] = node
+            position = (node.ui.x, node.ui.y)
+            old = self.positions.get(node.id)
+            if old == position:
+                continue
+            cell = self.cell_of(*position)
+            if old is not None:
+                old_cell = self.cell_of(*old)
+                if old_cell == cell:
+                    self.positions[node.id] = position
+                    continue
+                self._discard(old_cell, node.id)
+            self.cells[cell].add(node.id)
+            self.positions[node.id] = position
+            changed += 1
+
+        for node_id in [i for i in self.positions if i not in nodes]:
+            self._discard(self.cell_of(*self.positions.pop(node_id)), node_id)
+            changed += 1
+        reordered = list(nodes) != list(self.nodes)
+        self.nodes = nodes
+        if reordered:
+            self.order = {node_id: i for i, node_id in enumerate(nodes)}
+
+        edge_keys = [(e.source, e.target, e.weight, e.confidence) for e in model.edges]
+        edges_changed = edge_keys != self._edge_keys
+        if edges_changed:
+            incident: Dict[str, List[int]] = defaultdict(list)
+            for i, edge in enumerate(model.edges):
+                incident[edge.source].append(i)
+                if edge.target != edge.source:
+                    incident[edge.target].append(i)
+            self.incident = dict(incident)
+            self._edge_keys = edge_keys
+        if reordered or edges_changed or self.edge_source is None:
+            # Edges to unknown nodes (rejected by the store) would map to -1.
+            self.edge_source = np.array(
+                [self.order.get(source, -1) for source, *_ in edge_keys],
+                dtype=np.int64,
+            )
+            self.edge_target = np.array(
+                [self.order.get(target, -1) for _, target, *_ in edge_keys],
+                dtype=np.int64,
+            )
+            self.edge_weight = np.array(
+                [weight for *_, weight, _ in edge_keys], dtype=np.float64
+            )
+        # Edge objects are replaced by some edits even when equal.
+        self.edges = list(model.edges)
+
+        self.map_hash = map_hash
+        return changed
+
+    def _discard(self, cell: Cell, node_id: str) -> None:
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(node_id)
+            if not members:
+                del self.cells[cell]
+
+    def _cells_in(
+        self, min_x: float, min_y: float, max_x: float, max_y: float
+    ) -> Iterator[Set[str]]:
+        (x0, y0), (x1, y1) = self.cell_of(min_x, min_y), self.cell_of(max_x, max_y)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.cells):
+            # A box wider than the map: scan the occupied cells instead.
+            for (cx, cy), members in self.cells.items():
+                if x0 <= cx <= x1 and y0 <= cy <= y1:
+                    yield members
+            return
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                members = self.cells.get((cx, cy))
+                if members:
+                    yield members
+
+    def query(
+        self, min_x: float, min_y: float, max_x: float, max_y: float
+    ) -> List[str]:
+        """Ids of the nodes inside the box (bounds included), in map order."""
+        found = []
+        for members in self._cells_in(min_x, min_y, max_x, max_y):
+            for node_id in members:
+                x, y = self.positions[node_id]
+                if min_x <= x <= max_x and min_y <= y <= max_y:
+                    found.append(node_id)
+        found.sort(key=self.order.__getitem__)
+        return found
+
+    def edges_touching(self, node_ids: List[str]) -> List[int]:
+        """Indices (in map order) of the edges with an endpoint in node_ids."""
+        touching: Set[int] = set()
+        for node_id in node_ids:
+            touching.update(self.incident.get(node_id, ()))
+        return sorted(touching)
@@ -0,0 +1,541 @@
+"""
+Cognitive map store persisted in SQLite, for running several worker processes.
+
+Nodes, edges and scenarios (with their results) are rows of their own, the
+FCM settings, the map hash, the open project path and a version counter live
+in `meta`, and the undo/redo stacks are whole-map documents in `history`.
+The database runs in WAL mode, so readers in other workers never wait for a
+writer.
+
+Every worker keeps the map in memory as CognitiveMapStore does and, before
+each operation, compares its version with the database's (one indexed read);
+if another worker wrote in between, it reloads the map from the rows. Writes
+run in a BEGIN IMMEDIATE transaction that first checks the version the
+worker's map was based on: a map edited in place after another worker's
+commit raises MapConflictError instead of overwriting that commit. Only the
+rows that differ from the last persisted version are written.
+
+The JSON project file stays the exchange format: opening or creating a
+project imports it into the database and save/save-as export it.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.models.cognitive_map_models import CognitiveMapModel
+from app.storage.cognitive_map_store import (
+    IO_DURATION,
+    REDO_STACK_SIZE,
+    UNDO_STACK_SIZE,
+    CognitiveMapStore,
+    MapConflictError,
+    read_map_file,
+    sha256_of,
+)
+
+logger = logging.getLogger("app")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS nodes (
+    id TEXT PRIMARY KEY, position INTEGER NOT NULL, body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS edges (
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    -- Occurrence of the (source, target) pair; maps may repeat an edge.
+    occurrence INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (source, target, occurrence)
+);
+CREATE TABLE IF NOT EXISTS scenarios (
+    id TEXT PRIMARY KEY, position INTEGER NOT NULL, body TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history (
+    stack TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    body BLOB NOT NULL,
+    PRIMARY KEY (stack, seq)
+);
+"""
+
+
+def _document(
+    map_version: int,
+    nodes: List[str],
+    edges: List[str],
+    fcm: str,
+    scenarios: List[str],
+) -> bytes:
+    """A map as JSON, assembled from row bodies."""
+    settings = json.loads(fcm)
+    settings["scenarios"] = [json.loads(body) for body in scenarios]
+    return (
+        '{"version":%d,"nodes":[%s],"edges":[%s],"fcm":%s}'
+        % (
+            map_version,
+            ",".join(nodes),
+            ",".join(edges),
+            json.dumps(settings, ensure_ascii=False),
+        )
+    ).encode("utf-8")
+
+
+class MapRows:
+    """Row bodies of one map version, keyed like the tables, in map order."""
+
+    def __init__(self, model: CognitiveMapModel):
+        dump = {"by_alias": True, "exclude_none": True}
+        self.nodes: Dict[str, str] = OrderedDict(
+            (node.id, node.model_dump_json(**dump)) for node in model.nodes
+        )
+        self.edges: Dict[Tuple[str, str, int], str] = OrderedDict()
+        occurrences: Dict[Tuple[str, str], int] = {}
+        for edge in model.edges:
+            pair = (edge.source, edge.target)
+            occurrence = occurrences.get(pair, 0)
+            occurrences[pair] = occurrence + 1
+            self.edges[(*pair, occurrence)] = edge.model_dump_json(**dump)
+        self.scenarios: Dict[str, str] = OrderedDict(
+            (scenario.id, scenario.model_dump_json(**dump))
+            for scenario in model.fcm.scenarios
+        )
+        self.fcm = model.fcm.model_dump_json(exclude={"scenarios"}, **dump)
+        # The file format version of the map, not the store's version.
+        self.map_version = model.version
+
+    def document(self) -> bytes:
+        return _document(
+            self.map_version,
+            list(self.nodes.values()),
+            list(self.edges.values()),
+            self.fcm,
+            list(self.scenarios.values()),
+        )
+
+
+def _write_table(
+    db: sqlite3.Connection,
+    table: str,
+    key_columns: Tuple[str, ...],
+    old: Dict,
+    new: Dict,
+) -> int:
+    """Apply the difference between two versions of a table; returns rows written."""
+    old_positions = {key: i for i, key in enumerate(old)}
+    where = " AND ".join(f"{c} = ?" for c in key_columns)
+    columns = ", ".join(key_columns)
+    marks = ", ".join("?" for _ in key_columns)
+
+    def as_tuple(key):
+        return key if isinstance(key, tuple) else (key,)
+
+    removed = [as_tuple(key) for key in old if key not in new]
+    upserts = []
+    moves = []
+    for position, (key, body) in enumerate(new.items()):
+        if old.get(key) != body:
+            upserts.append((*as_tuple(key), position, body))
+        elif old_positions[key] != position:
+            moves.append((position, *as_tuple(key)))
+
+    db.executemany(f"DELETE FROM {table} WHERE {where}", removed)
+    db.executemany(
+        f"INSERT OR REPLACE INTO {table} ({columns}, position, body) "
+        f"VALUES ({marks}, ?, ?)",
+        upserts,
+    )
+    db.executemany(f"UPDATE {table} SET position = ? WHERE {where}", moves)
+    return len(removed) + len(upserts) + len(moves)
+
+
+class SQLiteCognitiveMapStore(CognitiveMapStore):
+    def __init__(self, path: Path, db_path: Path, history_limit: int = 20, **kwargs):
+        super().__init__(path, history_limit=history_limit, **kwargs)
+        self.db_path = db_path
+        self.db: Optional[sqlite3.Connection] = None
+        # Database version the in-memory map corresponds to.
+        self.version = 0
+        self._rows = MapRows(self.current)
+        self._undo_count = 0
+        self._redo_count = 0
+
+        # The base class reports its in-memory stacks; here they are tables.
+        UNDO_STACK_SIZE.callback = lambda: self._undo_count
+        REDO_STACK_SIZE.callback = lambda: self._redo_count
+
+    # ---------- database ----------
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(
+            self.db_path, isolation_level=None, check_same_thread=False, timeout=30
+        )
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+        return db
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, **values) -> None:
+        self.db.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(key, str(value)) for key, value in values.items()],
+        )
+
+    def _db_version(self) -> int:
+        return int(self._meta("version") or 0)
+
+    def _read_document(self) -> bytes:
+        def bodies(table: str) -> List[str]:
+            query = f"SELECT body FROM {table} ORDER BY position"
+            return [row[0] for row in self.db.execute(query)]
+
+        return _document(
+            int(self._meta("map_version") or 1),
+            bodies("nodes"),
+            bodies("edges"),
+            self._meta("fcm") or "{}",
+            bodies("scenarios"),
+        )
+
+    def _stack_count(self, stack: str) -> int:
+        return self.db.execute(
+            "SELECT COUNT(*) FROM history WHERE stack = ?", (stack,)
+        ).fetchone()[0]
+
+    def _reload(self) -> None:
+        """Take over the database's map, version and project path."""
+        start = time.perf_counter()
+        self.current = CognitiveMapModel.model_validate_json(self._read_document())
+        self.current_hash = self._meta("hash") or sha256_of(self.current)
+        self._rows = MapRows(self.current)
+        self.version = self._db_version()
+        self.path = Path(self._meta("path") or self.path)
+        self._undo_count = self._stack_count("undo")
+        self._redo_count = self._stack_count("redo")
+        IO_DURATION.labels("db_load").observe(time.perf_counter() - start)
+
+    def _sync(self) -> None:
+        """Reload if another worker has written since our last operation."""
+        if self._db_version() != self.version:
+            previous_hash = self.current_hash
+            self._reload()
+            self.changes.publish(
+                "external",
+                self.current,
+                self.current_hash,
+                previous_hash,
+                resync=True,
+                version=self.version,
+            )
+
+    def _commit_map(
+        self,
+        model: CognitiveMapModel,
+        model_hash: str,
+        rows: MapRows,
+        base: Optional[MapRows] = None,
+        **meta,
+    ) -> int:
+        """
+        Write the rows that differ from `base` (the rows last persisted by
+        this worker if None); call inside a write transaction.
+        """
+        base = base or self._rows
+        written = _write_table(self.db, "nodes", ("id",), base.nodes, rows.nodes)
+        written += _write_table(
+            self.db,
+            "edges",
+            ("source", "target", "occurrence"),
+            base.edges,
+            rows.edges,
+        )
+        written += _write_table(
+            self.db, "scenarios", ("id",), base.scenarios, rows.scenarios
+        )
+        self.version = self._db_version() + 1
+        self._set_meta(
+            fcm=rows.fcm,
+            map_version=rows.map_version,
+            hash=model_hash,
+            version=self.version,
+            **meta,
+        )
+        self.current = model
+        self.current_hash = model_hash
+        self._rows = rows
+        return written
+
+    def _push(self, stack: str, map_hash: str, document: bytes) -> None:
+        top = self.db.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM history WHERE stack = ?", (stack,)
+        ).fetchone()[0]
+        self.db.execute(
+            "INSERT INTO history (stack, seq, hash, body) VALUES (?, ?, ?, ?)",
+            (stack, top + 1, map_hash, document),
+        )
+        self.db.execute(
+            "DELETE FROM history WHERE stack = ? AND seq <= ?",
+            (stack, top + 1 - self.history_limit),
+        )
+
+    def _pop(self, stack: str) -> Optional[Tuple[str, bytes]]:
+        row = self.db.execute(
+            "SELECT seq, hash, body FROM history WHERE stack = ? "
+            "ORDER BY seq DESC LIMIT 1",
+            (stack,),
+        ).fetchone()
+        if row is None:
+            return None
+        self.db.execute(
+            "DELETE FROM history WHERE stack = ? AND seq = ?", (stack, row[0])
+        )
+        return row[1], row[2]
+
+    def _transaction(self, operation: str, fn):
+        start = time.perf_counter()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn()
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+        self._undo_count = self._stack_count("undo")
+        self._redo_count = self._stack_count("redo")
+        IO_DURATION.labels(f"db_{operation}").observe(time.perf_counter() - start)
+        return result
+
+    def _replace_all(self, model: CognitiveMapModel, path: Path) -> None:
+        """Make `model` the current map (opening a project), without history."""
+
+        def replace():
+            # Another worker may have written rows this one has not read, so
+            # the tables are emptied rather than diffed against self._rows.
+            for table in ("nodes", "edges", "scenarios", "history"):
+                self.db.execute(f"DELETE FROM {table}")
+            empty = MapRows(CognitiveMapModel())
+            self._commit_map(
+                model, sha256_of(model), MapRows(model), base=empty, path=path
+            )
+            self.path = path
+
+        self._transaction("replace", replace)
+
+    # ---------- persistence ----------
+    async def load(self) -> None:
+        async with self._locked("load"):
+            previous_hash = self.current_hash
+            if self.db is None:
+                self.db = await asyncio.to_thread(self._connect)
+
+            def initialize():
+                # The first worker to start imports the project file; later
+                # ones (and restarts) take over the database's state.
+                if self._meta("version") is not None:
+                    return
+                model = CognitiveMapModel()
+                if self.path.exists():
+                    model = read_map_file(self.path)
+                    self._validate_integrity(model)
+                self.db.execute("DELETE FROM history")
+                self._commit_map(
+                    model, sha256_of(model), MapRows(model), path=self.path
+                )
+
+            await asyncio.to_thread(self._transaction, "load", initialize)
+            await asyncio.to_thread(self._reload)
+            logger.info(
+                "Cognitive map (SQLite %s, version %s): %s nodes, %s edges",
+                self.db_path,
+                self.version,
+                len(self.current.nodes),
+                len(self.current.edges),
+            )
+            self.loaded = True
+            self._publish("load", previous_hash, resync=True)
+
+    async def save_to_file(self) -> None:
+        async with self._locked("save_to_file"):
+            self._sync()
+            self._write(self.path, "save")
+            logger.info("Saved cognitive map to: %s", self.path)
+
+    async def save_on_shutdown(self) -> bool:
+        """
+        Export the map unless another worker already exported this version
+        to the same path. Workers stopping together take turns under the
+        database's write lock, so one of them writes the file.
+        """
+        async with self._locked("save_to_file"):
+            self._sync()
+
+            def export() -> bool:
+                if self._db_version() != self.version:
+                    self._reload()
+                # Save-as moves the project without a new map version.
+                self.path = Path(self._meta("path") or self.path)
+                exported = f"{self.version}:{self.path}"
+                if self._meta("exported") == exported:
+                    return False
+                self._write(self.path, "save")
+                self._set_meta(exported=exported)
+                return True
+
+            return await asyncio.to_thread(self._transaction, "save_to_file", export)
+
+    async def load_from_path(self, new_path: Path) -> None:
+        async with self._locked("load_from_path"):
+            if not new_path.exists():
+                raise FileNotFoundError(f"File not found: {new_path}")
+
+            snapshot = await self._read(new_path, "load")
+            self._validate_integrity(snapshot.map)
+
+            previous_hash = self.current_hash
+            await asyncio.to_thread(self._replace_all, snapshot.map, new_path)
+            self.loaded = True
+            self._publish("open", previous_hash, resync=True)
+            logger.info("Loaded cognitive map from: %s", new_path)
+
+    async def create_new_at_path(self, new_path: Path) -> None:
+        async with self._locked("create_new_at_path"):
+            previous_hash = self.current_hash
+            new_path.parent.mkdir(parents=True, exist_ok=True)
+            await asyncio.to_thread(self._replace_all, CognitiveMapModel(), new_path)
+            self._write(self.path, "save")
+            self.loaded = True
+            self._publish("new", previous_hash, resync=True)
+            logger.info("Created new cognitive map at: %s", new_path)
+
+    async def save_as(self, new_path: Path) -> None:
+        async with self._locked("save_as"):
+            self._sync()
+            new_path.parent.mkdir(parents=True, exist_ok=True)
+            self._write(new_path, "save")
+            self._transaction("save_as", lambda: self._set_meta(path=new_path))
+            self.path = new_path
+            logger.info("Saved cognitive map as: %s", new_path)
+
+    # ---------- API ops ----------
+    async def get(self) -> CognitiveMapModel:
+        async with self._locked("get"):
+            self._sync()
+            return self.current
+
+    async def put(
+        self, new_map: CognitiveMapModel, expected_hash: Optional[str] = None
+    ) -> CognitiveMapModel:
+        async with self._locked("put"):
+            if expected_hash is not None:
+                self._sync()
+                if expected_hash != self.current_hash:
+                    raise MapConflictError(
+                        f"Map has changed: expected {expected_hash}, "
+                        f"current is {self.current_hash}"
+                    )
+            self._validate_integrity(new_map)
+            new_hash = sha256_of(new_map)
+            if new_hash == self.current_hash:
+                return self.current
+
+            rows = MapRows(new_map)
+            based_on = self.version
+
+            def write():
+                if self._db_version() != based_on:
+                    # Another worker committed after this map was read; the
+                    # caller's edit was made on a stale map.
+                    raise MapConflictError(
+                        "Map was changed by another worker, reload and retry"
+                    )
+                # The persisted rows hold the previous version even when the
+                # caller edited self.current in place.
+                self._push("undo", self.current_hash, self._rows.document())
+                self.db.execute("DELETE FROM history WHERE stack = 'redo'")
+                return self._commit_map(new_map, new_hash, rows)
+
+            previous_hash = self.current_hash
+            try:
+                written = await asyncio.to_thread(self._transaction, "put", write)
+            except MapConflictError:
+                await asyncio.to_thread(self._reload)
+                raise
+            logger.debug("Map version %s: %s rows written", self.version, written)
+            self._publish("put", previous_hash)
+            return self.current
+
+    async def _step(self, operation: str, source: str, target: str):
+        async with self._locked(operation):
+            self._sync()
+            based_on = self.version
+
+            def step() -> bool:
+                if self._db_version() != based_on:
+                    # Another worker committed after the sync above; stepping
+                    # from the stale rows would drop its commit.
+                    raise MapConflictError(
+                        "Map was changed by another worker, reload and retry"
+                    )
+                entry = self._pop(source)
+                if entry is None:
+                    return False
+                self._push(target, self.current_hash, self._rows.document())
+                map_hash, document = entry
+                model = CognitiveMapModel.model_validate_json(document)
+                self._commit_map(model, map_hash, MapRows(model))
+                return True
+
+            previous_hash = self.current_hash
+            try:
+                stepped = await asyncio.to_thread(self._transaction, operation, step)
+            except MapConflictError:
+                await asyncio.to_thread(self._reload)
+                raise
+            if stepped:
+                self._publish(operation, previous_hash)
+            return self.current
+
+    async def undo(self) -> CognitiveMapModel:
+        return await self._step("undo", "undo", "redo")
+
+    async def redo(self) -> CognitiveMapModel:
+        return await self._step("redo", "redo", "undo")
+
+    async def history_info(self):
+        async with self._locked("history_info"):
+            self._sync()
+            return {
+                "limit": self.history_limit,
+                "undo_count": self._undo_count,
+                "redo_count": self._redo_count,
+                "current_hash": self.current_hash,
+                "version": self.version,
+            }
+
+    # ---------- change feed ----------
+    def _publish(self, reason: str, previous_hash: str, resync: bool = False) -> None:
+        self.changes.publish(
+            reason,
+            self.current,
+            self.current_hash,
+            previous_hash,
+            resync=resync,
+            version=self.version,
+        )
+
+    def close(self) -> None:
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,75 @@
+"""
+Project load benchmark.
+
+Compares the previous load path (json.loads + model_validate + hashing via
+json.dumps(sort_keys=True)) with read_map_file + sha256_of.
+
+Run from the backend directory:
+    python -m benchmarks.bench_load
+"""
+
+import argparse
+import hashlib
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from app.models.cognitive_map_models import CognitiveMapModel
+from app.storage.cognitive_map_store import read_map_file, sha256_of
+from benchmarks.synthetic import generate_map
+
+
+def legacy_load(path: Path) -> str:
+    data = json.loads(path.read_text(encoding="utf-8"))
+    model = CognitiveMapModel.model_validate(data)
+    payload = model.model_dump(by_alias=True, exclude_none=True)
+    canonical = json.dumps(
+        payload, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+    ).encode("utf-8")
+    return hashlib.sha256(canonical).hexdigest()
+
+
+def fast_load(path: Path) -> str:
+    return sha256_of(read_map_file(path))
+
+
+def best_of(fn, path: Path, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[100, 1000, 5000, 20000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'nodes':>8} {'legacy ms':>12} {'fast ms':>12} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = Path(tmp) / f"map_{size}.json"
+            model = generate_map(size, seed=size)
+            path.write_text(
+                json.dumps(
+                    model.model_dump(by_alias=True, exclude_none=True), indent=2
+                ),
+                encoding="utf-8",
+            )
+
+            legacy = best_of(legacy_load, path, args.repeat)
+            fast = best_of(fast_load, path, args.repeat)
+            print(
+                f"{size:>8} {legacy * 1000:>12.2f} {fast * 1000:>12.2f} "
+                f"{legacy / fast:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
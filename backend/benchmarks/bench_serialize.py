@@ -0,0 +1,82 @@
+"""
+Response serialization benchmark.
+
+Compares FastAPI's response path (response_model serialization, then
+jsonable_encoder and json.dumps) with pydantic-core model_dump_json and with
+a hit in the store's per-version serialized cache.
+
+Run from the backend directory:
+    python -m benchmarks.bench_serialize
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.models.cognitive_map_models import CognitiveMapModel
+from app.storage.cognitive_map_store import CognitiveMapStore
+from benchmarks.synthetic import generate_map
+
+_adapter = TypeAdapter(CognitiveMapModel)
+
+
+def fastapi_path(model: CognitiveMapModel) -> bytes:
+    content = _adapter.dump_python(model, mode="json", by_alias=True)
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def pydantic_path(model: CognitiveMapModel) -> bytes:
+    return model.model_dump_json(by_alias=True).encode("utf-8")
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[100, 1000, 5000, 20000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"{'nodes':>8} {'fastapi ms':>12} {'pydantic ms':>12} "
+        f"{'cached ms':>12} {'speedup':>8}"
+    )
+    for size in args.sizes:
+        model = generate_map(size, seed=size)
+        store = CognitiveMapStore(path=Path("unused.json"))
+        store.current = model
+        store.current_hash = f"bench-{size}"
+
+        assert json.loads(fastapi_path(model)) == json.loads(pydantic_path(model))
+
+        legacy = best_of(lambda: fastapi_path(model), args.repeat)
+        fast = best_of(lambda: pydantic_path(model), args.repeat)
+        store.serialized_current()
+        cached = best_of(store.serialized_current, args.repeat)
+        print(
+            f"{size:>8} {legacy * 1000:>12.2f} {fast * 1000:>12.2f} "
+            f"{cached * 1000:>12.4f} {legacy / fast:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Backend cold-start benchmark.
+
+Starts uvicorn in a fresh process with a generated project as the
+last-opened file and reports time until "/" answers (time-to-health) and
+until "/ready" answers 200 (time-to-ready), with background project loading
+on and off.
+
+Run from the backend directory:
+    python -m benchmarks.bench_startup
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from benchmarks.synthetic import generate_map
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def responds(url: str) -> bool:
+    try:
+        with urllib.request.urlopen(url, timeout=0.5) as response:
+            return response.status == 200
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return False
+
+
+def measure(workdir: Path, session: Path, background: bool, timeout: float):
+    port = free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(BACKEND_DIR),
+        "SESSION_FILE_PATH": str(session),
+        "XDG_DATA_HOME": str(workdir),
+        "BACKEND_BACKGROUND_LOAD": "1" if background else "0",
+    }
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    health = ready = None
+    try:
+        while time.perf_counter() - start < timeout:
+            if health is None and responds(f"{base}/"):
+                health = time.perf_counter() - start
+            if health is not None and responds(f"{base}/ready"):
+                ready = time.perf_counter() - start
+                break
+            time.sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait()
+    return health, ready
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 5000, 20000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    print(f"{'nodes':>8} {'mode':>12} {'health ms':>12} {'ready ms':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        for size in args.sizes:
+            project = workdir / f"map_{size}.json"
+            project.write_text(
+                generate_map(size, seed=size).model_dump_json(
+                    by_alias=True, exclude_none=True
+                ),
+                encoding="utf-8",
+            )
+            session = workdir / "session.json"
+
+            for background in (False, True):
+                runs = []
+                for _ in range(args.repeat):
+                    session.write_text(json.dumps({"lastOpened": str(project)}))
+                    runs.append(measure(workdir, session, background, args.timeout))
+                health = min(r[0] for r in runs if r[0] is not None)
+                ready = min(r[1] for r in runs if r[1] is not None)
+                mode = "background" if background else "blocking"
+                print(
+                    f"{size:>8} {mode:>12} {health * 1000:>12.1f} "
+                    f"{ready * 1000:>12.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+HTTP load test replaying UI sessions against the backend.
+
+Each virtual user loops over a weighted mix of what the UI does: dragging
+nodes (PUT /project/map), editing matrix cells, polling graph metrics,
+running scenarios and undo/redo. The report shows throughput, p50/p95/p99
+latency per route and, when the app runs in-process, how long its event loop
+was stalled (time callbacks waited beyond their schedule).
+
+Run from the backend directory:
+    python -m benchmarks.loadtest --users 8 --duration 30 --nodes 500
+    python -m benchmarks.loadtest --url http://127.0.0.1:8001   # running app
+
+In-process mode serves the app from a thread of this process, so client and
+server share the GIL; use --url against a separate process for absolute
+latencies, and in-process mode for stall measurements and comparisons.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.synthetic import generate_map
+
+# (action, weight) of a typical editing session
+SESSION_MIX = [
+    ("drag", 40),
+    ("matrix_edit", 15),
+    ("metrics_poll", 25),
+    ("scenario_run", 10),
+    ("undo_redo", 10),
+]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, route: str, seconds: float, ok: bool) -> None:
+        self.latencies[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+
+
+class StallMonitor:
+    """Measures event loop lag by scheduling a tick every `interval` seconds."""
+
+    def __init__(self, interval: float = 0.01, threshold: float = 0.005):
+        self.interval = interval
+        self.threshold = threshold
+        self.total = 0.0
+        self.max = 0.0
+        self.stalls = 0
+        self.running = True
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self.running:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - expected
+            if lag > self.threshold:
+                self.total += lag
+                self.stalls += 1
+                self.max = max(self.max, lag)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def timed(
+    client: httpx.AsyncClient, stats: Stats, route: str, method: str, url: str, **kw
+) -> Optional[httpx.Response]:
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kw)
+    except httpx.HTTPError:
+        stats.record(route, time.perf_counter() - start, ok=False)
+        return None
+    stats.record(route, time.perf_counter() - start, ok=response.status_code < 400)
+    return response
+
+
+async def virtual_user(
+    client: httpx.AsyncClient, stats: Stats, deadline: float, seed: int
+) -> None:
+    rng = random.Random(seed)
+    actions = [a for a, _ in SESSION_MIX]
+    weights = [w for _, w in SESSION_MIX]
+
+    response = await timed(client, stats, "GET /project/map", "GET", "/project/map")
+    cached_map = response.json() if response is not None else None
+
+    while time.perf_counter() < deadline:
+        action = rng.choices(actions, weights)[0]
+
+        if action == "drag" and cached_map and cached_map["nodes"]:
+            node = rng.choice(cached_map["nodes"])
+            node["ui"]["x"] += rng.uniform(-20, 20)
+            node["ui"]["y"] += rng.uniform(-20, 20)
+            response = await timed(
+                client,
+                stats,
+                "PUT /project/map",
+                "PUT",
+                "/project/map",
+                json=cached_map,
+            )
+            if response is not None and response.status_code == 200:
+                cached_map = response.json()
+
+        elif action == "matrix_edit" and cached_map and len(cached_map["nodes"]) > 1:
+            n = len(cached_map["nodes"])
+            source, target = rng.sample(range(n), 2)
+            weight = rng.choice([None, round(rng.uniform(-1, 1), 2)])
+            await timed(
+                client,
+                stats,
+                "PUT /matrix/cell",
+                "PUT",
+                "/matrix/cell",
+                json={
+                    "source_index": source,
+                    "target_index": target,
+                    "weight": weight,
+                },
+            )
+            await timed(client, stats, "GET /matrix", "GET", "/matrix")
+
+        elif action == "metrics_poll":
+            await timed(client, stats, "GET /metrics", "GET", "/metrics")
+
+        elif action == "scenario_run":
+            response = await timed(
+                client, stats, "GET /scenarios/", "GET", "/scenarios/"
+            )
+            if response is not None and response.status_code == 200 and response.json():
+                scenario = rng.choice(response.json())
+                await timed(
+                    client,
+                    stats,
+                    "POST /scenarios/{id}/run",
+                    "POST",
+                    f"/scenarios/{scenario['id']}/run",
+                )
+
+        elif action == "undo_redo":
+            await timed(client, stats, "POST /project/undo", "POST", "/project/undo")
+            await timed(client, stats, "POST /project/redo", "POST", "/project/redo")
+
+
+async def prepare(client: httpx.AsyncClient) -> None:
+    """Make sure there is a scenario to run."""
+    scenarios = (await client.get("/scenarios/")).json()
+    if scenarios:
+        return
+    project = (await client.get("/project/map")).json()
+    inputs = [n["id"] for n in project["nodes"][: max(1, len(project["nodes"]) // 20)]]
+    await client.post(
+        "/scenarios/",
+        json={
+            "name": "loadtest",
+            "iteration_mode": "auto",
+            "max_iterations": 50,
+            "initial_states": {node_id: 0.5 for node_id in inputs},
+        },
+    )
+
+
+async def run_load(base_url: str, users: int, duration: float, seed: int) -> dict:
+    stats = Stats()
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(
+        base_url=f"{base_url}/api/v1", timeout=120.0, limits=limits
+    ) as client:
+        await prepare(client)
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(
+            *(virtual_user(client, stats, deadline, seed + i) for i in range(users))
+        )
+        elapsed = time.perf_counter() - started
+
+    routes = {}
+    for route, values in sorted(stats.latencies.items()):
+        routes[route] = {
+            "count": len(values),
+            "errors": stats.errors.get(route, 0),
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "mean_ms": statistics.fmean(values) * 1000,
+        }
+    total = sum(r["count"] for r in routes.values())
+    return {
+        "users": users,
+        "duration_seconds": elapsed,
+        "requests": total,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "routes": routes,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_in_process(workdir: Path, nodes: int, seed: int):
+    """Serve app.main:app from a background thread on a generated project."""
+    project = workdir / "project.json"
+    project.write_text(
+        generate_map(nodes, seed=seed).model_dump_json(
+            by_alias=True, exclude_none=True
+        ),
+        encoding="utf-8",
+    )
+    session = workdir / "session.json"
+    session.write_text(json.dumps({"lastOpened": str(project)}), encoding="utf-8")
+
+    os.environ["SESSION_FILE_PATH"] = str(session)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.chdir(workdir)  # logs/ is created relative to the working directory
+
+    import uvicorn
+    from app.main import app
+
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(
+        target=loop.run_until_complete, args=(server.serve(),), daemon=True
+    )
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    monitor = StallMonitor()
+    asyncio.run_coroutine_threadsafe(monitor.run(), loop)
+    return f"http://127.0.0.1:{port}", server, thread, monitor
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"\n{report['requests']} requests in {report['duration_seconds']:.1f}s "
+        f"with {report['users']} users: {report['throughput_rps']:.1f} req/s"
+    )
+    print(
+        f"\n{'route':<28} {'count':>7} {'err':>5} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    )
+    for route, r in report["routes"].items():
+        print(
+            f"{route:<28} {r['count']:>7} {r['errors']:>5} "
+            f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}"
+        )
+    stall = report.get("event_loop")
+    if stall:
+        print(
+            f"\nEvent loop stalled {stall['stalled_seconds']:.2f}s "
+            f"({stall['stalled_ratio'] * 100:.1f}% of run) in {stall['stalls']} "
+            f"stalls, longest {stall['max_stall_ms']:.1f} ms"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="target a running backend instead")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--nodes", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="also write the report here")
+    args = parser.parse_args()
+
+    server = thread = monitor = tmpdir = None
+    base_url = args.url
+    cwd = Path.cwd()
+    try:
+        if base_url is None:
+            tmpdir = tempfile.TemporaryDirectory(
+                prefix="cm-loadtest-", ignore_cleanup_errors=True
+            )
+            base_url, server, thread, monitor = start_in_process(
+                Path(tmpdir.name), args.nodes, args.seed
+            )
+
+        report = asyncio.run(run_load(base_url, args.users, args.duration, args.seed))
+
+        if monitor is not None:
+            monitor.running = False
+            report["event_loop"] = {
+                "stalled_seconds": monitor.total,
+                "stalled_ratio": monitor.total / report["duration_seconds"],
+                "stalls": monitor.stalls,
+                "max_stall_ms": monitor.max * 1000,
+            }
+    finally:
+        if server is not None:
+            # The server saves the project on shutdown, so the directory is
+            # removed only after it stopped.
+            server.should_exit = True
+            thread.join(timeout=30)
+        if tmpdir is not None:
+            os.chdir(cwd)
+            tmpdir.cleanup()
+
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
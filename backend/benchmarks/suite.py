@@ -0,0 +1,299 @@
+"""
+Benchmark suite for backend hot paths.
+
+Every case runs on seeded synthetic maps (see benchmarks/synthetic.py), so
+runs are comparable across commits on the same machine. Results are written
+as JSON; a run can be saved as a named baseline and later runs compared
+against it.
+
+Run from the backend directory:
+    python -m benchmarks.suite                          # all cases
+    python -m benchmarks.suite --cases store --sizes 1000 20000
+    python -m benchmarks.suite --save-baseline main     # record a baseline
+    python -m benchmarks.suite --compare main           # exit 1 on regression
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from app.models.cognitive_map_models import CognitiveMapModel, ScenarioParams
+from app.services.matrix_service import MatrixService
+from app.services.metrics_service import MetricsService
+from app.services.scenario_service import ScenarioService
+from app.storage.cognitive_map_store import CognitiveMapStore, sha256_of
+from benchmarks.synthetic import generate_map, moved_copy
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+BASELINES_DIR = BENCH_DIR / "baselines"
+
+DEFAULT_SIZES = [10, 100, 1000, 5000, 20000]
+
+_loop = asyncio.new_event_loop()
+# Removed when the interpreter exits.
+_tmpdir = tempfile.TemporaryDirectory(prefix="cm-bench-")
+_workdir = Path(_tmpdir.name)
+
+
+def run_async(coro):
+    return _loop.run_until_complete(coro)
+
+
+@lru_cache(maxsize=4)
+def synthetic_map(size: int) -> CognitiveMapModel:
+    """Shared read-only map per size; cases that mutate take a copy."""
+    return generate_map(size, seed=size, n_scenarios=3)
+
+
+@dataclass
+class Case:
+    name: str
+    setup: Callable[[int], Any]
+    run: Callable[[Any], Any]
+    # Untimed step between repetitions, e.g. redo after a timed undo.
+    reset: Optional[Callable[[Any], Any]] = None
+    # Larger sizes are skipped where the implementation is quadratic.
+    max_nodes: int = max(DEFAULT_SIZES)
+
+
+def _simulation_setup(size: int):
+    model = synthetic_map(size)
+    params = ScenarioParams(
+        name="bench",
+        activation_type="sigmoid",
+        iteration_mode="fixed",
+        max_iterations=20,
+        initial_states={n.id: 0.5 for n in model.nodes[: max(1, size // 50)]},
+    )
+    return model, params
+
+
+def _store_setup(size: int) -> CognitiveMapStore:
+    path = _workdir / f"store_{size}.json"
+    store = CognitiveMapStore(path=path, history_limit=20)
+    store.current = synthetic_map(size)
+    store.current_hash = sha256_of(store.current)
+    return store
+
+
+def _put_setup(size: int):
+    store = _store_setup(size)
+    variants = [synthetic_map(size), moved_copy(synthetic_map(size), seed=size)]
+    return {"store": store, "variants": variants, "i": 0}
+
+
+def _put_run(state):
+    state["i"] ^= 1
+    run_async(state["store"].put(state["variants"][state["i"]]))
+
+
+def _undo_setup(size: int):
+    state = _put_setup(size)
+    for _ in range(3):
+        _put_run(state)
+    return state["store"]
+
+
+def _load_setup(size: int) -> CognitiveMapStore:
+    store = _store_setup(size)
+    run_async(store.save_to_file())
+    return store
+
+
+def _update_cell_setup(size: int):
+    return {"map": synthetic_map(size).model_copy(deep=True), "weight": None}
+
+
+def _update_cell_run(state):
+    state["weight"] = 0.5 if state["weight"] is None else None
+    MatrixService.update_cell(state["map"], 0, 1, state["weight"], 1.0)
+
+
+CASES = [
+    Case(
+        "scenario.run_simulation",
+        _simulation_setup,
+        lambda s: ScenarioService.run_simulation(*s),
+    ),
+    Case(
+        "scenario.run_simulation[reference]",
+        _simulation_setup,
+        lambda s: ScenarioService.run_simulation(*s, engine="reference"),
+        max_nodes=500,
+    ),
+    Case(
+        "scenario.build_adjacency_matrix",
+        synthetic_map,
+        lambda m: ScenarioService.build_adjacency_matrix(m, use_confidence=True),
+        max_nodes=5000,
+    ),
+    Case(
+        "matrix.build_matrix",
+        synthetic_map,
+        MatrixService.build_matrix,
+        max_nodes=2000,
+    ),
+    Case("matrix.update_cell", _update_cell_setup, _update_cell_run),
+    Case(
+        "metrics.calculate_metrics",
+        synthetic_map,
+        MetricsService.calculate_metrics,
+        max_nodes=2000,
+    ),
+    Case("store.sha256_of", synthetic_map, sha256_of),
+    Case("store.put", _put_setup, _put_run),
+    Case(
+        "store.undo",
+        _undo_setup,
+        lambda store: run_async(store.undo()),
+        reset=lambda store: run_async(store.redo()),
+    ),
+    Case("store.load", _load_setup, lambda store: run_async(store.load())),
+    Case(
+        "store.save_to_file",
+        _store_setup,
+        lambda store: run_async(store.save_to_file()),
+    ),
+]
+
+
+def measure(case: Case, size: int, repeat: int, budget: float) -> dict:
+    state = case.setup(size)
+    timings = []
+    deadline = time.perf_counter() + budget
+    for _ in range(repeat):
+        start = time.perf_counter()
+        case.run(state)
+        timings.append(time.perf_counter() - start)
+        if case.reset is not None:
+            case.reset(state)
+        if time.perf_counter() > deadline:
+            break
+    return {
+        "case": case.name,
+        "nodes": size,
+        "repeat": len(timings),
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCH_DIR,
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict, threshold: float, min_delta: float) -> bool:
+    """
+    Print best-time ratios against a baseline; return True if none regressed.
+
+    The minimum of the repetitions is compared because it is the least noisy
+    estimate; differences below `min_delta` seconds are never reported.
+    """
+    ok = True
+    print(f"\n{'case':<34} {'nodes':>6} {'base ms':>10} {'now ms':>10} {'ratio':>7}")
+    for key, result in current["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        ratio = result["min"] / base["min"] if base["min"] else 1.0
+        flag = ""
+        if ratio > threshold and result["min"] - base["min"] > min_delta:
+            flag = "  REGRESSION"
+            ok = False
+        print(
+            f"{result['case']:<34} {result['nodes']:>6} "
+            f"{base['min'] * 1000:>10.3f} {result['min'] * 1000:>10.3f} "
+            f"{ratio:>6.2f}x{flag}"
+        )
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cases", nargs="*", help="substrings of case names")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument(
+        "--budget", type=float, default=5.0, help="seconds per case and size"
+    )
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "latest.json")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    parser.add_argument(
+        "--threshold", type=float, default=1.25, help="time ratio that fails"
+    )
+    parser.add_argument(
+        "--min-delta-ms",
+        type=float,
+        default=0.1,
+        help="ignore slowdowns smaller than this",
+    )
+    args = parser.parse_args()
+
+    cases = [
+        c
+        for c in CASES
+        if not args.cases or any(pattern in c.name for pattern in args.cases)
+    ]
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": {},
+    }
+
+    print(f"{'case':<34} {'nodes':>6} {'median ms':>12} {'min ms':>12} {'n':>4}")
+    for case in cases:
+        for size in args.sizes:
+            if size > case.max_nodes:
+                continue
+            result = measure(case, size, args.repeat, args.budget)
+            report["results"][f"{case.name}@{size}"] = result
+            print(
+                f"{case.name:<34} {size:>6} {result['median'] * 1000:>12.3f} "
+                f"{result['min'] * 1000:>12.3f} {result['repeat']:>4}"
+            )
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults written to {args.output}")
+
+    if args.save_baseline:
+        BASELINES_DIR.mkdir(parents=True, exist_ok=True)
+        path = BASELINES_DIR / f"{args.save_baseline}.json"
+        path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Baseline saved to {path}")
+
+    if args.compare:
+        path = BASELINES_DIR / f"{args.compare}.json"
+        baseline = json.loads(path.read_text(encoding="utf-8"))
+        if not compare(report, baseline, args.threshold, args.min_delta_ms / 1000):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Seeded generator of synthetic cognitive maps for benchmarks.
+
+Maps mimic what users build: concepts are arranged in causal layers, most
+edges point "downstream" (so the map is mostly acyclic), and a small share
+of edges points back upstream, forming feedback clusters.
+"""
+
+import random
+
+from app.models.cognitive_map_models import (
+    CognitiveMapModel,
+    EdgeModel,
+    FCMModel,
+    NodeModel,
+    NodeUIModel,
+    ScenarioModel,
+    ScenarioParams,
+)
+
+
+def generate_map(
+    n_nodes: int,
+    edges_per_node: float = 3.0,
+    seed: int = 0,
+    feedback_ratio: float = 0.05,
+    with_confidence: bool = True,
+    n_scenarios: int = 0,
+    preferred_ratio: float = 0.1,
+) -> CognitiveMapModel:
+    """
+    Args:
+        n_nodes: Number of concepts
+        edges_per_node: Average out-degree (density)
+        seed: Random seed; the same arguments always give the same map
+        feedback_ratio: Share of edges pointing upstream (creating cycles)
+        with_confidence: Whether edges carry a confidence value
+        n_scenarios: Number of scenarios with random initial states
+        preferred_ratio: Share of nodes with a preferred_state
+    """
+    rng = random.Random(seed)
+    side = max(1, int(n_nodes**0.5))
+
+    nodes = []
+    for i in range(n_nodes):
+        preferred = None
+        if rng.random() < preferred_ratio:
+            preferred = rng.choice(["increase", "decrease"])
+        nodes.append(
+            NodeModel(
+                id=f"n{i}",
+                label=f"Concept {i}",
+                ui=NodeUIModel(
+                    x=(i % side) * 120 + rng.uniform(-30, 30),
+                    y=(i // side) * 120 + rng.uniform(-30, 30),
+                ),
+                preferred_state=preferred,
+            )
+        )
+
+    edges: list[EdgeModel] = []
+    seen: set[tuple[int, int]] = set()
+    target_edges = min(int(n_nodes * edges_per_node), n_nodes * (n_nodes - 1))
+    # Node index doubles as causal rank; edges mostly go to nearby later ranks.
+    reach = max(2, n_nodes // 20)
+    attempts = target_edges * 50
+    while n_nodes > 1 and len(edges) < target_edges and attempts:
+        attempts -= 1
+        source = rng.randrange(n_nodes)
+        offset = rng.randint(1, reach)
+        if rng.random() < feedback_ratio:
+            offset = -offset
+        target = source + offset
+        if not 0 <= target < n_nodes or (source, target) in seen:
+            continue
+        seen.add((source, target))
+        edges.append(
+            EdgeModel(
+                source=f"n{source}",
+                target=f"n{target}",
+                weight=round(rng.uniform(-1.0, 1.0), 3),
+                confidence=(
+                    round(rng.uniform(0.3, 1.0), 2) if with_confidence else None
+                ),
+            )
+        )
+
+    # Fixed timestamp so the same seed gives byte-identical maps.
+    now = "2025-01-01T00:00:00Z"
+    scenarios = []
+    for s in range(n_scenarios):
+        inputs = rng.sample(range(n_nodes), k=min(n_nodes, max(1, n_nodes // 50)))
+        scenarios.append(
+            ScenarioModel(
+                id=f"scenario-{s}",
+                params=ScenarioParams(
+                    name=f"Scenario {s}",
+                    activation_type=rng.choice(["sigmoid", "tanh"]),
+                    use_confidence=with_confidence and rng.random() < 0.5,
+                    iteration_mode=rng.choice(["fixed", "auto"]),
+                    max_iterations=rng.choice([20, 50, 100]),
+                    initial_states={
+                        f"n{i}": round(rng.uniform(-1.0, 1.0), 2) for i in inputs
+                    },
+                ),
+                created_at=now,
+                updated_at=now,
+            )
+        )
+
+    return CognitiveMapModel(
+        nodes=nodes, edges=edges, fcm=FCMModel(scenarios=scenarios)
+    )
+
+
+def moved_copy(model: CognitiveMapModel, seed: int = 0) -> CognitiveMapModel:
+    """Copy of `model` with one node dragged, as the UI sends after a drag."""
+    rng = random.Random(seed)
+    copy = model.model_copy(deep=True)
+    if copy.nodes:
+        node = copy.nodes[rng.randrange(len(copy.nodes))]
+        node.ui.x += rng.uniform(-50, 50)
+        node.ui.y += rng.uniform(-50, 50)
+    return copy
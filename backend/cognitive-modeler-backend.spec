@@ -46,7 +46,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,  # UPX decompression slows every cold start
     upx_exclude=[],
     runtime_tmpdir=None,
     console=True,
@@ -1,12 +1,88 @@
+import atexit
+import logging
 import logging.config
+import logging.handlers
 import os
+import queue
+import random
 
 LOG_DIR = "logs"
 APP_LOG_FILE = os.path.join(LOG_DIR, "app.log")
 TEST_LOG_FILE = os.path.join(LOG_DIR, "test.log")
 
+# Records waiting for the background writer; when full, new records are
+# dropped instead of blocking the request that logs them.
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Longer messages (e.g. accidentally logged payloads) are cut to this size.
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+
 os.makedirs(LOG_DIR, exist_ok=True)
 
+
+def _parse_mapping(value: str) -> dict[str, str]:
+    """Parse "name=value,other=value" environment settings."""
+    result = {}
+    for item in value.split(","):
+        name, sep, setting = item.partition("=")
+        if sep and name.strip():
+            result[name.strip()] = setting.strip()
+    return result
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks the caller.
+
+    Only the message itself is built here (so mutable arguments are captured
+    as they were); timestamps and the final line are formatted by the
+    listener thread.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        if len(record.msg) > LOG_MAX_MESSAGE_CHARS:
+            omitted = len(record.msg) - LOG_MAX_MESSAGE_CHARS
+            record.msg = (
+                f"{record.msg[:LOG_MAX_MESSAGE_CHARS]}"
+                f"... [{omitted} chars truncated]"
+            )
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of records below WARNING for the configured loggers.
+
+    Rates come from LOG_SAMPLE_RATES, e.g. "app=0.1"; the most specific
+    logger name prefix wins.
+    """
+
+    def __init__(self, rates: str = ""):
+        super().__init__()
+        self.rates = {name: float(rate) for name, rate in _parse_mapping(rates).items()}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.rates or record.levelno >= logging.WARNING:
+            return True
+        name = record.name
+        while name:
+            rate = self.rates.get(name)
+            if rate is not None:
+                return random.random() < rate
+            name = name.rpartition(".")[0]
+        return True
+
+
 LOGGING_CONFIG = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -15,6 +91,12 @@ LOGGING_CONFIG = {
             "format": "%(asctime)s - %(levelname)s - %(message)s",
         }
     },
+    "filters": {
+        "sampling": {
+            "()": SamplingFilter,
+            "rates": os.getenv("LOG_SAMPLE_RATES", ""),
+        },
+    },
     "handlers": {
         "file": {
             "class": "logging.handlers.RotatingFileHandler",
@@ -27,19 +109,50 @@ LOGGING_CONFIG = {
             "class": "logging.StreamHandler",
             "formatter": "default",
         },
+        "queue": {
+            "class": "core.logging_config.BoundedQueueHandler",
+            "queue": {"()": "queue.Queue", "maxsize": LOG_QUEUE_SIZE},
+            "handlers": ["file", "console"],
+            "filters": ["sampling"],
+            "respect_handler_level": True,
+        },
     },
     "loggers": {
         "app": {
-            "level": "DEBUG",
-            "handlers": ["file", "console"],
+            "level": os.getenv("LOG_LEVEL", "DEBUG").upper(),
+            "handlers": ["queue"],
             "propagate": False,
         },
     },
 }
 
 
+def _stop_queue_listener(handler: BoundedQueueHandler) -> None:
+    handler.listener.stop()
+    if handler.dropped:
+        record = logging.makeLogRecord(
+            {
+                "name": "app",
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": f"Dropped {handler.dropped} log records (queue full)",
+            }
+        )
+        for target in handler.listener.handlers:
+            target.handle(record)
+
+
 def setup_logging():
     is_testing = "pytest" in os.environ.get("_", "")
     log_file = TEST_LOG_FILE if is_testing else APP_LOG_FILE
     LOGGING_CONFIG["handlers"]["file"]["filename"] = log_file
+
+    # Per-logger levels, e.g. LOG_LEVELS="app=INFO,uvicorn.access=WARNING"
+    for name, level in _parse_mapping(os.getenv("LOG_LEVELS", "")).items():
+        LOGGING_CONFIG["loggers"].setdefault(name, {})["level"] = level.upper()
+
     logging.config.dictConfig(LOGGING_CONFIG)
+
+    queue_handler = logging.getHandlerByName("queue")
+    queue_handler.listener.start()
+    atexit.register(_stop_queue_listener, queue_handler)
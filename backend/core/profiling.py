@@ -0,0 +1,175 @@
+"""
+Opt-in per-request profiling.
+
+PROFILE_REQUESTS selects which requests are profiled:
+    "header" (default) - only requests sent with "X-Profile: 1"
+    "all"              - every HTTP request
+    "off"              - never
+
+Each profile is a cProfile/pstats dump under logs/profiles plus a JSON
+sidecar with the route, timing, map hash, request parameters and the top
+functions. cProfile follows the event loop thread, so it also records other
+requests served concurrently and misses work done in worker threads.
+"""
+
+import asyncio
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, List, Optional
+from urllib.parse import parse_qsl
+
+from core.instrumentation import route_template
+from core.logging_config import LOG_DIR
+
+PROFILE_DIR = Path(LOG_DIR) / "profiles"
+PROFILE_MODE = os.getenv("PROFILE_REQUESTS", "header").lower()
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+PROFILE_HEADER = b"x-profile"
+
+logger = logging.getLogger("app")
+
+# Only one cProfile profiler can be active per process.
+_active = threading.Lock()
+
+
+def _wants_profile(scope) -> bool:
+    if PROFILE_MODE == "all":
+        return True
+    if PROFILE_MODE != "header":
+        return False
+    for name, value in scope.get("headers", ()):
+        if name == PROFILE_HEADER:
+            return value.strip().lower() in (b"1", b"true", b"yes")
+    return False
+
+
+def _top_functions(profiler: cProfile.Profile, limit: int = 20) -> List[dict]:
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), stat in stats.stats.items():
+        _, calls, tottime, cumtime, _ = stat
+        rows.append(
+            {
+                "function": f"{filename}:{line}({name})",
+                "calls": calls,
+                "tottime": round(tottime, 6),
+                "cumtime": round(cumtime, 6),
+            }
+        )
+    rows.sort(key=lambda row: row["cumtime"], reverse=True)
+    return rows[:limit]
+
+
+def _save_profile(profiler: cProfile.Profile, meta: dict) -> None:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", meta["path"]).strip("_") or "root"
+    timestamp = meta["started_at"].replace("-", "")
+    stem = f"{timestamp}_{meta['method']}_{slug}"
+    meta["name"] = stem
+    meta["top_functions"] = _top_functions(profiler)
+
+    profiler.dump_stats(PROFILE_DIR / f"{stem}.prof")
+    (PROFILE_DIR / f"{stem}.json").write_text(
+        json.dumps(meta, ensure_ascii=False, indent=2, default=str), encoding="utf-8"
+    )
+
+    sidecars = sorted(PROFILE_DIR.glob("*.json"))
+    for old in sidecars[: max(0, len(sidecars) - PROFILE_MAX_FILES)]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".prof").unlink(missing_ok=True)
+
+
+def list_profiles(limit: int = 20) -> List[dict]:
+    """Sidecar metadata of the most recent profiles, newest first."""
+    if not PROFILE_DIR.exists():
+        return []
+    profiles = []
+    for path in sorted(PROFILE_DIR.glob("*.json"), reverse=True)[:limit]:
+        try:
+            meta = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        meta["top_functions"] = meta.get("top_functions", [])[:5]
+        profiles.append(meta)
+    return profiles
+
+
+def profile_file(name: str) -> Optional[Path]:
+    """Path of a saved .prof file, or None for unknown or unsafe names."""
+    if not re.fullmatch(r"[A-Za-z0-9_.]+", name):
+        return None
+    path = PROFILE_DIR / f"{name}.prof"
+    return path if path.exists() else None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling selected requests with cProfile.
+
+    `context` is called after the response and returns extra metadata for
+    the sidecar (e.g. the current map hash and scenario parameters).
+    """
+
+    def __init__(self, app, context: Optional[Callable[[dict], dict]] = None):
+        self.app = app
+        self.context = context
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or PROFILE_MODE == "off"
+            or not _wants_profile(scope)
+            or not _active.acquire(blocking=False)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started_at = datetime.now(timezone.utc)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                profiler.disable()
+        finally:
+            _active.release()
+
+        meta = {
+            "started_at": started_at.strftime("%Y-%m-%dT%H-%M-%S.%fZ"),
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": route_template(scope),
+            "path_params": scope.get("path_params", {}),
+            "query": dict(parse_qsl(scope.get("query_string", b"").decode())),
+            "status": status,
+            "duration_seconds": round(time.perf_counter() - start, 6),
+        }
+        if self.context is not None:
+            try:
+                meta.update(self.context(scope))
+            except Exception as e:
+                logger.warning("Failed to collect profile context: %s", e)
+
+        try:
+            await asyncio.to_thread(_save_profile, profiler, meta)
+        except Exception as e:
+            logger.error("Failed to save request profile: %s", e)
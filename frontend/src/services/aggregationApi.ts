@@ -0,0 +1,22 @@
+import apiClient from './api'
+import type {
+  AggregationRequest,
+  AggregationResult,
+  JobInfo
+} from '@/types/cognitive_map_models'
+
+export const aggregationApi = {
+  /**
+   * Merge several expert maps into a new project file. Follow the returned
+   * job with jobsApi.follow; its result lists the most disputed edges.
+   */
+  async startAggregation(
+    request: AggregationRequest
+  ): Promise<JobInfo<AggregationResult>> {
+    const response = await apiClient.post<JobInfo<AggregationResult>>(
+      '/aggregation',
+      request
+    )
+    return response.data
+  }
+}
@@ -0,0 +1,43 @@
+import apiClient from './api'
+import type {
+  CalibrationOptions,
+  CalibrationResult,
+  JobInfo
+} from '@/types/cognitive_map_models'
+
+export const calibrationApi = {
+  /**
+   * Fit the map's edge weights to a CSV time series (one row per time step).
+   * Follow the returned job with jobsApi.follow; progress events carry the
+   * losses as CalibrationProgress. The fitted weights are one undoable change.
+   */
+  async startCalibration(
+    file: File | Blob,
+    options: CalibrationOptions = {}
+  ): Promise<JobInfo<CalibrationResult>> {
+    const form = new FormData()
+    form.append('file', file)
+    const fields: Record<string, unknown> = {
+      mapping: options.mapping && JSON.stringify(options.mapping),
+      sequence_column: options.sequenceColumn,
+      activation_type: options.activationType,
+      use_confidence: options.useConfidence,
+      learning_rate: options.learningRate,
+      max_epochs: options.maxEpochs,
+      patience: options.patience,
+      validation_fraction: options.validationFraction,
+      seed: options.seed,
+      apply: options.apply
+    }
+    for (const [name, value] of Object.entries(fields)) {
+      if (value !== undefined) form.append(name, String(value))
+    }
+    const response = await apiClient.post<JobInfo<CalibrationResult>>(
+      '/calibration',
+      form,
+      // The client defaults to JSON, which would serialize the form.
+      { headers: { 'Content-Type': 'multipart/form-data' } }
+    )
+    return response.data
+  }
+}
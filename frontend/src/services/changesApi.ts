@@ -0,0 +1,15 @@
+import type { MapChangeEvent } from '@/types/cognitive_map_models'
+
+const baseUrl = import.meta.env.BACKEND_BASE_URL || 'http://localhost:8001/api'
+
+export const changesApi = {
+  /**
+   * Open the map change feed. Returns a function that closes it.
+   */
+  subscribe(onEvent: (event: MapChangeEvent) => void): () => void {
+    const socket = new WebSocket(baseUrl.replace(/^http/, 'ws') + '/v1/changes')
+    socket.onmessage = (message) => onEvent(JSON.parse(message.data) as MapChangeEvent)
+    socket.onerror = (error) => console.error('Change feed error:', error)
+    return () => socket.close()
+  }
+}
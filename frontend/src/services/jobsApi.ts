@@ -0,0 +1,47 @@
+import apiClient from './api'
+import type { JobEvent, JobInfo } from '@/types/cognitive_map_models'
+
+const baseUrl = import.meta.env.BACKEND_BASE_URL || 'http://localhost:8001/api'
+
+export const jobsApi = {
+  async getJob<R = unknown>(jobId: string): Promise<JobInfo<R>> {
+    const response = await apiClient.get<JobInfo<R>>(`/jobs/${jobId}`)
+    return response.data
+  },
+
+  async cancelJob(jobId: string): Promise<JobInfo> {
+    const response = await apiClient.delete<JobInfo>(`/jobs/${jobId}`)
+    return response.data
+  },
+
+  /**
+   * Follow a job's NDJSON event stream until it finishes. Resolves with the
+   * final job info.
+   */
+  async follow<D = unknown, R = unknown>(
+    jobId: string,
+    onEvent: (event: JobEvent<D, R>) => void
+  ): Promise<JobInfo<R>> {
+    const response = await fetch(`${baseUrl}/v1/jobs/${jobId}/events`)
+    if (!response.ok || !response.body) {
+      throw new Error(`Cannot follow job ${jobId}: ${response.status}`)
+    }
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+    let buffered = ''
+    let last: JobInfo<R> | null = null
+    for (;;) {
+      const { value, done } = await reader.read()
+      if (done) break
+      buffered += value
+      const lines = buffered.split('\n')
+      buffered = lines.pop() ?? ''
+      for (const line of lines) {
+        if (!line) continue
+        const event = JSON.parse(line) as JobEvent<D, R>
+        if (event.type === 'status') last = event
+        onEvent(event)
+      }
+    }
+    return last ?? this.getJob<R>(jobId)
+  }
+}
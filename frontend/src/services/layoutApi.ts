@@ -0,0 +1,14 @@
+import apiClient from './api'
+import type { JobInfo, LayoutRequest, LayoutResult } from '@/types/cognitive_map_models'
+
+export const layoutApi = {
+  /**
+   * Start a server-side layout of the current map. Follow the returned job
+   * with jobsApi.follow; with stream_every its progress events carry
+   * intermediate positions.
+   */
+  async startLayout(request: LayoutRequest = {}): Promise<JobInfo<LayoutResult>> {
+    const response = await apiClient.post<JobInfo<LayoutResult>>('/layout', request)
+    return response.data
+  }
+}
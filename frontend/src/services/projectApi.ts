@@ -1,5 +1,10 @@
 import apiClient from './api'
-import type { CognitiveMap, HistoryInfo } from '@/types/cognitive_map_models'
+import type {
+  CognitiveMap,
+  HistoryInfo,
+  Viewport,
+  ViewportBox,
+} from '@/types/cognitive_map_models'
 
 export const projectApi = {
   async getMap(): Promise<CognitiveMap> {
@@ -12,6 +17,16 @@ export const projectApi = {
     return response.data
   },
 
+  async getViewport(
+    box: ViewportBox,
+    options: { limit?: number; clusterSize?: number } = {}
+  ): Promise<Viewport> {
+    const response = await apiClient.get<Viewport>('/project/viewport', {
+      params: { ...box, limit: options.limit, cluster_size: options.clusterSize },
+    })
+    return response.data
+  },
+
   async undo(): Promise<CognitiveMap> {
     const response = await apiClient.post<CognitiveMap>('/project/undo')
     return response.data
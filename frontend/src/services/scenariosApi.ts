@@ -1,5 +1,14 @@
 import apiClient from './api'
-import type { Scenario, ScenarioParams, ScenarioResult } from '@/types/cognitive_map_models'
+import type {
+  ConvergencePrediction,
+  InterventionSearchRequest,
+  InterventionSearchResult,
+  JobInfo,
+  Scenario,
+  ScenarioParams,
+  ScenarioResult,
+  SensitivityResponse
+} from '@/types/cognitive_map_models'
 
 export const scenariosApi = {
   async getScenarios(): Promise<Scenario[]> {
@@ -26,8 +35,89 @@ export const scenariosApi = {
     await apiClient.delete(`/scenarios/${scenarioId}`)
   },
 
-  async runScenario(scenarioId: string): Promise<ScenarioResult> {
-    const response = await apiClient.post(`/scenarios/${scenarioId}/run`)
+  /**
+   * Predict whether the scenario converges in auto mode and about how many
+   * iterations it needs, without running it.
+   */
+  async predictConvergence(scenarioId: string): Promise<ConvergencePrediction> {
+    const response = await apiClient.get(`/scenarios/${scenarioId}/convergence`)
+    return response.data
+  },
+
+  /**
+   * Derivatives of the scenario's final states with respect to the edge
+   * weights: the k most influential edges per node. Like runScenario, the
+   * run stops at timeBudget (truncated set) or when `signal` aborts it.
+   */
+  async getSensitivity(
+    scenarioId: string,
+    options: {
+      nodeIds?: string[]
+      k?: number
+      includeMatrix?: boolean
+      timeBudget?: number
+      signal?: AbortSignal
+    } = {}
+  ): Promise<SensitivityResponse> {
+    const response = await apiClient.get(`/scenarios/${scenarioId}/sensitivity`, {
+      params: {
+        node_ids: options.nodeIds,
+        k: options.k,
+        include_matrix: options.includeMatrix,
+        time_budget: options.timeBudget
+      },
+      paramsSerializer: { indexes: null },
+      signal: options.signal
+    })
+    return response.data
+  },
+
+  /**
+   * Run a scenario. Past timeBudget seconds (or the server default) the
+   * result holds the last state with truncated set. Aborting the request
+   * through `signal` stops the run on the server. With autoCap, auto mode
+   * runs use the predicted iteration count as their cap.
+   */
+  async runScenario(
+    scenarioId: string,
+    options: { timeBudget?: number; autoCap?: boolean; signal?: AbortSignal } = {}
+  ): Promise<ScenarioResult> {
+    const response = await apiClient.post(`/scenarios/${scenarioId}/run`, null, {
+      params: { time_budget: options.timeBudget, auto_cap: options.autoCap },
+      signal: options.signal
+    })
+    return response.data
+  },
+
+  /**
+   * Run a scenario in a background job; follow it with jobsApi.follow for
+   * progress in iterations, or cancel it with jobsApi.cancelJob.
+   */
+  async startScenarioRun(
+    scenarioId: string,
+    options: { timeBudget?: number; autoCap?: boolean } = {}
+  ): Promise<JobInfo<ScenarioResult>> {
+    const response = await apiClient.post<JobInfo<ScenarioResult>>(
+      `/scenarios/${scenarioId}/run-job`,
+      null,
+      { params: { time_budget: options.timeBudget, auto_cap: options.autoCap } }
+    )
+    return response.data
+  },
+
+  /**
+   * Search initial states of the control nodes that push the goal nodes in
+   * their preferred directions, starting from this scenario, in a background
+   * job. Each ranked intervention's params can be saved with createScenario.
+   */
+  async startInterventionSearch(
+    scenarioId: string,
+    request: InterventionSearchRequest
+  ): Promise<JobInfo<InterventionSearchResult>> {
+    const response = await apiClient.post<JobInfo<InterventionSearchResult>>(
+      `/scenarios/${scenarioId}/interventions`,
+      request
+    )
     return response.data
   },
 }
@@ -44,10 +44,92 @@ export interface ScenarioResult {
   final_states: Record<string, number>
   iterations_count: number
   converged: boolean
+  // Set when the run hit its time budget before converging.
+  truncated?: boolean | null
   timestamp: string
   history?: Array<Record<string, number>>
 }
 
+export interface ConvergencePrediction {
+  activation_type: ScenarioActivationType
+  spectral_norm: number
+  // Largest over the feedback clusters; 0 for an acyclic map
+  cluster_spectral_norm: number
+  max_slope: number
+  contraction_factor: number
+  contracting: boolean
+  depth: number
+  // Most feedback clusters along one path
+  chained_clusters: number
+  predicted_iterations?: number | null
+  suggested_max_iterations: number
+  warning?: string | null
+}
+
+export interface EdgeSensitivity {
+  source: string
+  target: string
+  weight: number
+  // d(final state of the node) / d(weight)
+  sensitivity: number
+}
+
+export interface NodeSensitivity {
+  node_id: string
+  final_state: number
+  // Largest |sensitivity| first
+  edges: EdgeSensitivity[]
+}
+
+export interface SensitivityResponse {
+  iterations_count: number
+  converged: boolean
+  edge_count: number
+  nodes: NodeSensitivity[]
+  // Stopped at the time budget: derivatives of the last state computed
+  truncated?: boolean | null
+  // With includeMatrix: rows follow nodes, columns edge_order
+  edge_order?: Array<[string, string]> | null
+  matrix?: number[][] | null
+}
+
+export interface InterventionSearchRequest {
+  control_node_ids: string[]
+  // All nodes with a preferred_state if omitted
+  goal_node_ids?: string[] | null
+  // Maximum total absolute change of the control nodes
+  budget?: number | null
+  population?: number
+  restarts?: number
+  generations?: number
+  top?: number
+  seed?: number
+}
+
+export interface Intervention {
+  rank: number
+  score: number
+  // Score minus that of the base scenario
+  improvement: number
+  controls: Record<string, number>
+  goal_states: Record<string, number>
+  iterations_count: number
+  converged: boolean
+  // Ready to save with scenariosApi.createScenario
+  params: ScenarioParams
+}
+
+export interface InterventionSearchResult {
+  // Goal node id -> preferred direction (1 increase, -1 decrease)
+  goals: Record<string, number>
+  control_node_ids: string[]
+  baseline_score: number
+  baseline_goal_states: Record<string, number>
+  generations: number
+  evaluations: number
+  interventions: Intervention[]
+}
+
 export interface Scenario {
   id: string
   params: ScenarioParams
@@ -96,4 +178,188 @@ export interface MetricsStatistics {
 export interface MetricsResponse {
   metrics: NodeMetrics[]
   statistics: MetricsStatistics
-}
\ No newline at end of file
+}
+export interface ChangeSet<T, K> {
+  upserted: T[]
+  removed: K[]
+}
+
+export type MapChangeEvent =
+  | { type: 'hello'; version: number; hash: string }
+  | {
+      type: 'resync'
+      version: number
+      reason: string
+      hash: string
+      previous_hash?: string
+    }
+  | {
+      type: 'delta'
+      version: number
+      reason: string
+      hash: string
+      previous_hash: string
+      nodes: ChangeSet<Node, string>
+      edges: ChangeSet<Edge, { source: string; target: string }>
+      scenarios: ChangeSet<Scenario, string>
+      fcm: Omit<FCM, 'scenarios'> | null
+    }
+
+export interface ViewportBox {
+  min_x: number
+  min_y: number
+  max_x: number
+  max_y: number
+}
+
+export interface NodeCluster extends ViewportBox {
+  x: number
+  y: number
+  count: number
+}
+
+export interface Viewport {
+  map_hash: string
+  nodes: Node[]
+  edges: Edge[]
+  external_nodes: { id: string; x: number; y: number }[]
+  total_nodes: number
+  truncated: boolean
+  clusters?: NodeCluster[] | null
+  cluster_edges?:
+    | { source: number; target: number; count: number; mean_weight: number }[]
+    | null
+}
+
+export type JobStatus = 'running' | 'done' | 'failed' | 'cancelled'
+
+export interface JobInfo<R = unknown> {
+  id: string
+  kind: string
+  status: JobStatus
+  progress: number
+  message?: string | null
+  created: string
+  finished?: string | null
+  error?: string | null
+  result?: R | null
+}
+
+export type JobEvent<D = unknown, R = unknown> =
+  | ({ type: 'status' } & JobInfo<R>)
+  | { type: 'progress'; progress: number; message?: string; data?: D }
+
+export type LayoutAlgorithm = 'force' | 'hierarchical'
+
+export interface LayoutRequest {
+  algorithm?: LayoutAlgorithm
+  iterations?: number
+  spacing?: number
+  seed?: number
+  stream_every?: number | null
+}
+
+export interface LayoutResult {
+  algorithm: LayoutAlgorithm
+  nodes: number
+  steps: number
+  map_hash: string
+}
+
+export interface LayoutProgress {
+  step: number
+  positions: Record<string, [number, number]>
+}
+
+export type AggregationMethod = 'mean' | 'median' | 'credibility'
+
+export interface AggregationRequest {
+  // Absolute, or relative to the projects directory
+  inputs: Array<{ path: string; weight?: number }>
+  output_path: string
+  method?: AggregationMethod
+  align_by?: 'id' | 'label'
+  missing?: 'zero' | 'skip'
+  min_experts?: number
+  top?: number
+  overwrite?: boolean
+}
+
+export interface ExpertSummary {
+  path: string
+  nodes: number
+  edges: number
+  weight: number
+  credibility: number
+}
+
+export interface EdgeDisagreement {
+  source: string
+  target: string
+  weight: number
+  support: number
+  std: number
+  min: number
+  max: number
+  sign_agreement: number
+}
+
+export interface AggregationResult {
+  path: string
+  method: AggregationMethod
+  align_by: 'id' | 'label'
+  nodes: number
+  edges: number
+  experts: ExpertSummary[]
+  disagreements: EdgeDisagreement[]
+}
+
+export interface CalibrationOptions {
+  // CSV column -> node id; columns match node ids or labels without it
+  mapping?: Record<string, string>
+  sequenceColumn?: string
+  activationType?: ScenarioActivationType
+  useConfidence?: boolean
+  learningRate?: number
+  maxEpochs?: number
+  patience?: number
+  validationFraction?: number
+  seed?: number
+  // Write the fitted weights to the map (default true)
+  apply?: boolean
+}
+
+export interface CalibrationProgress {
+  epoch: number
+  loss: number
+  validation_loss?: number | null
+}
+
+export interface EdgeFit {
+  source: string
+  target: string
+  old_weight: number
+  new_weight: number
+  // Transitions in which the target and all its sources were observed
+  samples: number
+  rmse_before?: number | null
+  rmse_after?: number | null
+}
+
+export interface CalibrationResult {
+  sequences: number
+  transitions: number
+  validation_transitions: number
+  observed_node_ids: string[]
+  ignored_columns: string[]
+  epochs: number
+  stopped_early: boolean
+  loss_before: number
+  loss_after: number
+  validation_loss_before?: number | null
+  validation_loss_after?: number | null
+  fitted_edges: number
+  edges: EdgeFit[]
+  applied: boolean
+  map_hash?: string | null
+}